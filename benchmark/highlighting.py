@@ -0,0 +1,250 @@
+# Highlighting benchmark: time to highlight a document of each language from
+# scratch, the throughput of highlighting single lines (as the large file viewer
+# does) and the number of setFormat() calls, each crossing into Qt, per line. The
+# rules of each language are also applied in overlapping passes, the way a
+# highlighter without a lexer does, with setFormat() for every match and with
+# addSpan() resolving them at the end of the line. Last, the lines are highlighted
+# with each regex backend of the lexer, and with the one it picks by itself.
+#
+#   python benchmark/highlighting.py [--lines 5000] [--runs 3]
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# language -> (highlighter, a sample repeated to make the document)
+SAMPLES: Dict[str, tuple] = {
+    "python": (
+        "QPythonHighlighter",
+        '''import os
+class Parser(object):
+    """Parses the lines of a file, # not a comment"""
+    def parse(self, path: str, limit: int = 0x10) -> dict:
+        result = dict()  # the counts per word
+        for index, line in enumerate(open(path).read().split("\\n")):
+            if len(line) > 80 or line.startswith('#'):
+                continue
+            words = [w.strip() for w in line.split(" ") if w]
+            result[index] = max(len(words), limit) * 2.5
+        return None if not result else result
+''',
+    ),
+    "cxx": (
+        "QCXXHighlighter",
+        """#include <stdio.h>
+/* A counter, "not a string" */
+static unsigned long counter = 0x1fUL;
+int compute(const char *name, double ratio) {
+    // returns the rounded ratio, "quoted" in a comment
+    std::vector<int> values(16, 0);
+    for (int i = 0; i < 16; ++i) {
+        values[i] = static_cast<int>(ratio * 1.5e3) + i;
+    }
+    printf("%s: %d\\n", name, values.back());
+    return values.size() > 0 ? values[0] : -1;
+}
+""",
+    ),
+    "glsl": (
+        "QGLSLHighlighter",
+        """#version 330 core
+/* vertex shader */
+uniform mat4 projection;
+in vec3 position;
+out vec4 color;
+void main() {
+    // transformed position
+    vec4 world = projection * vec4(position, 1.0);
+    color = vec4(normalize(world.xyz), clamp(world.w, 0.0, 1.0));
+    gl_Position = world;
+}
+""",
+    ),
+    "lua": (
+        "QLuaHighlighter",
+        """local json = require("json")
+--[[ a long comment
+     over two lines --]]
+local function count(items, limit)
+    local total = 0 -- the running total
+    for i, item in ipairs(items) do
+        if item.size ~= nil and item.size > limit then
+            total = total + item.size * 2
+        end
+    end
+    return total, "done [[not long]]"
+end
+""",
+    ),
+    "json": (
+        "QJSONHighlighter",
+        """{
+    "name": "editor",
+    "version": 12,
+    "ratio": 0.75,
+    "enabled": true,
+    "parent": null,
+    "tags": ["text", "code", "true"],
+    "nested": {"depth": 3, "items": [1, 2, 3, 4.5, false]},
+    "description": "a string with: a colon and null inside"
+},
+""",
+    ),
+}
+
+
+def make_text(sample: str, lines: int) -> str:
+    sampleLines = sample.splitlines()
+    return "\n".join(sampleLines[i % len(sampleLines)] for i in range(lines))
+
+
+def measure_document(highlighter, text: str, runs: int) -> float:
+    # seconds to highlight text in a document, setFormat() going into Qt
+    from qtpy.QtGui import QTextDocument
+
+    times = []
+    for _ in range(max(1, runs)):
+        document = QTextDocument()
+        document.setPlainText(text)
+        start = time.perf_counter()
+        highlighter.setDocument(document)
+        highlighter.rehighlight()
+        times.append(time.perf_counter() - start)
+        highlighter.setDocument(None)
+    return statistics.median(times)
+
+
+def measure_lines(highlighter, lines: List[str], runs: int) -> Tuple[float, float]:
+    # (seconds, setFormat() calls) per line highlighted with formatRanges()
+    times = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        for line in lines:
+            highlighter.formatRanges(line)
+        times.append((time.perf_counter() - start) / len(lines))
+    # counted apart, the counting wrapper would weigh on the timings
+    calls = [0]
+    setFormat = highlighter.setFormat
+
+    def countingSetFormat(*args):
+        calls[0] += 1
+        setFormat(*args)
+
+    highlighter.setFormat = countingSetFormat
+    try:
+        for line in lines:
+            highlighter.formatRanges(line)
+    finally:
+        del highlighter.setFormat
+    return statistics.median(times), calls[0] / len(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, ROOT)
+    from qtpy.QtWidgets import QApplication
+
+    from pyqcodeeditor import highlighters
+    from pyqcodeeditor.highlighters.QHighlightRule import QHighlightRule
+    from pyqcodeeditor.QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+    from pyqcodeeditor.QSyntaxStyle import QSyntaxStyle
+    from pyqcodeeditor.regex_backend import BACKEND_AUTO, BACKEND_PYTHON, BACKEND_QT
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+
+    # noinspection PyPep8Naming
+    class QPassesHighlighter(QStyleSyntaxHighlighter):
+        # the rules of a lexer highlighter applied one after the other, the last
+        # one winning where they overlap
+        def __init__(self, lexerHighlighter, spans: bool):
+            super().__init__()
+            self.rules = [
+                rule
+                for rule in reversed(lexerHighlighter.m_highlightRules)
+                if isinstance(rule, QHighlightRule)
+            ]
+            self.spans = spans
+
+        def highlightText(self, text: str):
+            style = self.syntaxStyle()
+            for rule in self.rules:
+                for match in self.matches(rule.pattern, text):
+                    formats = [(0, rule.formatName), *rule.groupFormats.items()]
+                    for group, formatName in formats:
+                        start = match.capturedStart(group)
+                        length = match.capturedLength(group)
+                        if not formatName or start < 0:
+                            continue
+                        if self.spans:
+                            self.addSpan(start, length, formatName)
+                        else:
+                            self.setFormat(start, length, style.getFormat(formatName))
+
+    style = QSyntaxStyle.defaultStyle()
+    print(
+        f"{'language':<10}{'document ms':>12}{'lines/s':>12}{'line us':>10}"
+        f"{'setFormat/line':>16}"
+    )
+    passes = []
+    backends = []
+    for language, (name, sample) in SAMPLES.items():
+        text = make_text(sample, args.lines)
+        lines = text.splitlines()
+        highlighter = getattr(highlighters, name)()
+        highlighter.setSyntaxStyle(style)
+        document = measure_document(highlighter, text, args.runs)
+        line, calls = measure_lines(highlighter, lines, args.runs)
+        print(
+            f"{language:<10}{document * 1000:>12.1f}{args.lines / document:>12.0f}"
+            f"{line * 1e6:>10.1f}{calls:>16.2f}"
+        )
+        results = []
+        for spans in (False, True):
+            passesHighlighter = QPassesHighlighter(highlighter, spans)
+            passesHighlighter.setSyntaxStyle(style)
+            results.append(
+                (
+                    measure_document(passesHighlighter, text, args.runs),
+                    measure_lines(passesHighlighter, lines, 1)[1],
+                )
+            )
+        passes.append((language, results))
+        times = []
+        for backend in (BACKEND_QT, BACKEND_PYTHON, BACKEND_AUTO):
+            highlighter.setRegexBackend(backend)
+            times.append(measure_lines(highlighter, lines, args.runs)[0])
+        # rules re cannot read are matched through Qt with either backend
+        backends.append((language, times, highlighter.lexer().backend()))
+
+    print()
+    print(f"{'passes':<10}{'setFormat/line':>16}{'document ms':>12}", end="")
+    print(f"{'addSpan: setFormat/line':>26}{'document ms':>12}")
+    for language, ((directTime, directCalls), (spansTime, spansCalls)) in passes:
+        print(
+            f"{language:<10}{directCalls:>16.2f}{directTime * 1000:>12.1f}"
+            f"{spansCalls:>26.2f}{spansTime * 1000:>12.1f}"
+        )
+
+    print()
+    print(f"{'line us':<10}{'qt':>10}{'python':>10}{'auto':>10}{'  picked'}")
+    for language, (qt, python, auto), picked in backends:
+        print(
+            f"{language:<10}{qt * 1e6:>10.1f}{python * 1e6:>10.1f}"
+            f"{auto * 1e6:>10.1f}  {picked}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
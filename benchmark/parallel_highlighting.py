@@ -0,0 +1,90 @@
+# Parallel initial highlighting benchmark: time until a large document of a language,
+# set with its highlighter suspended as QCodeEditor.setPlainText() does, has been
+# highlighted by the deferred steps, serially and tokenized in parallel for some
+# numbers of processes, the pool being started for each run. The tokenizing by the
+# pool is also timed on its own.
+#
+#   python benchmark/parallel_highlighting.py [--lines 500000] [--language cxx]
+#                                             [--processes 2 4 8]
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import List
+
+from highlighting import ROOT, SAMPLES, make_text
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=500000)
+    parser.add_argument("--language", choices=sorted(SAMPLES), default="cxx")
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1]
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, ROOT)
+    from concurrent.futures import ProcessPoolExecutor
+
+    from qtpy.QtCore import QEventLoop
+    from qtpy.QtGui import QTextDocument
+    from qtpy.QtWidgets import QApplication
+
+    from pyqcodeeditor import highlighters, parallel_highlighting
+    from pyqcodeeditor.QStyleSyntaxHighlighter import LONG_LINE_LENGTH
+    from pyqcodeeditor.QSyntaxStyle import QSyntaxStyle
+
+    app = QApplication.instance() or QApplication([])
+
+    name, sample = SAMPLES[args.language]
+    text = make_text(sample, args.lines)
+    lines = text.split("\n")
+    style = QSyntaxStyle.defaultStyle()
+
+    def highlight(processes: int) -> float:
+        document = QTextDocument()
+        highlighter = getattr(highlighters, name)()
+        highlighter.setSyntaxStyle(style)
+        highlighter.setDocument(document)
+        app.processEvents()
+        executor = None
+        if processes:
+            executor = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        highlighter.setParallelHighlighting(executor is not None, executor)
+        start = time.perf_counter()
+        with highlighter.suspended(lazy=True):
+            document.setPlainText(text)
+        while highlighter.hasPendingHighlight():
+            app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+        total = time.perf_counter() - start
+        if executor is not None:
+            executor.shutdown()
+        return total
+
+    serial = highlight(0)
+    print(f"{args.language}, {args.lines} lines, {os.cpu_count()} cores")
+    print(f"{'processes':<10}{'tokenize s':>12}{'total s':>10}{'speedup':>10}")
+    print(f"{'serial':<10}{'':>12}{serial:>10.2f}{1:>10.2f}")
+    lexer = getattr(highlighters, name)().lexer()
+    for processes in sorted(set(args.processes)):
+        if processes < 2:
+            continue
+        start = time.perf_counter()
+        parallel_highlighting.tokenize_lines(
+            lexer, lines, LONG_LINE_LENGTH, processes=processes
+        )
+        tokenize = time.perf_counter() - start
+        total = highlight(processes)
+        print(f"{processes:<10}{tokenize:>12.2f}{total:>10.2f}{serial / total:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# Startup benchmark: import time of the package and construction time of the first
+# editor, each measured in a fresh interpreter.
+#
+#   python benchmark/startup.py [--runs 5] [--budget]
+#
+# With --budget the exit code is 1 when a median exceeds its budget.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (code measured, budget in milliseconds), Qt is imported before timing
+CASES: Dict[str, tuple] = {
+    "import highlighters": ("import pyqcodeeditor.highlighters", 20.0),
+    "import json highlighter": (
+        "from pyqcodeeditor.highlighters import QJSONHighlighter",
+        30.0,
+    ),
+    "import completers": ("import pyqcodeeditor.completers", 20.0),
+    "import editor": ("import pyqcodeeditor.QCodeEditor", 150.0),
+    "first editor": ("QCodeEditor()", 150.0),
+    "second editor": ("QCodeEditor()", 50.0),
+    "first json editor": (
+        "QCodeEditor().setHighlighter(QJSONHighlighter())",
+        200.0,
+    ),
+}
+
+_SCRIPT = """
+import json, sys, time
+import qtpy.QtCore, qtpy.QtGui, qtpy.QtWidgets
+from qtpy.QtWidgets import QApplication
+app = QApplication([])
+name = {name!r}
+if name in ("first editor", "second editor", "first json editor"):
+    from pyqcodeeditor.QCodeEditor import QCodeEditor
+    from pyqcodeeditor.highlighters import QJSONHighlighter
+    if name == "second editor":
+        QCodeEditor()
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+modules = sorted(m for m in sys.modules if m.startswith("pyqcodeeditor."))
+print(json.dumps({{"ms": elapsed * 1000.0, "modules": modules}}))
+"""
+
+
+def run_case(name: str, code: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    output = subprocess.run(
+        [sys.executable, "-c", _SCRIPT.format(name=name, code=code)],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", action="store_true", help="fail over budget")
+    args = parser.parse_args(argv)
+
+    overBudget = False
+    print(f"{'case':<26}{'median ms':>10}{'budget ms':>10}")
+    for name, (code, budget) in CASES.items():
+        results = [run_case(name, code) for _ in range(max(1, args.runs))]
+        median = statistics.median(result["ms"] for result in results)
+        mark = ""
+        if median > budget:
+            overBudget = True
+            mark = "  over budget"
+        print(f"{name:<26}{median:>10.1f}{budget:>10.1f}{mark}")
+        if name == "import json highlighter":
+            # an application using one language must not load the others
+            loaded = [m for m in results[-1]["modules"] if "Highlighter" in m]
+            print(f"{'':<26}loaded: {', '.join(m.rsplit('.', 1)[-1] for m in loaded)}")
+    return 1 if args.budget and overBudget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
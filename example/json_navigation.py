@@ -0,0 +1,49 @@
+import json
+
+from qtpy.QtGui import QKeySequence, QShortcut
+from qtpy.QtWidgets import QApplication, QInputDialog
+from pyqcodeeditor.QCodeEditor import QCodeEditor
+from pyqcodeeditor.QJSONIndex import QJSONIndex, formatPath
+from pyqcodeeditor.highlighters import QJSONHighlighter
+
+app = QApplication([])
+editor = QCodeEditor()
+editor.setHighlighter(QJSONHighlighter())
+editor.resize(800, 600)
+data = [
+    {"id": i, "tags": ["a", "b"], "position": {"x": i, "y": -i}} for i in range(20000)
+]
+editor.setPlainText(json.dumps({"rows": data}, indent=2))
+index = QJSONIndex(editor)
+
+
+def showBreadcrumb():
+    position = editor.textCursor().position()
+    editor.setWindowTitle(formatPath(index.path(position)))
+
+
+def goToPath():
+    path, accepted = QInputDialog.getText(editor, "Go to JSON path", "Path:")
+    position = index.findPath(path) if accepted else None
+    if position is not None:
+        cursor = editor.textCursor()
+        cursor.setPosition(position)
+        editor.setTextCursor(cursor)
+
+
+def jumpToBracket():
+    position = editor.textCursor().position()
+    match = index.matchingBracket(position)
+    if match is None and position > 0:
+        match = index.matchingBracket(position - 1)
+    if match is not None:
+        cursor = editor.textCursor()
+        cursor.setPosition(match)
+        editor.setTextCursor(cursor)
+
+
+editor.cursorPositionChanged.connect(showBreadcrumb)
+QShortcut(QKeySequence("Ctrl+G"), editor).activated.connect(goToPath)
+QShortcut(QKeySequence("Ctrl+B"), editor).activated.connect(jumpToBracket)
+editor.show()
+app.exec_()
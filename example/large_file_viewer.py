@@ -0,0 +1,24 @@
+import sys
+
+from qtpy.QtWidgets import QApplication, QFileDialog
+from pyqcodeeditor.QLargeFileViewer import QLargeFileViewer
+from pyqcodeeditor.highlighters import QJSONHighlighter
+
+app = QApplication([])
+viewer = QLargeFileViewer()
+# the highlighter is only used for its rules, it is not attached to a document
+viewer.setHighlighter(QJSONHighlighter())
+viewer.resize(800, 600)
+path = sys.argv[1] if len(sys.argv) > 1 else QFileDialog.getOpenFileName()[0]
+if path:
+    viewer.openFile(path)
+viewer.indexProgress.connect(
+    lambda indexed, size: viewer.setWindowTitle(
+        f"{path} {indexed * 100 // max(1, size)}%"
+    )
+)
+viewer.indexFinished.connect(
+    lambda lines: viewer.setWindowTitle(f"{path} ({lines} lines)")
+)
+viewer.show()
+app.exec_()
@@ -0,0 +1,16 @@
+from qtpy.QtWidgets import QApplication
+from pyqcodeeditor.QCodeEditor import QCodeEditor
+from pyqcodeeditor.QDiagnostics import QDiagnostics
+from pyqcodeeditor.checkers import get_checker
+from pyqcodeeditor.highlighters import QPythonHighlighter
+
+# the checks run in worker processes, which import this module on some platforms
+if __name__ == "__main__":
+    app = QApplication([])
+    editor = QCodeEditor()
+    editor.setHighlighter(QPythonHighlighter())
+    diagnostics = QDiagnostics(editor, get_checker("python"))
+    editor.resize(800, 600)
+    editor.setPlainText("def main()\n    print('hello world!')\n")
+    editor.show()
+    app.exec_()
@@ -0,0 +1,36 @@
+import sys
+
+from qtpy.QtWidgets import QApplication, QFileDialog, QTabWidget, QVBoxLayout, QWidget
+from pyqcodeeditor.QEditorSession import QEditorSession
+from pyqcodeeditor.highlighters import QPythonHighlighter
+
+app = QApplication([])
+session = QEditorSession(maxEditors=4)
+tabs = QTabWidget()
+paths = sys.argv[1:] or QFileDialog.getOpenFileNames()[0]
+handles = []
+for path in paths:
+    # a tab is an empty container until shown, the file is not read yet
+    handle = session.addDocument(path, highlighter=QPythonHighlighter)
+    container = QWidget()
+    QVBoxLayout(container).setContentsMargins(0, 0, 0, 0)
+    tabs.addTab(container, handle.title())
+    handles.append(handle)
+
+
+def showTab(index: int):
+    if index < 0:
+        return
+    editor = session.editorFor(handles[index])
+    container = tabs.widget(index)
+    # the editor may come from another tab, adding it moves it here
+    container.layout().addWidget(editor)
+    editor.show()
+
+
+tabs.currentChanged.connect(showTab)
+session.prewarm(4)
+showTab(tabs.currentIndex())
+tabs.resize(800, 600)
+tabs.show()
+app.exec_()
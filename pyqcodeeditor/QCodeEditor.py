@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-from typing import List, Union
+import os
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple, Union
 
 # noinspection PyUnresolvedReferences
-from qtpy.QtCore import QRect, QMimeData, Qt
+from qtpy.QtCore import QRect, QMimeData, Qt, QPoint, Signal
 from qtpy.QtGui import (
     QTextCursor,
     QKeyEvent,
@@ -13,15 +16,30 @@ from qtpy.QtGui import (
     QTextDocument,
     QResizeEvent,
     QBrush,
+    QTextCharFormat,
+    QTextBlock,
+    QKeySequence,
+    QContextMenuEvent,
 )
-from qtpy.QtWidgets import QCompleter, QTextEdit, QWidget, QAbstractItemView
+from qtpy.QtWidgets import QCompleter, QTextEdit, QWidget, QAbstractItemView, QMenu
 
+from . import files
+from . import parallel_highlighting
+from . import instrumentation
 from . import utils
 
+from .QCodeFolding import QFoldRegions
+from .QDiffMarkers import QDiffMarkers
+from .QDocumentChangeLog import QDocumentChangeLog
+from .QIntervalTree import QIntervalTree
+
 # from .QFramedTextAttribute import QFramedTextAttribute
 from .QLineNumberArea import QLineNumberArea
-from .QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+from .QStyleRegistry import EDITOR_FORMATS, QStyleRegistry
+from .QStyleSyntaxHighlighter import LONG_LINE_LENGTH, QStyleSyntaxHighlighter
 from .QSyntaxStyle import QSyntaxStyle
+from .QTextSnapshot import QTextSnapshot
+from .QUndoHistory import QUndoHistory
 
 PARENTHESES = [
     ("(", ")"),
@@ -33,10 +51,55 @@ PARENTHESES = [
 
 DEFAULT_FONT_POINT_SIZE: Union[int, None] = None
 DEFAULT_TAB_WIDTH: int = 4
+# Pasted texts longer than this (in characters), or of PARALLEL_MIN_LINES lines, take
+# the large paste path, loaded and set texts as large are highlighted by the deferred
+# steps
+LARGE_PASTE_THRESHOLD: int = 1024 * 1024
+# Maximum number of characters walked when looking for the matching parenthesis
+PARENTHESES_SEARCH_LIMIT: int = 20000
+# Extra height (in viewport heights) above and below the viewport whose decorations
+# are turned into extra selections, small scrolls then reuse them
+DECORATION_VIEWPORT_MARGIN: float = 1.0
+
+CURRENT_LINE_LAYER: str = "currentLine"
+PARENTHESES_LAYER: str = "parentheses"
+
+# (start, end, format)
+Decoration = Tuple[int, int, QTextCharFormat]
+
+_fileExecutor: ThreadPoolExecutor | None = None
+
+
+def _saveExecutor() -> ThreadPoolExecutor:
+    # a single thread, the saves are written in the order they were requested
+    global _fileExecutor
+    if _fileExecutor is None:
+        _fileExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="QCodeEditorSave"
+        )
+    return _fileExecutor
+
+
+def _isLargeText(text: str) -> bool:
+    # highlighted by the deferred steps, in parallel by a QLexerHighlighter with
+    # parallel highlighting enabled
+    return (
+        len(text) >= LARGE_PASTE_THRESHOLD
+        or text.count("\n") + 1 >= parallel_highlighting.PARALLEL_MIN_LINES
+    )
 
 
 # noinspection PyPep8Naming
 class QCodeEditor(QTextEdit):
+    highlighterChanged = Signal(object)
+    # characters written, total characters
+    saveProgress = Signal(int, int)
+    # path, whether the file has been written (False when it was unchanged)
+    saveFinished = Signal(str, bool)
+    # path, error message
+    saveFailed = Signal(str, str)
+    # path, revision, save state or exception; emitted from the save thread
+    _saved = Signal(str, int, object)
 
     def __init__(self, parent: QWidget | None = None):
         super().__init__(parent)
@@ -51,6 +114,28 @@ class QCodeEditor(QTextEdit):
         self._replaceTab: bool = True
         self._tabReplace: str = " " * DEFAULT_TAB_WIDTH
         self._defaultIndent: int = self.tabReplaceSize()
+        self._largeInsertion: bool = False
+        self._foldingEnabled: bool = True
+        self._foldRegions: QFoldRegions = QFoldRegions(self.document())
+        self._changeLog: QDocumentChangeLog = QDocumentChangeLog(self.document(), self)
+        # replaces the unbounded undo stack of the document
+        self._undoHistory: QUndoHistory = QUndoHistory(self, self)
+        self._decorationLayers: Dict[str, QIntervalTree] = {}
+        self._decorationZ: Dict[str, int] = {}
+        # layer name -> (first position, end position, extra selections)
+        self._decorationCache: Dict[
+            str, Tuple[int, int, List[QTextEdit.ExtraSelection]]
+        ] = {}
+        self._decorationCacheStale: bool = False
+        self._diffMarkers: QDiffMarkers | None = None
+        # path -> state of the file after the last save
+        self._saveStates: Dict[str, files.SaveState] = {}
+        # format of the last loaded file, used by default when saving
+        self._fileEncoding: str = "utf-8"
+        self._fileNewline: str = "\n"
+        self._fileBom: bool = False
+        self.setDecorationLayer(CURRENT_LINE_LAYER, [], -10)
+        self.setDecorationLayer(PARENTHESES_LAYER, [], 10)
 
         # noinspection PyArgumentList
         _font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
@@ -66,30 +151,24 @@ class QCodeEditor(QTextEdit):
         self._updateLineNumberAreaWidth(0)
 
     def _getFirstVisibleBlock(self) -> int:
-        doc: QTextDocument = self.document()
-        cursor = QTextCursor(doc)
-        cursor.movePosition(QTextCursor.Start)
-
-        doc: QTextDocument = self.document()
-
-        for i in range(0, doc.blockCount()):
-            block = cursor.block()
-            r1: QRect = self.viewport().geometry()
-            _layout = doc.documentLayout()
-            _bRect = _layout.blockBoundingRect(block)
-            _x = self.viewport().geometry().x()
-            _y = (
-                self.viewport().geometry().y()
-                - self.verticalScrollBar().sliderPosition()
-            )
-            _r = _bRect.translate(_x, _y)
-            if _r is None:
-                continue
-            r2 = _r.toRect()
-            if r1.intersects(r2):
-                return i
-            cursor.movePosition(QTextCursor.NextBlock)
-        return 0
+        return self._blockAt(0).blockNumber()
+
+    def _blockAt(self, y: int) -> QTextBlock:
+        # Binary search over the block rectangles, walking the blocks from the start
+        # of the document (as hit testing does) would cost O(document size) on every
+        # gutter repaint
+        doc = self.document()
+        layout = doc.documentLayout()
+        y += self.verticalScrollBar().value()
+        low = 0
+        high = doc.blockCount() - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if layout.blockBoundingRect(doc.findBlockByNumber(middle)).top() <= y:
+                low = middle
+            else:
+                high = middle - 1
+        return doc.findBlockByNumber(low)
 
     def setFontSize(self, fontSize: int):
         assert fontSize > 0
@@ -127,10 +206,18 @@ class QCodeEditor(QTextEdit):
             self._highlighter.setSyntaxStyle(None)
             self._highlighter.setDocument(None)
 
+        self._foldRegions.expandAll()
         self._highlighter = highlighter
         if self._highlighter:
             self._highlighter.setSyntaxStyle(self._syntaxStyle)
             self._highlighter.setDocument(self.document())
+            self._updateHighlighterViewport()
+        self._updateLineNumberAreaWidth(0)
+        # noinspection PyUnresolvedReferences
+        self.highlighterChanged.emit(self._highlighter)
+
+    def highlighter(self) -> QStyleSyntaxHighlighter | None:
+        return self._highlighter
 
     def setSyntaxStyle(self, syntaxStyle: QSyntaxStyle):
         assert syntaxStyle is not None
@@ -141,6 +228,9 @@ class QCodeEditor(QTextEdit):
             self._highlighter.setSyntaxStyle(syntaxStyle)
         self._updateStyle()
 
+    def syntaxStyle(self) -> QSyntaxStyle:
+        return self._syntaxStyle
+
     def setAutoParentheses(self, enable: bool):
         self._autoParentheses = enable
 
@@ -165,6 +255,355 @@ class QCodeEditor(QTextEdit):
     def autoIndentation(self) -> bool:
         return self._autoIndentation
 
+    def setFoldingEnabled(self, enable: bool):
+        self._foldingEnabled = enable
+        if not enable:
+            self._foldRegions.expandAll()
+        self._updateLineNumberAreaWidth(0)
+        self._lineNumberArea.update()
+
+    def foldingEnabled(self) -> bool:
+        return self._foldingEnabled
+
+    def isFoldingAvailable(self) -> bool:
+        return (
+            self._foldingEnabled
+            and self._highlighter is not None
+            and self._highlighter.foldingStrategy() is not None
+        )
+
+    def foldRegions(self) -> QFoldRegions:
+        return self._foldRegions
+
+    def isFoldable(self, blockNumber: int) -> bool:
+        if not self.isFoldingAvailable():
+            return False
+        block = self.document().findBlockByNumber(blockNumber)
+        return block.isValid() and self._highlighter.foldingStrategy().isFoldStart(
+            block
+        )
+
+    def isFolded(self, blockNumber: int) -> bool:
+        return self._foldRegions.isCollapsed(blockNumber)
+
+    def foldBlock(self, blockNumber: int) -> bool:
+        if not self.isFoldingAvailable() or self.isFolded(blockNumber):
+            return False
+        block = self.document().findBlockByNumber(blockNumber)
+        if not block.isValid():
+            return False
+        end = self._highlighter.foldingStrategy().regionEnd(block)
+        if end <= blockNumber:
+            return False
+        self._foldRegions.collapse(blockNumber, end)
+        self._afterFoldingChanged()
+        return True
+
+    def unfoldBlock(self, blockNumber: int):
+        if not self.isFolded(blockNumber):
+            return
+        self._foldRegions.expand(blockNumber)
+        self._afterFoldingChanged()
+
+    def toggleFold(self, blockNumber: int):
+        if self.isFolded(blockNumber):
+            self.unfoldBlock(blockNumber)
+        else:
+            self.foldBlock(blockNumber)
+
+    def unfoldAll(self):
+        self._foldRegions.expandAll()
+        self._afterFoldingChanged()
+
+    def _afterFoldingChanged(self):
+        cursor = self.textCursor()
+        if not cursor.block().isVisible():
+            # move the cursor out of the folded lines
+            hiding = self._foldRegions.regionsHiding(cursor.blockNumber())
+            if hiding:
+                block = self.document().findBlockByNumber(hiding[0])
+                cursor.setPosition(block.position() + block.length() - 1)
+                self.setTextCursor(cursor)
+        self.viewport().update()
+        self._lineNumberArea.update()
+
+    def _revealCursorBlock(self):
+        blockNumber = self.textCursor().blockNumber()
+        hiding = self._foldRegions.regionsHiding(blockNumber)
+        if not hiding:
+            return
+        for start in hiding:
+            self._foldRegions.expand(start)
+        self._afterFoldingChanged()
+
+    def changeLog(self) -> QDocumentChangeLog:
+        return self._changeLog
+
+    def revision(self) -> int:
+        return self._changeLog.revision()
+
+    def snapshot(self) -> QTextSnapshot:
+        # O(1), the snapshot can be read from any thread
+        return self._changeLog.snapshot()
+
+    def undoHistory(self) -> QUndoHistory:
+        return self._undoHistory
+
+    def undo(self):
+        self._undoHistory.undo()
+
+    def redo(self):
+        self._undoHistory.redo()
+
+    def isUndoAvailable(self) -> bool:
+        # the undo stack of the document is disabled, ask the editor
+        return self._undoHistory.canUndo()
+
+    def isRedoAvailable(self) -> bool:
+        return self._undoHistory.canRedo()
+
+    def setPlainText(self, text: str):
+        # like QTextDocument, a new text can't be undone
+        highlighter = self._highlighter if _isLargeText(text) else None
+        if highlighter is not None:
+            highlighter.suspend()
+        try:
+            with self._undoHistory.paused():
+                super().setPlainText(text)
+        finally:
+            if highlighter is not None:
+                highlighter.resume(lazy=True)
+        self._undoHistory.clear()
+
+    def clear(self):
+        with self._undoHistory.paused():
+            super().clear()
+        self._undoHistory.clear()
+
+    def setDiffMarkers(self, markers: QDiffMarkers | None):
+        # called by QDiffMarkers.setEditor()
+        if self._diffMarkers is markers:
+            return
+        if self._diffMarkers is not None:
+            # noinspection PyUnresolvedReferences
+            self._diffMarkers.markersChanged.disconnect(self._onDiffMarkersChanged)
+        self._diffMarkers = markers
+        if markers is not None:
+            # noinspection PyUnresolvedReferences
+            markers.markersChanged.connect(self._onDiffMarkersChanged)
+        self._updateLineNumberAreaWidth(0)
+        self._lineNumberArea.update()
+
+    def diffMarkers(self) -> QDiffMarkers | None:
+        return self._diffMarkers
+
+    def loadFromFile(self, path: str, encoding: str | None = None) -> bool:
+        # The encoding is detected unless given, the line endings are normalized. Both
+        # are kept and used by saveToFile(), the file then round-trips unchanged.
+        path = os.path.abspath(path)
+        try:
+            loaded = files.load_file(path, encoding)
+        except (OSError, LookupError) as e:
+            warnings.warn(f"Can't load {path}: {e}")
+            return False
+        if loaded.lossy:
+            warnings.warn(
+                f"{path} is not valid {loaded.encoding}, invalid bytes are replaced"
+            )
+        self._fileEncoding = loaded.encoding
+        self._fileNewline = loaded.newline
+        self._fileBom = loaded.bom
+        self.setPlainText(loaded.text)
+        self.document().setModified(False)
+        self._saveStates[path] = loaded.state
+        return True
+
+    def fileEncoding(self) -> str:
+        return self._fileEncoding
+
+    def setFileEncoding(self, encoding: str, bom: bool = False):
+        self._fileEncoding = encoding
+        self._fileBom = bom
+
+    def fileNewline(self) -> str:
+        return self._fileNewline
+
+    def setFileNewline(self, newline: str):
+        self._fileNewline = newline
+
+    def hasFileBom(self) -> bool:
+        return self._fileBom
+
+    def saveToFile(
+        self,
+        path: str,
+        encoding: str | None = None,
+        newline: str | None = None,
+        skipUnchanged: bool = True,
+        bom: bool | None = None,
+    ) -> Future:
+        # The text is encoded and written from a worker thread, the GUI thread only
+        # takes an O(1) snapshot. The returned future can be waited for, e.g. before
+        # quitting the application. The format of the last loaded file is used by
+        # default.
+        if encoding is None:
+            encoding = self._fileEncoding
+            if bom is None:
+                bom = self._fileBom
+        if newline is None:
+            newline = self._fileNewline
+        path = os.path.abspath(path)
+        previous = self._saveStates.get(path, None) if skipUnchanged else None
+        snapshot = self.snapshot()
+        revision = snapshot.revision()
+
+        def progress(written: int, total: int):
+            try:
+                # noinspection PyUnresolvedReferences
+                self.saveProgress.emit(written, total)
+            except RuntimeError:
+                # the editor has been deleted meanwhile
+                pass
+
+        future = _saveExecutor().submit(
+            files.save_snapshot,
+            snapshot,
+            path,
+            encoding,
+            newline,
+            previous,
+            progress,
+            bool(bom),
+        )
+
+        def done(f: Future):
+            error = f.exception()
+            try:
+                # noinspection PyUnresolvedReferences
+                self._saved.emit(path, revision, error if error else f.result())
+            except RuntimeError:
+                pass
+
+        future.add_done_callback(done)
+        return future
+
+    def setDecorationLayer(
+        self, name: str, decorations: Iterable[Decoration], z: int | None = None
+    ):
+        # Layers are painted in increasing z order, decorations are kept in document
+        # positions and follow the edits
+        layer = self._decorationLayers.get(name)
+        if layer is None:
+            layer = QIntervalTree()
+            self._decorationLayers[name] = layer
+            self._decorationZ[name] = 0
+        if z is not None:
+            self._decorationZ[name] = z
+        layer.clear()
+        layer.extend(decorations)
+        self._decorationCache.pop(name, None)
+        self._applyExtraSelections()
+
+    def addDecorations(self, name: str, decorations: Iterable[Decoration]):
+        layer = self._decorationLayers.get(name)
+        if layer is None:
+            self.setDecorationLayer(name, decorations)
+            return
+        layer.extend(decorations)
+        self._decorationCache.pop(name, None)
+        self._applyExtraSelections()
+
+    def clearDecorationLayer(self, name: str):
+        layer = self._decorationLayers.get(name)
+        if layer is None or len(layer) == 0:
+            return
+        layer.clear()
+        self._decorationCache.pop(name, None)
+        self._applyExtraSelections()
+
+    def removeDecorationLayer(self, name: str):
+        if name in (CURRENT_LINE_LAYER, PARENTHESES_LAYER):
+            self.clearDecorationLayer(name)
+            return
+        if self._decorationLayers.pop(name, None) is None:
+            return
+        self._decorationZ.pop(name)
+        self._decorationCache.pop(name, None)
+        self._applyExtraSelections()
+
+    def hasDecorationLayer(self, name: str) -> bool:
+        return name in self._decorationLayers
+
+    def decorationLayers(self) -> List[str]:
+        return sorted(self._decorationLayers, key=self._decorationZ.__getitem__)
+
+    def decorations(self, name: str, start: int = 0, end: int = -1) -> List[Decoration]:
+        layer = self._decorationLayers.get(name)
+        if layer is None:
+            return []
+        if end < 0:
+            end = self.document().characterCount()
+        return layer.overlapping(start, end)
+
+    def _decorationRange(self, margin: float) -> Tuple[int, int]:
+        viewport = self.viewport()
+        extra = int(viewport.height() * margin)
+        first = self._blockAt(-extra)
+        last = self._blockAt(viewport.height() + extra)
+        return first.position(), last.position() + last.length()
+
+    def _applyExtraSelections(self, force: bool = True):
+        if self._largeInsertion:
+            return
+        if self._decorationCacheStale:
+            self._decorationCacheStale = False
+            self._decorationCache.clear()
+        visibleFirst, visibleEnd = self._decorationRange(0)
+        window = None
+        selections = []
+        for name in self.decorationLayers():
+            cached = self._decorationCache.get(name)
+            if cached is None or cached[0] > visibleFirst or cached[1] < visibleEnd:
+                # only the decorations around the viewport are materialized
+                if window is None:
+                    window = self._decorationRange(DECORATION_VIEWPORT_MARGIN)
+                cached = (window[0], window[1], self._materializeLayer(name, *window))
+                self._decorationCache[name] = cached
+                force = True
+            selections.extend(cached[2])
+        if force:
+            self.setExtraSelections(selections)
+
+    def _materializeLayer(
+        self, name: str, first: int, end: int
+    ) -> List[QTextEdit.ExtraSelection]:
+        doc = self.document()
+        lastPosition = doc.characterCount() - 1
+        selections = []
+        for start, stop, format_ in self._decorationLayers[name].overlapping(
+            first, end
+        ):
+            selection = QTextEdit.ExtraSelection()
+            selection.format = format_
+            selection.cursor = QTextCursor(doc)
+            selection.cursor.setPosition(max(0, min(start, lastPosition)))
+            if stop > start:
+                selection.cursor.setPosition(
+                    min(stop, lastPosition), QTextCursor.MoveMode.KeepAnchor
+                )
+            selections.append(selection)
+        return selections
+
+    def _onDecorationContentsChange(
+        self, position: int, charsRemoved: int, charsAdded: int
+    ):
+        for layer in self._decorationLayers.values():
+            layer.applyEdit(position, charsRemoved, charsAdded)
+        # The cached selections are dropped later: clear() and setPlainText() emit
+        # contentsChange while the document updates its cursors, destroying one at
+        # that time corrupts the document.
+        self._decorationCacheStale = True
+
     def setCompleter(self, completer: QCompleter | None):
         if self._completer is not None:
             popup: QAbstractItemView = self._completer.popup()
@@ -195,22 +634,62 @@ class QCodeEditor(QTextEdit):
 
     # noinspection PyUnusedLocal
     def _updateLineNumberAreaWidth(self, w: int):
+        if self._largeInsertion:
+            return
         self.setViewportMargins(self._lineNumberArea.sizeHint().width(), 0, 0, 0)
 
+    def _onSaved(self, path: str, revision: int, result):
+        if isinstance(result, BaseException):
+            self._saveStates.pop(path, None)
+            warnings.warn(f"Can't save {path}: {result}")
+            # noinspection PyUnresolvedReferences
+            self.saveFailed.emit(path, str(result))
+            return
+        state, written = result
+        self._saveStates[path] = state
+        if revision == self.revision():
+            self.document().setModified(False)
+        # noinspection PyUnresolvedReferences
+        self.saveFinished.emit(path, written)
+
+    # noinspection PyUnusedLocal
+    def _onDiffMarkersChanged(self, first: int, last: int):
+        # the gutter only paints the markers of the visible lines
+        self._lineNumberArea.update()
+
     def _updateLineNumberArea(self, rect: QRect):
         # noinspection PyArgumentList
         self._lineNumberArea.update(
             0, rect.y(), self._lineNumberArea.sizeHint().width(), rect.height()
         )
 
+    @instrumentation.instrumented("editor.updateExtraSelection")
     def _updateExtraSelection(self):
-        extra = []
-        self._highlightCurrentLine(extra)
-        self._highlightParenthesis(extra)
-        self.setExtraSelections(extra)
+        if self._largeInsertion:
+            return
+        # the other layers keep their cached extra selections
+        currentLine = []
+        self._highlightCurrentLine(currentLine)
+        self._decorationLayers[CURRENT_LINE_LAYER].clear()
+        self._decorationLayers[CURRENT_LINE_LAYER].extend(currentLine)
+        parentheses = []
+        self._highlightParenthesis(parentheses)
+        self._decorationLayers[PARENTHESES_LAYER].clear()
+        self._decorationLayers[PARENTHESES_LAYER].extend(parentheses)
+        self._decorationCache.pop(CURRENT_LINE_LAYER, None)
+        self._decorationCache.pop(PARENTHESES_LAYER, None)
+        self._applyExtraSelections()
+
+    def _onStyleChanged(self, style: QSyntaxStyle, names: Set[str]):
+        # hot reload of the shared style, the text is only highlighted again when a
+        # format used by highlighters changed
+        if style is not self._syntaxStyle:
+            return
+        self._updateStyle(rehighlight=bool(names - EDITOR_FORMATS))
+        self._lineNumberArea.update()
 
-    def _updateStyle(self):
-        if self._highlighter:
+    def _updateStyle(self, rehighlight: bool = True):
+        if self._highlighter and rehighlight:
             self._highlighter.rehighlight()
 
         if self._syntaxStyle:
@@ -230,6 +709,10 @@ class QCodeEditor(QTextEdit):
 
         self._updateExtraSelection()
 
+    def _onCursorPositionChanged(self):
+        # looked up on each call, instrumentation may replace the method
+        self._updateExtraSelection()
+
     def _onSelectionChanged(self):
         cursor = self.textCursor()
 
@@ -251,9 +734,40 @@ class QCodeEditor(QTextEdit):
 
     # noinspection PyUnusedLocal
     def insertFromMimeData(self, source: QMimeData, **kwargs):
-        self.insertPlainText(source.text())
+        text = source.text()
+        if not _isLargeText(text):
+            self.insertPlainText(text)
+            return
+        self._insertLargeText(text)
+
+    def _insertLargeText(self, text: str):
+        # the same text as insertPlainText(), which reads \r\n and \r as newlines
+        text = utils.normalize_newlines(text)
+
+        highlighter = self._highlighter
+        cursor = self.textCursor()
+        # Skip highlighting, gutter and extra selection updates for every new block,
+        # they are done once the text is in place
+        self._largeInsertion = True
+        if highlighter is not None:
+            highlighter.suspend()
+        try:
+            cursor.beginEditBlock()
+            cursor.insertText(text)
+            cursor.endEditBlock()
+            self.setTextCursor(cursor)
+        finally:
+            self._largeInsertion = False
+            if highlighter is not None:
+                # the inserted range is highlighted in the background
+                highlighter.resume(lazy=True)
+
+        self._updateLineNumberAreaWidth(0)
+        self._updateExtraSelection()
+        self.ensureCursorVisible()
 
     # noinspection PyUnusedLocal
+    @instrumentation.instrumented("editor.paintEvent")
     def paintEvent(self, e: QPaintEvent, **kwargs):
         self._updateLineNumberArea(e.rect())
         super().paintEvent(e)
@@ -262,9 +776,49 @@ class QCodeEditor(QTextEdit):
     def resizeEvent(self, e: QResizeEvent, **kwargs):
         super().resizeEvent(e)
         self._updateLineGeometry()
+        self._applyExtraSelections(force=False)
+        self._updateHighlighterViewport()
+
+    def _updateHighlighterViewport(self):
+        # an edit highlights the visible blocks right away, the rest of a state
+        # cascade is deferred, and long lines are highlighted around the visible part
+        if self._highlighter is None:
+            return
+        viewport = self.viewport()
+        first = self._blockAt(0)
+        last = self._blockAt(viewport.height())
+        self._highlighter.setVisibleBlocks(first.blockNumber(), last.blockNumber())
+        ranges = []
+        layout = self.document().documentLayout()
+        offset = self.verticalScrollBar().value()
+        block = first
+        while block.isValid() and block.blockNumber() <= last.blockNumber():
+            if block.length() > LONG_LINE_LENGTH:
+                # inside the block, its edges hit test the neighbouring blocks
+                rect = layout.blockBoundingRect(block)
+                top = max(0, int(rect.top()) - offset + 1)
+                bottom = min(viewport.height(), int(rect.bottom()) - offset - 1)
+                ranges.append(
+                    (
+                        self.cursorForPosition(QPoint(0, top)).position(),
+                        self.cursorForPosition(
+                            QPoint(viewport.width(), max(top, bottom))
+                        ).position(),
+                    )
+                )
+            block = block.next()
+        self._highlighter.setVisibleRanges(ranges)
 
     # noinspection PyUnusedLocal
     def keyPressEvent(self, e: QKeyEvent, **kwargs):
+        # QTextEdit would undo with the (disabled) undo stack of the document
+        if e.matches(QKeySequence.StandardKey.Undo):
+            self.undo()
+            return
+        if e.matches(QKeySequence.StandardKey.Redo):
+            self.redo()
+            return
+
         completerSkip = self._proceedCompleterBegin(e)
         key = e.key()
         modifiers = e.modifiers()
@@ -309,6 +863,33 @@ class QCodeEditor(QTextEdit):
 
         self._proceedCompleterEnd(e)
 
+    def createStandardContextMenu(self, position: QPoint | None = None) -> QMenu:
+        if position is None:
+            menu = super().createStandardContextMenu()
+        else:
+            menu = super().createStandardContextMenu(position)
+        # the undo / redo actions of the menu act on the (disabled) undo stack of the
+        # document
+        for action in menu.actions():
+            if action.objectName() == "edit-undo":
+                # noinspection PyUnresolvedReferences
+                action.triggered.disconnect()
+                # noinspection PyUnresolvedReferences
+                action.triggered.connect(self.undo)
+                action.setEnabled(self.isUndoAvailable() and not self.isReadOnly())
+            elif action.objectName() == "edit-redo":
+                # noinspection PyUnresolvedReferences
+                action.triggered.disconnect()
+                # noinspection PyUnresolvedReferences
+                action.triggered.connect(self.redo)
+                action.setEnabled(self.isRedoAvailable() and not self.isReadOnly())
+        return menu
+
+    def contextMenuEvent(self, e: QContextMenuEvent, **kwargs):
+        menu = self.createStandardContextMenu(e.pos())
+        menu.exec_(e.globalPos())
+        menu.deleteLater()
+
     # noinspection PyUnusedLocal
     def focusInEvent(self, e, **kwargs):
         if self._completer:
@@ -337,10 +918,36 @@ class QCodeEditor(QTextEdit):
         # noinspection PyUnresolvedReferences
         vbar.valueChanged.connect(_vbar_changed)
 
+        def _viewport_moved(_):
+            self._applyExtraSelections(force=False)
+            self._updateHighlighterViewport()
+
         # noinspection PyUnresolvedReferences
-        self.cursorPositionChanged.connect(self._updateExtraSelection)
+        vbar.valueChanged.connect(_viewport_moved)
+
+        def _hbar_changed(_):
+            self._updateHighlighterViewport()
+
+        # noinspection PyUnresolvedReferences
+        self.horizontalScrollBar().valueChanged.connect(_hbar_changed)
+        # noinspection PyUnresolvedReferences
+        doc.contentsChange.connect(self._onDecorationContentsChange)
+
+        # noinspection PyUnresolvedReferences
+        self.cursorPositionChanged.connect(self._revealCursorBlock)
+        # noinspection PyUnresolvedReferences
+        self.cursorPositionChanged.connect(self._onCursorPositionChanged)
         # noinspection PyUnresolvedReferences
         self.selectionChanged.connect(self._onSelectionChanged)
+        # noinspection PyUnresolvedReferences
+        self._saved.connect(self._onSaved)
+        # noinspection PyUnresolvedReferences
+        QStyleRegistry.instance().styleChanged.connect(self._onStyleChanged)
+        # the document, whose undo stack is disabled, doesn't emit them
+        # noinspection PyUnresolvedReferences
+        self._undoHistory.undoAvailable.connect(self.undoAvailable)
+        # noinspection PyUnresolvedReferences
+        self._undoHistory.redoAvailable.connect(self.redoAvailable)
 
     # FIXME
     # def _handleSelectionQuery(self, cursor: QTextCursor):
@@ -373,6 +980,7 @@ class QCodeEditor(QTextEdit):
         isShortcut = utils.is_shortcut(e, Qt.ControlModifier, Qt.Key_Space)
         return not (not self._completer or not isShortcut)
 
+    @instrumentation.instrumented("editor.completer")
     def _proceedCompleterEnd(self, e: QKeyEvent):
         key = e.key()
         ctrlOrShift = utils.has_modifier(e, Qt.ControlModifier, Qt.ShiftModifier)
@@ -402,34 +1010,28 @@ class QCodeEditor(QTextEdit):
         self._completer.complete(cursRect)
 
     def _charUnderCursor(self, offset: int = 0) -> str:
+        # read from the document, copying the block text costs O(line length)
         cursor: QTextCursor = self.textCursor()
-        doc: QTextDocument = self.document()
-        block = cursor.blockNumber()
-        index = cursor.positionInBlock()
-        text = doc.findBlockByNumber(block).text()
-
-        index += offset
+        index = cursor.positionInBlock() + offset
 
-        if index < 0 or index >= len(text):
+        if index < 0 or index >= cursor.block().length() - 1:
             return ""
-        return text[index]
+        return self.document().characterAt(cursor.position() + offset)
 
     def _wordUnderCursor(self) -> str:
         tc: QTextCursor = self.textCursor()
         tc.select(QTextCursor.WordUnderCursor)
         return tc.selectedText() or ""
 
-    def _highlightCurrentLine(self, extraSelection: List[QTextEdit.ExtraSelection]):
+    def _highlightCurrentLine(self, decorations: List[Decoration]):
         if not self.isReadOnly():
-            selection = QTextEdit.ExtraSelection()
-            selection.format = self._syntaxStyle.getFormat("CurrentLine")
-            selection.format.setForeground(QBrush())
-            selection.cursor = self.textCursor()
-            selection.cursor.clearSelection()
-
-            extraSelection.append(selection)
+            format_ = QTextCharFormat(self._syntaxStyle.getFormat("CurrentLine"))
+            format_.setForeground(QBrush())
+            position = self.textCursor().position()
+            decorations.append((position, position, format_))
 
-    def _highlightParenthesis(self, extraSelection: List[QTextEdit.ExtraSelection]):
+    @instrumentation.instrumented("editor.highlightParenthesis")
+    def _highlightParenthesis(self, decorations: List[Decoration]):
         currentSymbol = self._charUnderCursor()
         prevSymbol = self._charUnderCursor(-1)
 
@@ -450,10 +1052,15 @@ class QCodeEditor(QTextEdit):
                 position -= 1
             else:
                 continue
+            activePosition = position
             counter = 1
+            steps = 0
 
             _charCount = self.document().characterCount() - 1
             while counter != 0 and 0 <= position < _charCount:
+                steps += 1
+                if steps > PARENTHESES_SEARCH_LIMIT:
+                    break
                 position += direction
                 character = self.document().characterAt(position)
                 if character == activeSymbol:
@@ -465,42 +1072,19 @@ class QCodeEditor(QTextEdit):
             format_ = self._syntaxStyle.getFormat("Parentheses")
 
             if counter == 0:
-                selection = QTextEdit.ExtraSelection()
-                directionEnum = (
-                    QTextCursor.MoveOperation.Left
-                    if direction < 0
-                    else QTextCursor.MoveOperation.Right
-                )
-                selection.format = format_
-                selection.cursor = QTextCursor(self.textCursor())
-                selection.cursor.clearSelection()
-                _foundPos = abs(self.textCursor().position() - position)
-                selection.cursor.movePosition(
-                    directionEnum, QTextCursor.MoveMode.MoveAnchor, _foundPos
-                )
-                selection.cursor.movePosition(
-                    QTextCursor.MoveOperation.Right, QTextCursor.MoveMode.KeepAnchor, 1
-                )
-
-                extraSelection.append(selection)
-
-                selection2 = QTextEdit.ExtraSelection()
-                selection2.format = format_
-                selection2.cursor = QTextCursor(self.textCursor())
-                selection2.cursor.clearSelection()
-                selection2.cursor.movePosition(
-                    directionEnum, QTextCursor.MoveMode.KeepAnchor, 1
-                )
-                extraSelection.append(selection2)
+                decorations.append((position, position + 1, format_))
+                decorations.append((activePosition, activePosition + 1, format_))
 
     def getIndentationSpaces(self) -> int:
-        blockText = self.textCursor().block().text()
+        block = self.textCursor().block()
+        doc = self.document()
         indentationLevel: int = 0
-        bSize_ = len(blockText)
-        for i in range(bSize_):
-            if blockText[i] not in "\t ":
+        start = block.position()
+        for i in range(start, start + block.length() - 1):
+            character = doc.characterAt(i)
+            if character not in "\t ":
                 break
-            if blockText[i] == " ":
+            if character == " ":
                 indentationLevel += 1
             else:
                 avgCharWidth = self.fontMetrics().averageCharWidth()
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import bisect
+import re
+from abc import abstractmethod
+from typing import Callable, Dict, List, Tuple
+
+from qtpy.QtGui import QTextBlock, QTextBlockUserData, QTextDocument
+
+
+# noinspection PyPep8Naming
+class QFoldBlockData(QTextBlockUserData):
+    def __init__(self, unmatchedCloses: int = 0, unmatchedOpens: int = 0, indent=-1):
+        super().__init__()
+        # brace based folding
+        self.unmatchedCloses: int = unmatchedCloses
+        self.unmatchedOpens: int = unmatchedOpens
+        # indentation based folding, -1 for blank lines
+        self.indent: int = indent
+
+
+def _foldData(block: QTextBlock) -> QFoldBlockData | None:
+    data = block.userData()
+    return data if isinstance(data, QFoldBlockData) else None
+
+
+# noinspection PyPep8Naming
+class QFoldingStrategy(object):
+    # Fold data is computed by the highlighter every time it highlights a block, so
+    # it is kept up to date incrementally, only for the blocks that were changed.
+
+    @abstractmethod
+    def blockData(
+        self, text: str, skipped: Callable[[int], bool] | None = None
+    ) -> QFoldBlockData:
+        # skipped(column) tells whether the character at column of text is in a
+        # string or a comment
+        pass
+
+    def longBlockData(self, text: str) -> QFoldBlockData:
+        # fold data of a block too long to be scanned on every edit (see
+        # LONG_LINE_LENGTH), an approximation may do
+        return self.blockData(text)
+
+    @abstractmethod
+    def isFoldStart(self, block: QTextBlock) -> bool:
+        pass
+
+    @abstractmethod
+    def regionEnd(self, block: QTextBlock) -> int:
+        # Returns the number of the last block folded with the given block, or -1
+        pass
+
+
+# noinspection PyPep8Naming
+class QBraceFoldingStrategy(QFoldingStrategy):
+    def __init__(self, opening: str = "{", closing: str = "}"):
+        assert len(opening) == len(closing)
+        self._opening = opening
+        self._closing = closing
+        self._braceRegex = re.compile("[" + re.escape(opening + closing) + "]")
+
+    def blockData(
+        self, text: str, skipped: Callable[[int], bool] | None = None
+    ) -> QFoldBlockData:
+        braces = self._braceRegex.findall(text)
+        if not braces:
+            return QFoldBlockData()
+        if skipped is not None:
+            # e.g. "{" or // }
+            braces = [
+                match.group()
+                for match in self._braceRegex.finditer(text)
+                if not skipped(match.start())
+            ]
+        opening = self._opening
+        depth = 0
+        minDepth = 0
+        for c in braces:
+            if c in opening:
+                depth += 1
+            else:
+                depth -= 1
+                minDepth = min(minDepth, depth)
+        return QFoldBlockData(-minDepth, depth - minDepth)
+
+    def longBlockData(self, text: str) -> QFoldBlockData:
+        # only the balance of the braces, counted in C: the closes are taken as
+        # coming before the opens, strings and comments are not skipped
+        opens = sum(text.count(c) for c in self._opening)
+        closes = sum(text.count(c) for c in self._closing)
+        return QFoldBlockData(max(0, closes - opens), max(0, opens - closes))
+
+    def isFoldStart(self, block: QTextBlock) -> bool:
+        data = _foldData(block)
+        return data is not None and data.unmatchedOpens > 0
+
+    def regionEnd(self, block: QTextBlock) -> int:
+        data = _foldData(block)
+        if data is None or data.unmatchedOpens <= 0:
+            return -1
+        depth = data.unmatchedOpens
+        start = block.blockNumber()
+        block = block.next()
+        while block.isValid():
+            data = _foldData(block)
+            if data is not None:
+                depth -= data.unmatchedCloses
+                if depth <= 0:
+                    # the line closing the region stays visible
+                    end = block.blockNumber() - 1
+                    return end if end > start else -1
+                depth += data.unmatchedOpens
+            block = block.next()
+        return -1
+
+
+# noinspection PyPep8Naming
+class QIndentFoldingStrategy(QFoldingStrategy):
+    def __init__(self, tabWidth: int = 4):
+        self._tabWidth = tabWidth
+
+    def blockData(
+        self, text: str, skipped: Callable[[int], bool] | None = None
+    ) -> QFoldBlockData:
+        stripped = text.lstrip(" \t")
+        if not stripped:
+            return QFoldBlockData()
+        indent = len(text[: len(text) - len(stripped)].expandtabs(self._tabWidth))
+        return QFoldBlockData(indent=indent)
+
+    def isFoldStart(self, block: QTextBlock) -> bool:
+        data = _foldData(block)
+        if data is None or data.indent < 0:
+            return False
+        following = self._nextNonBlank(block.next())
+        if following is None:
+            return False
+        return _foldData(following).indent > data.indent
+
+    def regionEnd(self, block: QTextBlock) -> int:
+        if not self.isFoldStart(block):
+            return -1
+        indent = _foldData(block).indent
+        end = block.blockNumber()
+        block = block.next()
+        while block.isValid():
+            data = _foldData(block)
+            if data is None:
+                break
+            if data.indent >= 0:
+                if data.indent <= indent:
+                    break
+                # trailing blank lines are not part of the region
+                end = block.blockNumber()
+            block = block.next()
+        return end
+
+    @staticmethod
+    def _nextNonBlank(block: QTextBlock) -> QTextBlock | None:
+        while block.isValid():
+            data = _foldData(block)
+            if data is None:
+                return None
+            if data.indent >= 0:
+                return block
+            block = block.next()
+        return None
+
+
+# noinspection PyPep8Naming
+class QFoldRegions(object):
+    # Collapsed regions (first block, last hidden block) indexed by their first block,
+    # the lines from first + 1 to last are hidden.
+
+    def __init__(self, document: QTextDocument):
+        self._document: QTextDocument = document
+        self._starts: List[int] = []
+        self._ends: Dict[int, int] = {}
+        self._blockCount: int = document.blockCount()
+        # noinspection PyUnresolvedReferences
+        document.contentsChange.connect(self._onContentsChange)
+
+    def document(self) -> QTextDocument:
+        return self._document
+
+    def isEmpty(self) -> bool:
+        return not self._starts
+
+    def regions(self) -> List[Tuple[int, int]]:
+        return [(start, self._ends[start]) for start in self._starts]
+
+    def isCollapsed(self, blockNumber: int) -> bool:
+        return blockNumber in self._ends
+
+    def collapsedEnd(self, blockNumber: int) -> int:
+        return self._ends.get(blockNumber, -1)
+
+    def regionsHiding(self, blockNumber: int) -> List[int]:
+        # first blocks of the collapsed regions hiding the given block
+        index = bisect.bisect_left(self._starts, blockNumber)
+        return [s for s in self._starts[:index] if self._ends[s] >= blockNumber]
+
+    def collapse(self, start: int, end: int):
+        if end <= start or start in self._ends:
+            return
+        bisect.insort(self._starts, start)
+        self._ends[start] = end
+        self._setVisible(start + 1, end, False)
+
+    def expand(self, start: int):
+        end = self._ends.pop(start, None)
+        if end is None:
+            return
+        self._starts.remove(start)
+        if self.regionsHiding(start):
+            # still hidden by an enclosing region
+            return
+        self._setVisible(start + 1, end, True)
+
+    def expandAll(self):
+        if not self._starts:
+            return
+        first = self._starts[0]
+        last = max(self._ends.values())
+        self._starts.clear()
+        self._ends.clear()
+        self._setVisible(first + 1, last, True)
+
+    def nextVisibleBlock(self, block: QTextBlock) -> QTextBlock:
+        end = self._ends.get(block.blockNumber(), -1)
+        if end >= 0:
+            block = self._document.findBlockByNumber(end + 1)
+        else:
+            block = block.next()
+        while block.isValid() and not block.isVisible():
+            end = self._ends.get(block.blockNumber(), -1)
+            if end >= 0:
+                block = self._document.findBlockByNumber(end + 1)
+            else:
+                block = block.next()
+        return block
+
+    def _setVisible(self, first: int, last: int, visible: bool):
+        doc = self._document
+        last = min(last, doc.blockCount() - 1)
+        if last < first:
+            return
+        block = doc.findBlockByNumber(first)
+        firstPosition = block.position()
+        endPosition = firstPosition
+        while block.isValid() and block.blockNumber() <= last:
+            number = block.blockNumber()
+            block.setVisible(visible)
+            endPosition = block.position() + block.length()
+            nestedEnd = self._ends.get(number, -1)
+            if visible and nestedEnd >= 0:
+                # nested regions that are still collapsed stay hidden
+                block = doc.findBlockByNumber(nestedEnd + 1)
+                continue
+            block = block.next()
+        # relayout only the range of the region
+        doc.markContentsDirty(firstPosition, endPosition - firstPosition)
+
+    def _onContentsChange(self, position: int, charsRemoved: int, charsAdded: int):
+        doc = self._document
+        blockCount = doc.blockCount()
+        delta = blockCount - self._blockCount
+        self._blockCount = blockCount
+        if not self._starts:
+            return
+
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(min(position + charsAdded, doc.characterCount() - 1))
+        oldLast = last.blockNumber() - delta
+
+        starts = []
+        ends = {}
+        touched = []
+        for start in self._starts:
+            end = self._ends[start]
+            if end < first or (start == first == oldLast and delta == 0):
+                starts.append(start)
+                ends[start] = end
+            elif start > oldLast:
+                starts.append(start + delta)
+                ends[start + delta] = end + delta
+            else:
+                # edits inside a collapsed region unfold it
+                touched.append((start, max(start, end + delta)))
+        self._starts = starts
+        self._ends = ends
+        for start, end in touched:
+            if not self.regionsHiding(start):
+                self._setVisible(start + 1, end, True)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import os
+import warnings
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import List
+
+from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtGui import QTextCharFormat, QTextFormat
+
+from . import QCodeEditor
+from .checkers import Checker, Diagnostic, SEVERITY_WARNING, run_checker
+
+# Time (in milliseconds) without edits before the document is checked
+DIAGNOSTICS_DELAY: int = 400
+DIAGNOSTICS_LAYER: str = "diagnostics"
+DIAGNOSTICS_LAYER_Z: int = 5
+
+_checkExecutor: Executor | None = None
+
+
+def _executor() -> Executor:
+    global _checkExecutor
+    if _checkExecutor is None:
+        try:
+            # where processes are spawned, the application's main module is imported
+            # by the workers and must be guarded by `if __name__ == "__main__":`
+            _checkExecutor = ProcessPoolExecutor(
+                max_workers=min(2, os.cpu_count() or 1)
+            )
+        except (OSError, NotImplementedError, ValueError) as e:
+            warnings.warn(f"Can't start the diagnostics processes, using a thread: {e}")
+            _checkExecutor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="QDiagnostics"
+            )
+    return _checkExecutor
+
+
+def _resetExecutor():
+    global _checkExecutor
+    if _checkExecutor is not None:
+        _checkExecutor.shutdown(wait=False)
+    _checkExecutor = None
+
+
+# noinspection PyPep8Naming
+class QDiagnostics(QObject):
+    diagnosticsChanged = Signal()
+    # generation, diagnostics or exception; emitted from the executor's thread
+    _checked = Signal(int, object)
+
+    def __init__(
+        self,
+        editor: QCodeEditor.QCodeEditor | None = None,
+        checker: Checker | None = None,
+        parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+
+        self._editor: QCodeEditor.QCodeEditor | None = None
+        self._checker: Checker | None = checker
+        # bumped by every edit and new check, results of older generations are dropped
+        self._generation: int = 0
+        self._future: Future | None = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(DIAGNOSTICS_DELAY)
+        # noinspection PyUnresolvedReferences
+        self._timer.timeout.connect(self.check)
+        # noinspection PyUnresolvedReferences
+        self._checked.connect(self._onChecked)
+
+        if editor is not None:
+            self.setEditor(editor)
+
+    def setEditor(self, editor: QCodeEditor.QCodeEditor | None):
+        if self._editor is not None:
+            # noinspection PyUnresolvedReferences
+            self._editor.document().contentsChange.disconnect(self._onContentsChange)
+            self._editor.removeDecorationLayer(DIAGNOSTICS_LAYER)
+        self._editor = editor
+        self._cancel()
+        if editor is None:
+            return
+        # noinspection PyUnresolvedReferences
+        editor.document().contentsChange.connect(self._onContentsChange)
+        self._timer.start()
+
+    def editor(self) -> QCodeEditor.QCodeEditor | None:
+        return self._editor
+
+    def setChecker(self, checker: Checker | None):
+        self._checker = checker
+        self._cancel()
+        self._timer.start()
+
+    def checker(self) -> Checker | None:
+        return self._checker
+
+    def setDelay(self, msec: int):
+        self._timer.setInterval(max(0, msec))
+
+    def delay(self) -> int:
+        return self._timer.interval()
+
+    def diagnostics(self) -> List[Diagnostic]:
+        # positions follow the edits made since the check
+        return self.diagnosticsIn(0, -1)
+
+    def diagnosticsAt(self, position: int) -> List[Diagnostic]:
+        return self.diagnosticsIn(position, position)
+
+    def diagnosticsIn(self, start: int, end: int) -> List[Diagnostic]:
+        if self._editor is None:
+            return []
+        return [
+            (first, last, format_.property(QTextFormat.UserProperty), format_.toolTip())
+            for first, last, format_ in self._editor.decorations(
+                DIAGNOSTICS_LAYER, start, end
+            )
+        ]
+
+    def check(self):
+        self._timer.stop()
+        if self._editor is None:
+            return
+        if self._checker is None:
+            self._render([])
+            return
+        self._cancel()
+        generation = self._generation
+        snapshot = self._editor.snapshot()
+        try:
+            future = _executor().submit(run_checker, self._checker, snapshot)
+        except BrokenExecutor as e:
+            # the pool has been broken by a crashed worker
+            warnings.warn(f"Can't run the diagnostics checker: {e}")
+            _resetExecutor()
+            return
+
+        def done(f: Future):
+            if f.cancelled():
+                return
+            error = f.exception()
+            try:
+                # noinspection PyUnresolvedReferences
+                self._checked.emit(generation, error if error else f.result())
+            except RuntimeError:
+                # the object has been deleted meanwhile
+                pass
+
+        future.add_done_callback(done)
+        self._future = future
+
+    def _cancel(self):
+        self._generation += 1
+        if self._future is not None:
+            # jobs already running finish, their result is dropped
+            self._future.cancel()
+            self._future = None
+
+    def _onContentsChange(self, position: int, charsRemoved: int, charsAdded: int):
+        self._cancel()
+        self._timer.start()
+
+    def _onChecked(self, generation: int, result):
+        if generation != self._generation or self._editor is None:
+            return
+        self._future = None
+        if isinstance(result, BaseException):
+            warnings.warn(f"Diagnostics checker failed: {result}")
+            if isinstance(result, BrokenExecutor):
+                _resetExecutor()
+            return
+        self._render(result)
+
+    def _render(self, diagnostics: List[Diagnostic]):
+        style = self._editor.syntaxStyle()
+        errorFormat = style.getFormat("Error")
+        warningFormat = style.getFormat("Warning")
+        decorations = []
+        for start, end, severity, message in diagnostics:
+            format_ = QTextCharFormat(
+                warningFormat if severity == SEVERITY_WARNING else errorFormat
+            )
+            format_.setToolTip(message)
+            format_.setProperty(QTextFormat.UserProperty, severity)
+            decorations.append((start, end, format_))
+        # the editor only materializes the decorations around the viewport
+        self._editor.setDecorationLayer(
+            DIAGNOSTICS_LAYER, decorations, DIAGNOSTICS_LAYER_Z
+        )
+        # noinspection PyUnresolvedReferences
+        self.diagnosticsChanged.emit()
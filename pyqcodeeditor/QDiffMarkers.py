@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import difflib
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Tuple
+
+from qtpy.QtCore import QObject, QTimer, Signal
+
+from . import QCodeEditor
+from .QDocumentChangeLog import QDocumentChange
+
+# Line status flags
+DIFF_UNCHANGED: int = 0
+DIFF_ADDED: int = 1
+DIFF_MODIFIED: int = 2
+# baseline lines have been removed before / after (at the end of the text) the line
+DIFF_DELETED: int = 4
+DIFF_DELETED_BELOW: int = 8
+
+# Time (in milliseconds) without edits before the changed lines are diffed
+DIFF_DELAY: int = 150
+
+_diffExecutor: ThreadPoolExecutor | None = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _diffExecutor
+    if _diffExecutor is None:
+        _diffExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="QDiffMarkers"
+        )
+    return _diffExecutor
+
+
+def _diffWindow(
+    baseline: List[int], current: List[int], baselineStart: int
+) -> Tuple[List[int], bytearray, bool]:
+    # Runs in the worker. Returns the baseline index (or -1) and the status of each
+    # current line, and whether baseline lines are removed after the last one.
+    baseIndex = [-1] * len(current)
+    status = bytearray(len(current))
+    deletedAtEnd = False
+    matcher = difflib.SequenceMatcher(None, baseline, current)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            baseIndex[j1:j2] = range(baselineStart + i1, baselineStart + i2)
+        elif tag == "replace":
+            status[j1:j2] = bytes([DIFF_MODIFIED]) * (j2 - j1)
+        elif tag == "insert":
+            status[j1:j2] = bytes([DIFF_ADDED]) * (j2 - j1)
+        elif j1 < len(current):
+            status[j1] |= DIFF_DELETED
+        else:
+            deletedAtEnd = True
+    return baseIndex, status, deletedAtEnd
+
+
+# noinspection PyPep8Naming
+class QDiffMarkers(QObject):
+    # Changed / added / deleted line markers against a baseline text.
+    # Line hashes of the baseline and of the current text are cached, every edit
+    # splices the hashes of the edited lines only and marks them dirty. Dirty lines are
+    # diffed in a worker between the closest unchanged lines around them, so an
+    # update costs in proportion to the edit rather than to the document.
+
+    # first and last line numbers whose markers changed
+    markersChanged = Signal(int, int)
+    # generation, window, result; emitted from the worker thread
+    _diffed = Signal(int, object, object)
+
+    def __init__(
+        self,
+        editor: QCodeEditor.QCodeEditor | None = None,
+        baseline: str | None = None,
+        parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+
+        self._editor: QCodeEditor.QCodeEditor | None = None
+        self._baselineHashes: List[int] = []
+        # per current line
+        self._hashes: List[int] = []
+        self._baseIndex: List[int] = []
+        self._status: bytearray = bytearray()
+        # dirty current lines [first, last], empty when first > last
+        self._dirtyFirst: int = 0
+        self._dirtyLast: int = -1
+        self._generation: int = 0
+        self._future: Future | None = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(DIFF_DELAY)
+        # noinspection PyUnresolvedReferences
+        self._timer.timeout.connect(self._diffDirtyLines)
+        # noinspection PyUnresolvedReferences
+        self._diffed.connect(self._onDiffed)
+
+        if baseline is not None:
+            self._baselineHashes = [hash(line) for line in baseline.split("\n")]
+        if editor is not None:
+            self.setEditor(editor)
+
+    def setEditor(self, editor: QCodeEditor.QCodeEditor | None):
+        if self._editor is not None:
+            # noinspection PyUnresolvedReferences
+            self._editor.changeLog().changed.disconnect(self._onChanged)
+            if self._editor.diffMarkers() is self:
+                self._editor.setDiffMarkers(None)
+        self._editor = editor
+        if editor is None:
+            return
+        # noinspection PyUnresolvedReferences
+        editor.changeLog().changed.connect(self._onChanged)
+        editor.setDiffMarkers(self)
+        self._reset()
+
+    def editor(self) -> QCodeEditor.QCodeEditor | None:
+        return self._editor
+
+    def setBaseline(self, text: str):
+        self._baselineHashes = [hash(line) for line in text.split("\n")]
+        self._reset()
+
+    def setBaselineToCurrent(self):
+        # e.g. after saving, every line becomes unchanged without diffing
+        self._baselineHashes = list(self._hashes)
+        self._generation += 1
+        self._baseIndex = list(range(len(self._hashes)))
+        self._status = bytearray(len(self._hashes))
+        self._dirtyFirst = 0
+        self._dirtyLast = -1
+        # noinspection PyUnresolvedReferences
+        self.markersChanged.emit(0, max(0, len(self._hashes) - 1))
+
+    def lineStatus(self, line: int) -> int:
+        if 0 <= line < len(self._status):
+            return self._status[line]
+        return DIFF_UNCHANGED
+
+    def changedLines(self) -> List[int]:
+        return [line for line, status in enumerate(self._status) if status]
+
+    def isPending(self) -> bool:
+        return self._dirtyFirst <= self._dirtyLast
+
+    def _reset(self):
+        if self._editor is None:
+            return
+        snapshot = self._editor.snapshot()
+        self._hashes = [hash(line) for line in snapshot.lines()]
+        count = len(self._hashes)
+        self._baseIndex = [-1] * count
+        self._status = bytearray(count)
+        self._markDirty(0, count - 1)
+
+    def _markDirty(self, first: int, last: int):
+        self._generation += 1
+        if self._dirtyFirst > self._dirtyLast:
+            self._dirtyFirst = first
+            self._dirtyLast = last
+        else:
+            self._dirtyFirst = min(self._dirtyFirst, first)
+            self._dirtyLast = max(self._dirtyLast, last)
+        self._timer.start()
+
+    def _onChanged(self, change: QDocumentChange):
+        first = change.firstBlock
+        last = change.lastBlock
+        oldLast = last - change.blockDelta
+        count = last - first + 1
+
+        # only the hashes of the edited lines are computed
+        hashes = []
+        block = self._editor.document().findBlockByNumber(first)
+        for _ in range(count):
+            hashes.append(hash(block.text()))
+            block = block.next()
+        self._hashes[first : oldLast + 1] = hashes
+        self._baseIndex[first : oldLast + 1] = [-1] * count
+        self._status[first : oldLast + 1] = bytes([DIFF_MODIFIED]) * count
+
+        if self._dirtyFirst <= self._dirtyLast:
+            # move the pending dirty lines along with the edit
+            def move(line: int, lower: bool) -> int:
+                if line < first:
+                    return line
+                if line > oldLast:
+                    return line + change.blockDelta
+                return first if lower else last
+
+            self._dirtyFirst = move(self._dirtyFirst, True)
+            self._dirtyLast = move(self._dirtyLast, False)
+        self._markDirty(first, last)
+
+    def _diffDirtyLines(self):
+        if self._editor is None or self._dirtyFirst > self._dirtyLast:
+            return
+        if self._future is not None and not self._future.done():
+            # one job at a time, the next one starts when this one is done
+            return
+        baseIndex = self._baseIndex
+        # the closest unchanged lines around the dirty ones bound the diff
+        before = self._dirtyFirst - 1
+        while before >= 0 and baseIndex[before] < 0:
+            before -= 1
+        after = self._dirtyLast + 1
+        while after < len(baseIndex) and baseIndex[after] < 0:
+            after += 1
+        currentStart = before + 1
+        baselineStart = baseIndex[before] + 1 if before >= 0 else 0
+        if after < len(baseIndex):
+            baselineEnd = baseIndex[after]
+        else:
+            baselineEnd = len(self._baselineHashes)
+
+        window = (currentStart, after)
+        generation = self._generation
+        future = _executor().submit(
+            _diffWindow,
+            self._baselineHashes[baselineStart:baselineEnd],
+            self._hashes[currentStart:after],
+            baselineStart,
+        )
+
+        def done(f: Future):
+            error = f.exception()
+            try:
+                # noinspection PyUnresolvedReferences
+                self._diffed.emit(generation, window, error if error else f.result())
+            except RuntimeError:
+                # the object has been deleted meanwhile
+                pass
+
+        future.add_done_callback(done)
+        self._future = future
+
+    def _onDiffed(self, generation: int, window: Tuple[int, int], result):
+        self._future = None
+        if isinstance(result, BaseException):
+            warnings.warn(f"Can't diff against the baseline: {result}")
+            return
+        if generation != self._generation:
+            # edited meanwhile, the lines are diffed again
+            self._timer.start()
+            return
+        start, end = window
+        baseIndex, status, deletedAtEnd = result
+        self._baseIndex[start:end] = baseIndex
+        self._status[start:end] = status
+        lastChanged = end - 1
+        if end < len(self._status):
+            if deletedAtEnd:
+                self._status[end] |= DIFF_DELETED
+            else:
+                self._status[end] &= ~DIFF_DELETED & 0xFF
+            lastChanged = end
+        elif deletedAtEnd and end > 0:
+            self._status[end - 1] |= DIFF_DELETED_BELOW
+        self._dirtyFirst = 0
+        self._dirtyLast = -1
+        # noinspection PyUnresolvedReferences
+        self.markersChanged.emit(start, max(start, lastChanged))
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from collections import deque
+from itertools import islice
+from typing import Deque, List, NamedTuple
+
+from qtpy.QtCore import QObject, Signal
+from qtpy.QtGui import QTextDocument
+
+from .QTextSnapshot import QTextSnapshot
+from .QTextStore import QTextStore
+
+# Number of changes kept for changesSince()
+CHANGE_LOG_LIMIT: int = 4096
+
+
+def _documentText(document: QTextDocument, start: int, end: int) -> str:
+    # Text between two positions, read from the blocks. No QTextCursor is created:
+    # clear() and setPlainText() emit contentsChange while the document updates its
+    # cursors, a cursor created at that time corrupts the document.
+    parts = []
+    block = document.findBlock(start)
+    while block.isValid() and block.position() < end:
+        position = block.position()
+        text = block.text()
+        parts.append(text[max(0, start - position) : end - position])
+        if position + len(text) < end:
+            parts.append("\n")
+        block = block.next()
+    return "".join(parts)
+
+
+# noinspection PyPep8Naming
+class QDocumentChange(NamedTuple):
+    # Replaying the change on the text of the previous revision gives the text of
+    # this one: text[:position] + addedText + text[position + charsRemoved:]
+    revision: int
+    position: int
+    charsRemoved: int
+    addedText: str
+    # blocks covered by the added text, in the new revision
+    firstBlock: int
+    lastBlock: int
+    # number of blocks added (or removed when negative)
+    blockDelta: int
+    removedText: str
+
+
+# noinspection PyPep8Naming
+class QDocumentChangeLog(QObject):
+    changed = Signal(object)
+
+    def __init__(
+        self,
+        document: QTextDocument,
+        parent: QObject | None = None,
+        limit: int = CHANGE_LOG_LIMIT,
+    ):
+        super().__init__(parent)
+
+        self._document: QTextDocument = document
+        self._revision: int = 0
+        self._changes: Deque[QDocumentChange] = deque(maxlen=max(1, limit))
+        self._length: int = document.characterCount() - 1
+        # shadow copy of the text, readable from other threads through snapshots
+        self._store: QTextStore = QTextStore(document.toPlainText())
+        self._blockCount: int = document.blockCount()
+        # noinspection PyUnresolvedReferences
+        document.contentsChange.connect(self._onContentsChange)
+
+    def document(self) -> QTextDocument:
+        return self._document
+
+    def revision(self) -> int:
+        return self._revision
+
+    def oldestRevision(self) -> int:
+        # oldest revision changesSince() can replay from
+        if not self._changes:
+            return self._revision
+        return self._changes[0].revision - 1
+
+    def snapshot(self) -> QTextSnapshot:
+        return self._store.snapshot(self._revision)
+
+    def changesSince(self, revision: int) -> List[QDocumentChange] | None:
+        # None when the changes are no longer in the log, the consumer must then
+        # read the whole document again
+        if revision < self.oldestRevision() or revision > self._revision:
+            return None
+        count = self._revision - revision
+        start = len(self._changes) - count
+        return list(islice(self._changes, start, None))
+
+    def _onContentsChange(self, position: int, charsRemoved: int, charsAdded: int):
+        doc = self._document
+        oldLength = self._length
+        newLength = doc.characterCount() - 1
+        # QTextDocument counts the implicit last paragraph separator in some changes
+        # (setPlainText(), clear()), the counts are clamped to the actual text
+        removed = max(0, min(charsRemoved, oldLength - position))
+        added = max(0, min(charsAdded, newLength - position))
+        if oldLength - removed + added != newLength:
+            position = 0
+            removed = oldLength
+            added = newLength
+        self._length = newLength
+        if removed == 0 and added == 0:
+            return
+
+        addedText = _documentText(doc, position, position + added)
+
+        removedText = self._store.replace(position, removed, addedText)
+        blockCount = doc.blockCount()
+        blockDelta = blockCount - self._blockCount
+        self._blockCount = blockCount
+        self._revision += 1
+        change = QDocumentChange(
+            self._revision,
+            position,
+            removed,
+            addedText,
+            doc.findBlock(position).blockNumber(),
+            doc.findBlock(position + added).blockNumber(),
+            blockDelta,
+            removedText,
+        )
+        self._changes.append(change)
+        # noinspection PyUnresolvedReferences
+        self.changed.emit(change)
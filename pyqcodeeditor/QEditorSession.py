@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from typing import Callable, List
+
+from qtpy.QtCore import QObject, Signal
+from qtpy.QtWidgets import QCompleter
+
+from . import files
+from .QCodeEditor import QCodeEditor
+from .QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+from .QSyntaxStyle import QSyntaxStyle
+
+# Number of documents bound to an editor widget at the same time
+SESSION_MAX_EDITORS: int = 8
+
+HighlighterFactory = Callable[[], QStyleSyntaxHighlighter]
+CompleterFactory = Callable[[], QCompleter]
+
+
+# noinspection PyPep8Naming
+class QDocumentHandle(object):
+    # A document of a session. Until it is shown it is only a path and / or a text
+    # (a file is not even read), and it drops its editor (and its highlighting)
+    # when it has not been shown for a while.
+
+    def __init__(
+        self,
+        path: str | None = None,
+        text: str | None = None,
+        title: str | None = None,
+        highlighter: HighlighterFactory | None = None,
+        completer: CompleterFactory | None = None,
+    ):
+        self._path: str | None = os.path.abspath(path) if path else None
+        # None when the text is the content of the file
+        self._text: str | None = text
+        self._title: str = title or (os.path.basename(path) if path else "")
+        self._highlighterFactory: HighlighterFactory | None = highlighter
+        self._completerFactory: CompleterFactory | None = completer
+        self._editor: QCodeEditor | None = None
+        self._modified: bool = False
+        self._cursorPosition: int = 0
+        self._scrollValue: int = 0
+        # file format kept while not materialized
+        self._encoding: str | None = None
+        self._newline: str | None = None
+        self._bom: bool = False
+
+    def path(self) -> str | None:
+        return self._path
+
+    def title(self) -> str:
+        return self._title
+
+    def setTitle(self, title: str):
+        self._title = title
+
+    def editor(self) -> QCodeEditor | None:
+        return self._editor
+
+    def isMaterialized(self) -> bool:
+        return self._editor is not None
+
+    def isModified(self) -> bool:
+        if self._editor is not None:
+            return self._editor.document().isModified()
+        return self._modified
+
+    def cursorPosition(self) -> int:
+        if self._editor is not None:
+            return self._editor.textCursor().position()
+        return self._cursorPosition
+
+    def text(self) -> str:
+        if self._editor is not None:
+            return self._editor.toPlainText()
+        if self._text is not None:
+            return self._text
+        if self._path is None:
+            return ""
+        return files.load_file(self._path, self._encoding).text
+
+
+# noinspection PyPep8Naming
+class QEditorSession(QObject):
+    # Documents of a tab heavy session. Restoring a session only creates handles,
+    # editors are taken from a pool when a document is shown. At most
+    # maximumEditors() documents keep an editor, the least recently shown one gives
+    # its editor back: an unmodified file is then dropped from memory and read again
+    # when shown, a modified text is kept as a string (its undo history is lost).
+
+    # handle, editor
+    editorMaterialized = Signal(object, object)
+    # handle, editor; the editor is about to be used for another document
+    editorReleased = Signal(object, object)
+
+    def __init__(
+        self,
+        parent: QObject | None = None,
+        maxEditors: int = SESSION_MAX_EDITORS,
+        style: QSyntaxStyle | None = None,
+    ):
+        super().__init__(parent)
+
+        self._handles: List[QDocumentHandle] = []
+        # materialized handles, the most recently shown last
+        self._active: OrderedDict[QDocumentHandle, QCodeEditor] = OrderedDict()
+        self._freeEditors: List[QCodeEditor] = []
+        self._maxEditors: int = max(1, maxEditors)
+        self._style: QSyntaxStyle | None = style
+
+    def addDocument(
+        self,
+        path: str | None = None,
+        text: str | None = None,
+        title: str | None = None,
+        highlighter: HighlighterFactory | None = None,
+        completer: CompleterFactory | None = None,
+    ) -> QDocumentHandle:
+        # O(1), nothing is read or created before the document is shown
+        handle = QDocumentHandle(path, text, title, highlighter, completer)
+        self._handles.append(handle)
+        return handle
+
+    def removeDocument(self, handle: QDocumentHandle):
+        self.release(handle)
+        if handle in self._handles:
+            self._handles.remove(handle)
+
+    def documents(self) -> List[QDocumentHandle]:
+        return list(self._handles)
+
+    def materializedDocuments(self) -> List[QDocumentHandle]:
+        return list(self._active.keys())
+
+    def setMaximumEditors(self, count: int):
+        self._maxEditors = max(1, count)
+        while len(self._active) > self._maxEditors:
+            self._freeEditors.append(self._evict(next(iter(self._active))))
+
+    def maximumEditors(self) -> int:
+        return self._maxEditors
+
+    def prewarm(self, count: int):
+        # creates editors ahead, e.g. while the application is idle
+        while len(self._freeEditors) + len(self._active) < min(count, self._maxEditors):
+            self._freeEditors.append(self._createEditor())
+
+    def editorFor(self, handle: QDocumentHandle) -> QCodeEditor:
+        editor = self._active.get(handle, None)
+        if editor is not None:
+            self._active.move_to_end(handle)
+            return editor
+        if self._freeEditors:
+            editor = self._freeEditors.pop()
+        elif len(self._active) < self._maxEditors:
+            editor = self._createEditor()
+        else:
+            editor = self._evict(next(iter(self._active)))
+        self._materialize(handle, editor)
+        self._active[handle] = editor
+        # noinspection PyUnresolvedReferences
+        self.editorMaterialized.emit(handle, editor)
+        return editor
+
+    def release(self, handle: QDocumentHandle):
+        # gives the editor of handle back to the pool
+        if handle in self._active:
+            self._freeEditors.append(self._evict(handle))
+
+    def _createEditor(self) -> QCodeEditor:
+        editor = QCodeEditor()
+        if self._style is not None:
+            editor.setSyntaxStyle(self._style)
+        return editor
+
+    def _materialize(self, handle: QDocumentHandle, editor: QCodeEditor):
+        editor.setHighlighter(
+            handle._highlighterFactory() if handle._highlighterFactory else None
+        )
+        editor.setCompleter(
+            handle._completerFactory() if handle._completerFactory else None
+        )
+        if handle._text is None and handle._path is not None:
+            editor.loadFromFile(handle._path, handle._encoding)
+        else:
+            editor.setPlainText(handle._text or "")
+            if handle._encoding is not None:
+                editor.setFileEncoding(handle._encoding, handle._bom)
+                editor.setFileNewline(handle._newline)
+        editor.document().setModified(handle._modified)
+        cursor = editor.textCursor()
+        lastPosition = editor.document().characterCount() - 1
+        cursor.setPosition(min(handle._cursorPosition, lastPosition))
+        editor.setTextCursor(cursor)
+        editor.verticalScrollBar().setValue(handle._scrollValue)
+        handle._editor = editor
+
+    def _evict(self, handle: QDocumentHandle) -> QCodeEditor:
+        editor = self._active.pop(handle)
+        # noinspection PyUnresolvedReferences
+        self.editorReleased.emit(handle, editor)
+        handle._modified = editor.document().isModified()
+        handle._cursorPosition = editor.textCursor().position()
+        handle._scrollValue = editor.verticalScrollBar().value()
+        handle._encoding = editor.fileEncoding()
+        handle._newline = editor.fileNewline()
+        handle._bom = editor.hasFileBom()
+        if handle._modified or handle._path is None:
+            handle._text = editor.toPlainText()
+        else:
+            # read again from the file when shown
+            handle._text = None
+        handle._editor = None
+        # the highlighting state and the text go with the document
+        editor.setHighlighter(None)
+        editor.setCompleter(None)
+        editor.setPlainText("")
+        return editor
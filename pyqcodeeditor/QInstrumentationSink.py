@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from qtpy.QtCore import QObject, Signal
+
+from . import instrumentation
+
+
+# noinspection PyPep8Naming
+class QInstrumentationSink(QObject):
+    # Emits the spans as a signal, e.g. for a live profiling view. Spans of worker
+    # threads (file I/O) are delivered through queued connections.
+
+    # instrumentation.Span
+    spanRecorded = Signal(object)
+
+    def __init__(self, parent: QObject | None = None, enable: bool = True):
+        super().__init__(parent)
+        if enable:
+            instrumentation.enable(self)
+        # noinspection PyUnresolvedReferences
+        self.destroyed.connect(self._onDestroyed)
+
+    def __call__(self, span: instrumentation.Span):
+        # noinspection PyUnresolvedReferences
+        self.spanRecorded.emit(span)
+
+    def _onDestroyed(self):
+        instrumentation.remove_sink(self)
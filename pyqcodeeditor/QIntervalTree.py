@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import bisect
+from typing import Any, Iterable, List, Tuple
+
+# Number of intervals stored in one leaf of the tree
+INTERVAL_LEAF_SIZE: int = 256
+
+# (start, end, data)
+_Interval = Tuple[int, int, Any]
+
+
+def _mapStart(position: int, edit: Tuple[int, int, int]) -> int:
+    editPosition, removed, added = edit
+    if position < editPosition:
+        return position
+    if position >= editPosition + removed:
+        return position - removed + added
+    # inside the removed text, text inserted at a boundary is not included
+    return editPosition + added
+
+
+def _mapEnd(position: int, edit: Tuple[int, int, int]) -> int:
+    editPosition, removed, added = edit
+    if position <= editPosition:
+        return position
+    if position >= editPosition + removed:
+        return position - removed + added
+    return editPosition
+
+
+class _Leaf(object):
+    __slots__ = ("offset", "maxEnd", "starts", "ends", "data")
+
+    def __init__(self, intervals: List[_Interval]):
+        # positions are stored relative to offset, so that moving a whole leaf
+        # after an edit is O(1)
+        self.offset: int = 0
+        self.starts: List[int] = [interval[0] for interval in intervals]
+        self.ends: List[int] = [interval[1] for interval in intervals]
+        self.data: List[Any] = [interval[2] for interval in intervals]
+        self.maxEnd: int = max(self.ends)
+
+    def intervals(self) -> List[_Interval]:
+        offset = self.offset
+        return [
+            (start + offset, end + offset, data)
+            for start, end, data in zip(self.starts, self.ends, self.data)
+        ]
+
+
+# noinspection PyPep8Naming
+class QIntervalTree(object):
+    # Two level tree: leaves hold up to INTERVAL_LEAF_SIZE intervals sorted by start,
+    # along with the maximum end under them, so that a range query skips all the
+    # leaves it does not overlap. Document edits move the leaves after the edit by
+    # changing their offset, only the leaves the edit overlaps are rewritten.
+
+    def __init__(self, intervals: Iterable[_Interval] = ()):
+        self._leaves: List[_Leaf] = []
+        self._count: int = 0
+        self.extend(intervals)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self):
+        self._leaves.clear()
+        self._count = 0
+
+    def insert(self, start: int, end: int, data: Any = None):
+        self.extend([(start, end, data)])
+
+    def extend(self, intervals: Iterable[_Interval]):
+        intervals = list(intervals)
+        if not intervals:
+            return
+        if len(intervals) * 8 < self._count:
+            for interval in intervals:
+                self._insertOne(interval)
+            return
+        self._build(self.items() + intervals)
+
+    def items(self) -> List[_Interval]:
+        result = []
+        for leaf in self._leaves:
+            result.extend(leaf.intervals())
+        return result
+
+    def overlapping(self, start: int, end: int) -> List[_Interval]:
+        # intervals intersecting [start, end], sorted by start
+        result = []
+        for leaf in self._leaves:
+            offset = leaf.offset
+            if leaf.starts[0] + offset > end:
+                break
+            if leaf.maxEnd + offset < start:
+                continue
+            ends = leaf.ends
+            data = leaf.data
+            starts = leaf.starts
+            for index in range(bisect.bisect_right(starts, end - offset)):
+                if ends[index] + offset >= start:
+                    result.append(
+                        (starts[index] + offset, ends[index] + offset, data[index])
+                    )
+        return result
+
+    def applyEdit(self, position: int, removed: int, added: int):
+        if removed == 0 and added == 0:
+            return
+        edit = (position, removed, added)
+        delta = added - removed
+        leaves = []
+        for leaf in self._leaves:
+            offset = leaf.offset
+            if leaf.maxEnd + offset < position:
+                leaves.append(leaf)
+            elif leaf.starts[0] + offset >= position + removed:
+                leaf.offset += delta
+                leaves.append(leaf)
+            else:
+                # the edit is inside the leaf, or some of its intervals span it
+                intervals = []
+                for start, end, data in leaf.intervals():
+                    newStart = _mapStart(start, edit)
+                    if start == end:
+                        intervals.append((newStart, newStart, data))
+                        continue
+                    newEnd = _mapEnd(end, edit)
+                    if newEnd > newStart:
+                        intervals.append((newStart, newEnd, data))
+                self._count -= len(leaf.starts) - len(intervals)
+                if intervals:
+                    leaves.append(_Leaf(intervals))
+        self._leaves = leaves
+
+    def _build(self, intervals: List[_Interval]):
+        intervals.sort(key=lambda interval: (interval[0], interval[1]))
+        self._leaves = [
+            _Leaf(intervals[index : index + INTERVAL_LEAF_SIZE])
+            for index in range(0, len(intervals), INTERVAL_LEAF_SIZE)
+        ]
+        self._count = len(intervals)
+
+    def _insertOne(self, interval: _Interval):
+        start, end, data = interval
+        leaves = self._leaves
+        index = 0
+        while index + 1 < len(leaves) and (
+            leaves[index + 1].starts[0] + leaves[index + 1].offset <= start
+        ):
+            index += 1
+        leaf = leaves[index]
+        position = bisect.bisect_right(leaf.starts, start - leaf.offset)
+        leaf.starts.insert(position, start - leaf.offset)
+        leaf.ends.insert(position, end - leaf.offset)
+        leaf.data.insert(position, data)
+        leaf.maxEnd = max(leaf.maxEnd, end - leaf.offset)
+        self._count += 1
+        if len(leaf.starts) > 2 * INTERVAL_LEAF_SIZE:
+            intervals = leaf.intervals()
+            middle = len(intervals) // 2
+            leaves[index : index + 1] = [
+                _Leaf(intervals[:middle]),
+                _Leaf(intervals[middle:]),
+            ]
@@ -0,0 +1,991 @@
+from __future__ import annotations
+
+import json
+import re
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, Tuple, Union
+
+from qtpy.QtCore import QObject, QTimer, Signal
+
+from . import QCodeEditor
+from .QDocumentChangeLog import QDocumentChange
+from .QTextSnapshot import QTextSnapshot
+from .highlighters.QJSONHighlighter import QJSONFoldingStrategy
+
+# Lines per chunk of the index, a chunk is split when it grows beyond twice this
+JSON_INDEX_CHUNK: int = 512
+# Edits of at most this many lines are indexed right away, larger ones in the worker
+JSON_INDEX_SYNC_LINES: int = 64
+# Time (in milliseconds) without edits before the worker indexes the dirty lines
+JSON_INDEX_DELAY: int = 50
+
+# Strings (possibly unterminated) and structural characters of a line
+_TOKEN_REGEX = re.compile(r'"(?:[^"\\]|\\.)*"?|[{}\[\],:]')
+_STRING_REGEX = re.compile(r'"(?:[^"\\]|\\.)*"?')
+_STRUCTURE_REGEX = re.compile(r"[{}\[\],]")
+_PATH_REGEX = re.compile(
+    r'\s*(?:\.?([A-Za-z_$][\w$]*)|\[\s*(\d+)\s*\]|\[\s*("(?:[^"\\]|\\.)*")\s*\])'
+)
+# lowest depth of an unused chunk of the tree, never matches a search
+_NO_DEPTH: int = 1 << 62
+
+JSONPath = List[Union[str, int]]
+
+_indexExecutor: ThreadPoolExecutor | None = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _indexExecutor
+    if _indexExecutor is None:
+        _indexExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="QJSONIndex"
+        )
+    return _indexExecutor
+
+
+def _lineSummary(text: str) -> Tuple[int, int, int]:
+    # (depth change, lowest depth reached relative to the start, commas at the
+    # lowest depth) of a line
+    if "{" not in text and "}" not in text and "[" not in text and "]" not in text:
+        if "," not in text:
+            return 0, 0, 0
+        if '"' in text:
+            text = _STRING_REGEX.sub("", text)
+        return 0, 0, text.count(",")
+    if '"' in text:
+        tokens = _TOKEN_REGEX.findall(text)
+    else:
+        tokens = _STRUCTURE_REGEX.findall(text)
+    depth = 0
+    lowest = 0
+    commas = 0
+    for token in tokens:
+        if token == "{" or token == "[":
+            depth += 1
+        elif token == "}" or token == "]":
+            depth -= 1
+            if depth < lowest:
+                lowest = depth
+                commas = 0
+        elif token == "," and depth == lowest:
+            commas += 1
+    return depth, lowest, commas
+
+
+def _scanLines(
+    snapshot: QTextSnapshot, first: int, last: int
+) -> Tuple[List[int], List[int], List[int]]:
+    # Runs in the worker
+    deltas = []
+    lows = []
+    commas = []
+    for line in snapshot.lines(first, last):
+        delta, lowest, count = _lineSummary(line)
+        deltas.append(delta)
+        lows.append(lowest)
+        commas.append(count)
+    return deltas, lows, commas
+
+
+def _tokens(text: str) -> List[Tuple[int, str]]:
+    # (column, token) of the strings and structural characters of a line
+    return [(match.start(), match.group()) for match in _TOKEN_REGEX.finditer(text)]
+
+
+def _keyText(token: str) -> str:
+    try:
+        return json.loads(token)
+    except ValueError:
+        return token.strip('"')
+
+
+def formatPath(path: JSONPath) -> str:
+    # e.g. $.items[3].name, for breadcrumbs
+    parts = ["$"]
+    for part in path:
+        if isinstance(part, int):
+            parts.append(f"[{part}]")
+        elif re.fullmatch(r"[A-Za-z_$][\w$]*", part):
+            parts.append(f".{part}")
+        else:
+            parts.append(f"[{json.dumps(part)}]")
+    return "".join(parts)
+
+
+def parsePath(text: str) -> JSONPath | None:
+    # inverse of formatPath(), the leading $ is optional
+    text = text.strip()
+    if text.startswith("$"):
+        text = text[1:]
+    path = []
+    position = 0
+    while position < len(text):
+        match = _PATH_REGEX.match(text, position)
+        if match is None or match.end() == position:
+            return None
+        key, index, quoted = match.groups()
+        if index is not None:
+            path.append(int(index))
+        else:
+            path.append(key if key is not None else _keyText(quoted))
+        position = match.end()
+    return path
+
+
+# noinspection PyPep8Naming
+class QJSONIndex(QObject):
+    # Structural index of a JSON document: the depth change and the lowest depth of
+    # each line, in chunks of lines whose depths are summed up in a segment tree.
+    # Finding the line where a container is closed (or opened), the depth of a line
+    # or the containers around a position costs O(log n) plus the scan of one chunk,
+    # the tokens of a line are read from the document when needed. The commas at
+    # the lowest depth of each line are counted too, which gives the index of an
+    # array element in O(log n). An edit only rescans the edited lines: right away
+    # when they are few, in a worker otherwise. Member keys are found by walking the
+    # members of their object, nested containers are jumped over. The tokens of a
+    # line are scanned whole, a minified document on one line gains little.
+
+    # the index is up to date
+    indexUpdated = Signal()
+    # generation, window, result; emitted from the worker thread
+    _scanned = Signal(int, object, object)
+
+    def __init__(
+        self,
+        editor: QCodeEditor.QCodeEditor | None = None,
+        parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+
+        self._editor: QCodeEditor.QCodeEditor | None = None
+        # per chunk, depth change, lowest depth and commas at this depth of each line
+        self._deltas: List[List[int]] = [[0]]
+        self._lows: List[List[int]] = [[0]]
+        self._commas: List[List[int]] = [[0]]
+        # segment tree over the chunks: lines, depth change, lowest depth and commas
+        # at the lowest depth
+        self._treeSize: int = 1
+        self._lineCounts: List[int] = []
+        self._depthSums: List[int] = []
+        self._lowest: List[int] = []
+        self._lowestCommas: List[int] = []
+        # lines not indexed yet [first, last], empty when first > last
+        self._dirtyFirst: int = 0
+        self._dirtyLast: int = -1
+        self._generation: int = 0
+        self._future: Future | None = None
+        self._foldingStrategy: QJSONFoldingStrategy | None = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(JSON_INDEX_DELAY)
+        # noinspection PyUnresolvedReferences
+        self._timer.timeout.connect(self._scanDirtyLines)
+        # noinspection PyUnresolvedReferences
+        self._scanned.connect(self._onScanned)
+
+        self._rebuildTree()
+        if editor is not None:
+            self.setEditor(editor)
+
+    def setEditor(self, editor: QCodeEditor.QCodeEditor | None):
+        if self._editor is not None:
+            # noinspection PyUnresolvedReferences
+            self._editor.changeLog().changed.disconnect(self._onChanged)
+            # noinspection PyUnresolvedReferences
+            self._editor.highlighterChanged.disconnect(self._onHighlighterChanged)
+            self._onHighlighterChanged(None)
+        self._editor = editor
+        if editor is None:
+            return
+        # noinspection PyUnresolvedReferences
+        editor.changeLog().changed.connect(self._onChanged)
+        # noinspection PyUnresolvedReferences
+        editor.highlighterChanged.connect(self._onHighlighterChanged)
+        self._onHighlighterChanged(editor.highlighter())
+        self._reset()
+
+    def editor(self) -> QCodeEditor.QCodeEditor | None:
+        return self._editor
+
+    def isPending(self) -> bool:
+        # results may be wrong for the lines the worker has not indexed yet
+        return self._dirtyFirst <= self._dirtyLast
+
+    def lineCount(self) -> int:
+        return self._lineCounts[1]
+
+    def lineDepth(self, line: int) -> int:
+        # nesting depth at the start of line
+        chunk, offset, depth, _ = self._locate(line)
+        return depth + sum(self._deltas[chunk][:offset])
+
+    def depthAt(self, position: int) -> int:
+        # nesting depth before the character at position
+        line, column, text = self._lineOf(position)
+        depth = self.lineDepth(line)
+        for tokenColumn, token in _tokens(text):
+            if tokenColumn >= column:
+                break
+            depth += _tokenDepth(token)
+        return depth
+
+    def matchingBracket(self, position: int) -> int | None:
+        # position of the bracket matching the one at position
+        line, column, text = self._lineOf(position)
+        depth = self.lineDepth(line)
+        for tokenColumn, token in _tokens(text):
+            if tokenColumn == column:
+                if token == "{" or token == "[":
+                    return self._findClosing(line, column, depth)
+                if token == "}" or token == "]":
+                    return self._findOpening(line, column, depth - 1)
+                return None
+            if tokenColumn > column:
+                return None
+            depth += _tokenDepth(token)
+        return None
+
+    def containers(self, position: int) -> List[int]:
+        # positions of the brackets opening the containers around position, the
+        # outermost first
+        line, column, _ = self._lineOf(position)
+        openers = []
+        depth = self.depthAt(position)
+        while depth > 0:
+            opener = self._findOpening(line, column, depth - 1)
+            if opener is None:
+                break
+            openers.append(opener)
+            line, column, _ = self._lineOf(opener)
+            depth -= 1
+        openers.reverse()
+        return openers
+
+    def containerAt(self, position: int) -> Tuple[int, int] | None:
+        # (opening, closing) bracket positions of the innermost container
+        line, column, _ = self._lineOf(position)
+        depth = self.depthAt(position)
+        if depth <= 0:
+            return None
+        opener = self._findOpening(line, column, depth - 1)
+        if opener is None:
+            return None
+        closer = self.matchingBracket(opener)
+        return opener, closer if closer is not None else -1
+
+    def foldRegionEnd(self, line: int) -> int:
+        # last line folded with line (the line closing the region stays visible), or
+        # -1; as QBraceFoldingStrategy.regionEnd() without walking the lines
+        if not 0 <= line < self.lineCount():
+            return -1
+        chunk, offset, _, _ = self._locate(line)
+        delta = self._deltas[chunk][offset]
+        lowest = self._lows[chunk][offset]
+        if delta - lowest <= 0:
+            return -1
+        closing = self._firstLine(line + 1, self.lineDepth(line) + lowest)
+        if closing < 0:
+            return -1
+        end = closing - 1
+        return end if end > line else -1
+
+    def path(self, position: int) -> JSONPath:
+        # keys and indices leading to the member or element at position
+        openers = self.containers(position)
+        document = self._editor.document()
+        path = []
+        for i, opener in enumerate(openers):
+            inner = openers[i + 1] if i + 1 < len(openers) else position
+            tokens = self._levelTokens(opener, inner, backward=True)
+            if document.characterAt(opener) == "{":
+                key = None
+                follower = None
+                for _, token in tokens:
+                    if token == ",":
+                        break
+                    if follower == ":" and token[:1] == '"':
+                        key = _keyText(token)
+                        break
+                    follower = token
+                if key is None:
+                    break
+                path.append(key)
+            else:
+                path.append(self._elementIndex(opener, inner))
+        return path
+
+    def findPath(self, path: JSONPath | str) -> int | None:
+        # position of the value at path, e.g. "$.items[3].name"
+        if isinstance(path, str):
+            path = parsePath(path)
+            if path is None:
+                return None
+        document = self._editor.document()
+        target = self._firstToken()
+        for part in path:
+            if target is None or document.characterAt(target) not in "{[":
+                return None
+            target = self._findMember(target, part)
+            if target is not None:
+                target = self._memberValue(target, isinstance(part, str))
+        return target
+
+    def _onHighlighterChanged(self, highlighter):
+        # regions of QJSONFoldingStrategy are found with the index
+        if self._foldingStrategy is not None:
+            self._foldingStrategy.setStructuralIndex(None)
+        strategy = highlighter.foldingStrategy() if highlighter is not None else None
+        if isinstance(strategy, QJSONFoldingStrategy):
+            strategy.setStructuralIndex(self)
+            self._foldingStrategy = strategy
+        else:
+            self._foldingStrategy = None
+
+    def _reset(self):
+        count = self._editor.document().blockCount()
+        self._splice(0, self.lineCount() - 1, [0] * count, [0] * count, [0] * count)
+        self._dirtyFirst = 0
+        self._dirtyLast = -1
+        self._markDirty(0, count - 1)
+
+    def _markDirty(self, first: int, last: int):
+        self._generation += 1
+        if self._dirtyFirst > self._dirtyLast:
+            self._dirtyFirst = first
+            self._dirtyLast = last
+        else:
+            self._dirtyFirst = min(self._dirtyFirst, first)
+            self._dirtyLast = max(self._dirtyLast, last)
+        self._timer.start()
+
+    def _onChanged(self, change: QDocumentChange):
+        first = change.firstBlock
+        last = change.lastBlock
+        oldLast = last - change.blockDelta
+        count = last - first + 1
+        if self._future is not None:
+            # the window of the job in flight is in the line numbers before the edit,
+            # its result is dropped and the lines scanned again
+            self._generation += 1
+
+        if self._dirtyFirst <= self._dirtyLast:
+            # move the pending dirty lines along with the edit
+            def move(line: int, lower: bool) -> int:
+                if line < first:
+                    return line
+                if line > oldLast:
+                    return line + change.blockDelta
+                return first if lower else last
+
+            self._dirtyFirst = move(self._dirtyFirst, True)
+            self._dirtyLast = move(self._dirtyLast, False)
+
+        if count > JSON_INDEX_SYNC_LINES:
+            self._splice(first, oldLast, [0] * count, [0] * count, [0] * count)
+            self._markDirty(first, last)
+            return
+        deltas = []
+        lows = []
+        commas = []
+        block = self._editor.document().findBlockByNumber(first)
+        for _ in range(count):
+            delta, lowest, commaCount = _lineSummary(block.text())
+            deltas.append(delta)
+            lows.append(lowest)
+            commas.append(commaCount)
+            block = block.next()
+        self._splice(first, oldLast, deltas, lows, commas)
+        if not self.isPending():
+            # noinspection PyUnresolvedReferences
+            self.indexUpdated.emit()
+
+    def _scanDirtyLines(self):
+        if self._editor is None or self._dirtyFirst > self._dirtyLast:
+            return
+        if self._future is not None and not self._future.done():
+            # one job at a time, the next one starts when this one is done
+            return
+        window = (self._dirtyFirst, self._dirtyLast)
+        generation = self._generation
+        future = _executor().submit(_scanLines, self._editor.snapshot(), *window)
+
+        def done(f: Future):
+            error = f.exception()
+            try:
+                # noinspection PyUnresolvedReferences
+                self._scanned.emit(generation, window, error if error else f.result())
+            except RuntimeError:
+                # the object has been deleted meanwhile
+                pass
+
+        future.add_done_callback(done)
+        self._future = future
+
+    def _onScanned(self, generation: int, window: Tuple[int, int], result):
+        self._future = None
+        if isinstance(result, BaseException):
+            warnings.warn(f"Can't index the JSON document: {result}")
+            return
+        if generation != self._generation:
+            # edited meanwhile, the lines are scanned again
+            self._timer.start()
+            return
+        first, last = window
+        self._splice(first, last, *result)
+        self._dirtyFirst = 0
+        self._dirtyLast = -1
+        # noinspection PyUnresolvedReferences
+        self.indexUpdated.emit()
+
+    def _splice(
+        self,
+        first: int,
+        last: int,
+        deltas: List[int],
+        lows: List[int],
+        commas: List[int],
+    ):
+        # replaces the lines first..last
+        firstChunk, firstOffset, _, _ = self._locate(first)
+        lastChunk, lastOffset, _, _ = self._locate(last)
+        if last < first:
+            # insertion before first
+            lastChunk, lastOffset = firstChunk, firstOffset - 1
+        chunkDeltas = (
+            self._deltas[firstChunk][:firstOffset]
+            + deltas
+            + self._deltas[lastChunk][lastOffset + 1 :]
+        )
+        chunkLows = (
+            self._lows[firstChunk][:firstOffset]
+            + lows
+            + self._lows[lastChunk][lastOffset + 1 :]
+        )
+        chunkCommas = (
+            self._commas[firstChunk][:firstOffset]
+            + commas
+            + self._commas[lastChunk][lastOffset + 1 :]
+        )
+        if firstChunk == lastChunk and 0 < len(chunkDeltas) <= 2 * JSON_INDEX_CHUNK:
+            self._deltas[firstChunk] = chunkDeltas
+            self._lows[firstChunk] = chunkLows
+            self._commas[firstChunk] = chunkCommas
+            self._updateChunk(firstChunk)
+            return
+        step = JSON_INDEX_CHUNK
+        self._deltas[firstChunk : lastChunk + 1] = [
+            chunkDeltas[i : i + step] for i in range(0, len(chunkDeltas), step)
+        ]
+        self._lows[firstChunk : lastChunk + 1] = [
+            chunkLows[i : i + step] for i in range(0, len(chunkLows), step)
+        ]
+        self._commas[firstChunk : lastChunk + 1] = [
+            chunkCommas[i : i + step] for i in range(0, len(chunkCommas), step)
+        ]
+        if not self._deltas:
+            self._deltas.append([0])
+            self._lows.append([0])
+            self._commas.append([0])
+        self._rebuildTree()
+
+    @staticmethod
+    def _chunkSummary(
+        deltas: List[int], lows: List[int], commas: List[int]
+    ) -> Tuple[int, int, int, int]:
+        depth = 0
+        lowest = _NO_DEPTH
+        lowestCommas = 0
+        for delta, low, count in zip(deltas, lows, commas):
+            if depth + low < lowest:
+                lowest = depth + low
+                lowestCommas = count
+            elif depth + low == lowest:
+                lowestCommas += count
+            depth += delta
+        return len(deltas), depth, lowest, lowestCommas
+
+    def _rebuildTree(self):
+        size = 1
+        while size < len(self._deltas):
+            size *= 2
+        self._treeSize = size
+        self._lineCounts = [0] * (2 * size)
+        self._depthSums = [0] * (2 * size)
+        self._lowest = [_NO_DEPTH] * (2 * size)
+        self._lowestCommas = [0] * (2 * size)
+        for chunk in range(len(self._deltas)):
+            self._setLeaf(chunk)
+        for node in range(size - 1, 0, -1):
+            self._combine(node)
+
+    def _updateChunk(self, chunk: int):
+        node = self._setLeaf(chunk) // 2
+        while node:
+            self._combine(node)
+            node //= 2
+
+    def _setLeaf(self, chunk: int) -> int:
+        node = self._treeSize + chunk
+        (
+            self._lineCounts[node],
+            self._depthSums[node],
+            self._lowest[node],
+            self._lowestCommas[node],
+        ) = self._chunkSummary(
+            self._deltas[chunk], self._lows[chunk], self._commas[chunk]
+        )
+        return node
+
+    def _combine(self, node: int):
+        left = 2 * node
+        right = left + 1
+        self._lineCounts[node] = self._lineCounts[left] + self._lineCounts[right]
+        self._depthSums[node] = self._depthSums[left] + self._depthSums[right]
+        leftLowest = self._lowest[left]
+        rightLowest = self._depthSums[left] + self._lowest[right]
+        if leftLowest < rightLowest:
+            self._lowest[node] = leftLowest
+            self._lowestCommas[node] = self._lowestCommas[left]
+        elif rightLowest < leftLowest:
+            self._lowest[node] = rightLowest
+            self._lowestCommas[node] = self._lowestCommas[right]
+        else:
+            self._lowest[node] = leftLowest
+            self._lowestCommas[node] = (
+                self._lowestCommas[left] + self._lowestCommas[right]
+            )
+
+    def _locate(self, line: int) -> Tuple[int, int, int, int]:
+        # (chunk, line in the chunk, depth at the start of the chunk, its first line)
+        line = max(0, min(line, self.lineCount() - 1))
+        node = 1
+        depth = 0
+        start = 0
+        while node < self._treeSize:
+            left = 2 * node
+            if line - start < self._lineCounts[left]:
+                node = left
+            else:
+                start += self._lineCounts[left]
+                depth += self._depthSums[left]
+                node = left + 1
+        return node - self._treeSize, line - start, depth, start
+
+    def _firstLine(self, line: int, target: int) -> int:
+        # first line from line whose depth gets as low as target, or -1
+        if line >= self.lineCount():
+            return -1
+        chunk, offset, depth, start = self._locate(line)
+        deltas = self._deltas[chunk]
+        lows = self._lows[chunk]
+        depth += sum(deltas[:offset])
+        for i in range(offset, len(deltas)):
+            if depth + lows[i] <= target:
+                return start + i
+            depth += deltas[i]
+        found = self._firstChunk(1, 0, self._treeSize, chunk + 1, 0, 0, target)
+        if found is None:
+            return -1
+        chunk, depth, start = found
+        deltas = self._deltas[chunk]
+        lows = self._lows[chunk]
+        for i in range(len(deltas)):
+            if depth + lows[i] <= target:
+                return start + i
+            depth += deltas[i]
+        return -1
+
+    def _lastLine(self, line: int, target: int) -> int:
+        # last line up to line whose depth gets as low as target, or -1
+        if line < 0:
+            return -1
+        chunk, offset, depth, start = self._locate(line)
+        deltas = self._deltas[chunk]
+        lows = self._lows[chunk]
+        depths = [depth]
+        for delta in deltas[:offset]:
+            depths.append(depths[-1] + delta)
+        for i in range(offset, -1, -1):
+            if depths[i] + lows[i] <= target:
+                return start + i
+        found = self._lastChunk(1, 0, self._treeSize, chunk - 1, 0, 0, target)
+        if found is None:
+            return -1
+        chunk, depth, start = found
+        deltas = self._deltas[chunk]
+        lows = self._lows[chunk]
+        depths = [depth]
+        for delta in deltas[:-1]:
+            depths.append(depths[-1] + delta)
+        for i in range(len(deltas) - 1, -1, -1):
+            if depths[i] + lows[i] <= target:
+                return start + i
+        return -1
+
+    def _firstChunk(
+        self,
+        node: int,
+        low: int,
+        high: int,
+        first: int,
+        depth: int,
+        line: int,
+        target: int,
+    ) -> Tuple[int, int, int] | None:
+        # first chunk from first whose depth gets as low as target: (chunk, depth at
+        # its start, its first line); depth and line are at the start of node
+        if high <= first or (low >= first and depth + self._lowest[node] > target):
+            return None
+        if node >= self._treeSize:
+            return low, depth, line
+        middle = (low + high) // 2
+        left = 2 * node
+        found = self._firstChunk(left, low, middle, first, depth, line, target)
+        if found is not None:
+            return found
+        return self._firstChunk(
+            left + 1,
+            middle,
+            high,
+            first,
+            depth + self._depthSums[left],
+            line + self._lineCounts[left],
+            target,
+        )
+
+    def _lastChunk(
+        self,
+        node: int,
+        low: int,
+        high: int,
+        last: int,
+        depth: int,
+        line: int,
+        target: int,
+    ) -> Tuple[int, int, int] | None:
+        # last chunk up to last whose depth gets as low as target
+        if low > last or (high - 1 <= last and depth + self._lowest[node] > target):
+            return None
+        if node >= self._treeSize:
+            return low, depth, line
+        middle = (low + high) // 2
+        left = 2 * node
+        found = self._lastChunk(
+            left + 1,
+            middle,
+            high,
+            last,
+            depth + self._depthSums[left],
+            line + self._lineCounts[left],
+            target,
+        )
+        if found is not None:
+            return found
+        return self._lastChunk(left, low, middle, last, depth, line, target)
+
+    def _lineOf(self, position: int) -> Tuple[int, int, str]:
+        block = self._editor.document().findBlock(position)
+        return block.blockNumber(), position - block.position(), block.text()
+
+    def _linePosition(self, line: int) -> Tuple[int, str]:
+        block = self._editor.document().findBlockByNumber(line)
+        return block.position(), block.text()
+
+    def _findClosing(self, line: int, column: int, target: int) -> int | None:
+        # the bracket after column bringing the depth back to target
+        position, text = self._linePosition(line)
+        depth = self.lineDepth(line)
+        for tokenColumn, token in _tokens(text):
+            depth += _tokenDepth(token)
+            if tokenColumn > column and depth <= target:
+                return position + tokenColumn
+        line = self._firstLine(line + 1, target)
+        if line < 0:
+            return None
+        position, text = self._linePosition(line)
+        depth = self.lineDepth(line)
+        for tokenColumn, token in _tokens(text):
+            depth += _tokenDepth(token)
+            if depth <= target:
+                return position + tokenColumn
+        return None
+
+    def _findOpening(self, line: int, column: int, target: int) -> int | None:
+        # the bracket before column opening the container entered from depth target
+        position, text = self._linePosition(line)
+        opener = self._lastOpening(line, text, target, column)
+        if opener is not None:
+            return position + opener
+        line = self._lastLine(line - 1, target)
+        if line < 0:
+            return None
+        position, text = self._linePosition(line)
+        opener = self._lastOpening(line, text, target, len(text))
+        return position + opener if opener is not None else None
+
+    def _lastOpening(
+        self, line: int, text: str, target: int, column: int
+    ) -> int | None:
+        # column of the last token before column entered at a depth up to target, an
+        # opening bracket when the depth at column is deeper
+        depth = self.lineDepth(line)
+        found = None
+        for tokenColumn, token in _tokens(text):
+            if tokenColumn >= column:
+                break
+            if depth <= target:
+                found = tokenColumn if token == "{" or token == "[" else None
+            depth += _tokenDepth(token)
+        return found
+
+    def _firstToken(self) -> int | None:
+        # position of the first token of the document, the root value
+        block = self._editor.document().firstBlock()
+        while block.isValid():
+            tokens = _tokens(block.text())
+            if tokens:
+                return block.position() + tokens[0][0]
+            block = block.next()
+        return None
+
+    def _skipSpace(self, position: int) -> int:
+        document = self._editor.document()
+        end = document.characterCount() - 1
+        while position < end and document.characterAt(position).isspace():
+            position += 1
+        return position
+
+    def _findMember(self, container: int, part: str | int) -> int | None:
+        # position of the key or of the element part of container
+        kind = self._editor.document().characterAt(container)
+        if kind == "{" and isinstance(part, str):
+            previous = None
+            for position, token in self._levelTokens(container):
+                if token == ":" and previous is not None and previous[1][:1] == '"':
+                    if _keyText(previous[1]) == part:
+                        return previous[0]
+                previous = (position, token)
+            return None
+        if kind != "[" or not isinstance(part, int) or part < 0:
+            return None
+        if part == 0:
+            start = container
+        else:
+            start = self._elementComma(container, part)
+            if start is None:
+                return None
+        position = self._skipSpace(start + 1)
+        if self._editor.document().characterAt(position) in "]":
+            # empty array or trailing comma
+            return None
+        return position
+
+    def _elementIndex(self, opener: int, position: int) -> int:
+        # number of commas of the array opened at opener before position
+        level = self.depthAt(opener) + 1
+        openerLine, openerColumn, text = self._lineOf(opener)
+        line, column, lineText = self._lineOf(position)
+        depth = self.lineDepth(openerLine)
+        if line == openerLine:
+            return self._lineCommas(text, depth, level, openerColumn + 1, column)[0]
+        index = self._lineCommas(text, depth, level, openerColumn + 1, len(text))[0]
+        index += self._commasBetween(openerLine + 1, line - 1, level)
+        index += self._lineCommas(lineText, self.lineDepth(line), level, 0, column)[0]
+        return index
+
+    def _elementComma(self, opener: int, index: int) -> int | None:
+        # position of the comma ending the element index - 1 of the array opened at
+        # opener, the lines holding it are found by bisection
+        level = self.depthAt(opener) + 1
+        openerLine, openerColumn, text = self._lineOf(opener)
+        closer = self.matchingBracket(opener)
+        closerLine = self._lineOf(closer)[0] if closer is not None else self.lineCount()
+        position, _ = self._linePosition(openerLine)
+        end = len(text) if closerLine > openerLine else closer - position
+        count, comma = self._lineCommas(
+            text, self.lineDepth(openerLine), level, openerColumn + 1, end, index
+        )
+        if comma >= 0:
+            return position + comma
+        # first line between the brackets where the count reaches index
+        low = openerLine + 1
+        high = closerLine
+        while low < high:
+            middle = (low + high) // 2
+            if count + self._commasBetween(openerLine + 1, middle, level) >= index:
+                high = middle
+            else:
+                low = middle + 1
+        if low >= self.lineCount():
+            return None
+        count += self._commasBetween(openerLine + 1, low - 1, level)
+        position, text = self._linePosition(low)
+        end = closer - position if low == closerLine else len(text)
+        _, comma = self._lineCommas(
+            text, self.lineDepth(low), level, 0, end, index - count
+        )
+        return position + comma if comma >= 0 else None
+
+    @staticmethod
+    def _lineCommas(
+        text: str, depth: int, level: int, start: int, end: int, nth: int = 0
+    ) -> Tuple[int, int]:
+        # (commas at depth level between the columns start and end, column of the
+        # nth one or -1)
+        count = 0
+        for column, token in _tokens(text):
+            if column >= end:
+                break
+            if column >= start and token == "," and depth == level:
+                count += 1
+                if count == nth:
+                    return count, column
+            depth += _tokenDepth(token)
+        return count, -1
+
+    def _commasBetween(self, first: int, last: int, level: int) -> int:
+        # commas at depth level in the lines first..last, which are at this depth or
+        # deeper (the lines inside a container)
+        if last < first:
+            return 0
+        firstChunk, firstOffset, depth, _ = self._locate(first)
+        lastChunk, lastOffset, lastDepth, _ = self._locate(last)
+        depth += sum(self._deltas[firstChunk][:firstOffset])
+        if firstChunk == lastChunk:
+            return self._chunkCommas(firstChunk, firstOffset, lastOffset, depth, level)
+        count = self._chunkCommas(
+            firstChunk, firstOffset, len(self._deltas[firstChunk]) - 1, depth, level
+        )
+        count += self._rangeCommas(
+            1, 0, self._treeSize, firstChunk + 1, lastChunk - 1, 0, level
+        )
+        return count + self._chunkCommas(lastChunk, 0, lastOffset, lastDepth, level)
+
+    def _chunkCommas(
+        self, chunk: int, first: int, last: int, depth: int, level: int
+    ) -> int:
+        deltas = self._deltas[chunk]
+        lows = self._lows[chunk]
+        commas = self._commas[chunk]
+        count = 0
+        for i in range(first, last + 1):
+            if depth + lows[i] == level:
+                count += commas[i]
+            depth += deltas[i]
+        return count
+
+    def _rangeCommas(
+        self,
+        node: int,
+        low: int,
+        high: int,
+        first: int,
+        last: int,
+        depth: int,
+        level: int,
+    ) -> int:
+        # commas at depth level in the chunks first..last
+        if high <= first or low > last or depth + self._lowest[node] > level:
+            return 0
+        if first <= low and high - 1 <= last:
+            return (
+                self._lowestCommas[node] if depth + self._lowest[node] == level else 0
+            )
+        middle = (low + high) // 2
+        left = 2 * node
+        return self._rangeCommas(
+            left, low, middle, first, last, depth, level
+        ) + self._rangeCommas(
+            left + 1, middle, high, first, last, depth + self._depthSums[left], level
+        )
+
+    def _memberValue(self, position: int, isKey: bool) -> int | None:
+        # position of the value of the key (or the element) at position
+        if not isKey:
+            return position
+        document = self._editor.document()
+        block = document.findBlock(position)
+        while block.isValid():
+            for column, token in _tokens(block.text()):
+                if block.position() + column > position:
+                    if token != ":":
+                        return None
+                    return self._skipSpace(block.position() + column + 1)
+            block = block.next()
+        return None
+
+    def _levelTokens(
+        self, start: int, end: int | None = None, backward: bool = False
+    ) -> Iterator[Tuple[int, str]]:
+        # Tokens of the container opened at start, up to its closing bracket or end.
+        # A nested container is one "{}" or "[]" token at the position of its
+        # opening bracket, it is jumped over.
+        if backward:
+            yield from self._levelTokensBackward(start, end)
+            return
+        document = self._editor.document()
+        block = document.findBlock(start)
+        limit = start
+        while block.isValid():
+            blockStart = block.position()
+            jumped = False
+            for column, token in _tokens(block.text()):
+                position = blockStart + column
+                if position <= limit:
+                    continue
+                if end is not None and position >= end:
+                    return
+                if token == "}" or token == "]":
+                    return
+                if token == "{" or token == "[":
+                    closer = self.matchingBracket(position)
+                    yield position, "{}" if token == "{" else "[]"
+                    if closer is None:
+                        return
+                    limit = closer
+                    if closer >= blockStart + block.length():
+                        block = document.findBlock(closer)
+                        jumped = True
+                        break
+                    continue
+                yield position, token
+            if not jumped:
+                block = block.next()
+
+    def _levelTokensBackward(self, start: int, end: int) -> Iterator[Tuple[int, str]]:
+        document = self._editor.document()
+        block = document.findBlock(end)
+        limit = end
+        while block.isValid() and block.position() + block.length() > start:
+            blockStart = block.position()
+            jumped = False
+            for column, token in reversed(_tokens(block.text())):
+                position = blockStart + column
+                if position >= limit:
+                    continue
+                if position <= start:
+                    return
+                if token == "}" or token == "]":
+                    opener = self.matchingBracket(position)
+                    if opener is None or opener <= start:
+                        return
+                    yield opener, "{}" if token == "}" else "[]"
+                    limit = opener
+                    if opener < blockStart:
+                        block = document.findBlock(opener)
+                        jumped = True
+                        break
+                    continue
+                yield position, token
+            if not jumped:
+                block = block.previous()
+
+
+def _tokenDepth(token: str) -> int:
+    if token == "{" or token == "[":
+        return 1
+    if token == "}" or token == "]":
+        return -1
+    return 0
@@ -0,0 +1,462 @@
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import threading
+import warnings
+from array import array
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+from qtpy.QtCore import QPointF, QRect, QSize, Qt, Signal
+from qtpy.QtGui import (
+    QFontDatabase,
+    QKeyEvent,
+    QMouseEvent,
+    QPaintEvent,
+    QPainter,
+    QResizeEvent,
+    QTextLayout,
+    QTextOption,
+)
+from qtpy.QtWidgets import QAbstractScrollArea, QAbstractSlider, QWidget
+
+from .QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+from .QSyntaxStyle import QSyntaxStyle
+
+# Size (in bytes) of the file blocks whose line counts are indexed. Finding a line
+# scans at most one block, the index takes 8 bytes per block.
+LARGE_FILE_INDEX_BLOCK: int = 1 << 16
+# Number of blocks read at once and counted between two progress reports
+LARGE_FILE_PROGRESS_BLOCKS: int = 512
+# Lines longer than this (in characters) are displayed truncated
+LARGE_FILE_LINE_LIMIT: int = 10000
+# Number of decoded and highlighted lines kept for repaints and scrolling
+LARGE_FILE_CACHE_LINES: int = 1024
+
+# (text, format ranges) of a displayed line
+_LineData = Tuple[str, List[QTextLayout.FormatRange]]
+
+
+# noinspection PyPep8Naming
+class _LineIndex(object):
+    # Number of "\n" before each block of the mapped file. Only plain data, it is
+    # built in a background thread and read from the GUI thread.
+
+    def __init__(self, path: str, data: mmap.mmap | bytes):
+        self.path: str = path
+        self.data: mmap.mmap | bytes = data
+        self.size: int = len(data)
+        # blockLines[i] is the number of lines ending before block i
+        self.blockLines: array = array("q", [0])
+        self.done: bool = self.size == 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, progress: Callable[[], None]):
+        if self.done:
+            return
+        self._thread = threading.Thread(
+            target=self._build,
+            args=(progress,),
+            name="QLargeFileViewerIndex",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _build(self, progress: Callable[[], None]):
+        # The file is read rather than the mapping, the pages mapped by the scan
+        # would stay in the resident memory of the process
+        blockLines = self.blockLines
+        lines = 0
+        block = 0
+        buffer = bytearray(LARGE_FILE_INDEX_BLOCK * LARGE_FILE_PROGRESS_BLOCKS)
+        try:
+            with open(self.path, "rb", buffering=0) as file:
+                while block * LARGE_FILE_INDEX_BLOCK < self.size:
+                    if self._stop.is_set():
+                        return
+                    size = file.readinto(buffer)
+                    if not size:
+                        break
+                    size = min(size, self.size - block * LARGE_FILE_INDEX_BLOCK)
+                    for start in range(0, size, LARGE_FILE_INDEX_BLOCK):
+                        end = min(size, start + LARGE_FILE_INDEX_BLOCK)
+                        lines += buffer.count(b"\n", start, end)
+                        blockLines.append(lines)
+                        block += 1
+                    progress()
+        except OSError as e:
+            warnings.warn(f"Can't index {self.path}: {e}")
+        self.done = True
+        progress()
+
+    def indexedBytes(self) -> int:
+        return min(self.size, (len(self.blockLines) - 1) * LARGE_FILE_INDEX_BLOCK)
+
+    def lineCount(self) -> int:
+        # lines whose end is known
+        if self.done:
+            return self.blockLines[-1] + 1
+        return self.blockLines[-1]
+
+    def lineStart(self, line: int) -> int:
+        # offset of the first byte of a 0-based line, -1 when not indexed yet
+        if line <= 0:
+            return 0
+        blockLines = self.blockLines
+        count = len(blockLines)
+        if line > blockLines[count - 1]:
+            return -1
+        # the block holding the line-th "\n"
+        block = bisect.bisect_left(blockLines, line, 0, count) - 1
+        position = block * LARGE_FILE_INDEX_BLOCK - 1
+        for _ in range(line - blockLines[block]):
+            position = self.data.find(b"\n", position + 1)
+        return position + 1
+
+    def readLine(self, start: int, limit: int) -> bytes:
+        # bytes of the line starting at start, at most limit
+        end = self.data.find(b"\n", start, start + limit)
+        if end < 0:
+            end = min(self.size, start + limit)
+        return self.data[start:end]
+
+
+# noinspection PyPep8Naming
+class _LargeFileLineNumberArea(QWidget):
+    # Same look as QLineNumberArea, for the lines of a QLargeFileViewer
+
+    def __init__(self, viewer: QLargeFileViewer):
+        super().__init__(viewer)
+        self._viewer: QLargeFileViewer = viewer
+
+    def sizeHint(self) -> QSize:
+        digits = len(str(max(1, self._viewer.lineCount())))
+        return QSize(13 + self._viewer.fontMetrics().horizontalAdvance("0") * digits, 0)
+
+    def paintEvent(self, event: QPaintEvent, **kwargs):
+        viewer = self._viewer
+        style = viewer.syntaxStyle()
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), style.getFormat("Text").background().color())
+        currentLine = style.getFormat("CurrentLineNumber").foreground().color()
+        otherLines = style.getFormat("LineNumber").foreground().color()
+        painter.setFont(viewer.font())
+        lineHeight = viewer.fontMetrics().height()
+        first = viewer.firstVisibleLine()
+        last = min(viewer.lineCount(), first + viewer.visibleLineCount()) - 1
+        for line in range(first, last + 1):
+            painter.setPen(currentLine if line == viewer.currentLine() else otherLines)
+            painter.drawText(
+                -5,
+                (line - first) * lineHeight,
+                self.width(),
+                lineHeight,
+                Qt.AlignmentFlag.AlignRight,
+                str(line + 1),
+            )
+
+
+# noinspection PyPep8Naming
+class QLargeFileViewer(QAbstractScrollArea):
+    # Read-only view of files too large for a QTextDocument. The file is memory
+    # mapped, its lines are indexed in a background thread and only the visible
+    # lines are read, decoded and highlighted (line by line, with the rules of a
+    # QStyleSyntaxHighlighter). Memory does not grow with the size of the file: the
+    # mapped pages belong to the OS page cache, the index is 8 bytes per 64 KiB.
+
+    # indexed bytes, file size
+    indexProgress = Signal(int, int)
+    # number of lines
+    indexFinished = Signal(int)
+    currentLineChanged = Signal(int)
+    # emitted from the index thread
+    _indexed = Signal()
+
+    def __init__(self, parent: QWidget | None = None):
+        super().__init__(parent)
+
+        self._path: str | None = None
+        self._file = None
+        self._index: _LineIndex | None = None
+        self._encoding: str = "utf-8"
+        self._syntaxStyle: QSyntaxStyle = QSyntaxStyle.defaultStyle()
+        self._highlighter: QStyleSyntaxHighlighter | None = None
+        self._currentLine: int = 0
+        self._maxLineWidth: int = 0
+        self._indexFinished: bool = False
+        self._lineCache: OrderedDict[int, _LineData] = OrderedDict()
+        self._lineNumberArea = _LargeFileLineNumberArea(self)
+
+        # noinspection PyArgumentList
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.verticalScrollBar().setSingleStep(1)
+        # noinspection PyUnresolvedReferences
+        self.verticalScrollBar().valueChanged.connect(self._onScrolled)
+        # noinspection PyUnresolvedReferences
+        self.horizontalScrollBar().valueChanged.connect(self._onScrolled)
+        # noinspection PyUnresolvedReferences
+        self._indexed.connect(self._onIndexed)
+        self._updateScrollBars()
+
+    def openFile(self, path: str, encoding: str = "utf-8") -> bool:
+        self.closeFile()
+        try:
+            file = open(path, "rb")
+        except OSError as e:
+            warnings.warn(f"Can't open {path}: {e}")
+            return False
+        try:
+            if os.fstat(file.fileno()).st_size == 0:
+                data = b""
+            else:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            file.close()
+            warnings.warn(f"Can't map {path}: {e}")
+            return False
+        self._path = path
+        self._file = file
+        self._encoding = encoding
+        self._index = _LineIndex(path, data)
+        self._indexFinished = False
+        self._index.start(self._emitIndexed)
+        self._onIndexed()
+        return True
+
+    def closeFile(self):
+        if self._index is not None:
+            self._index.stop()
+            if isinstance(self._index.data, mmap.mmap):
+                self._index.data.close()
+            self._index = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._path = None
+        self._currentLine = 0
+        self._maxLineWidth = 0
+        self._lineCache.clear()
+        self._updateScrollBars()
+        self.viewport().update()
+        self._lineNumberArea.update()
+
+    def path(self) -> str | None:
+        return self._path
+
+    def encoding(self) -> str:
+        return self._encoding
+
+    def isIndexed(self) -> bool:
+        return self._index is None or self._index.done
+
+    def fileSize(self) -> int:
+        return 0 if self._index is None else self._index.size
+
+    def lineCount(self) -> int:
+        # lines indexed so far
+        return 0 if self._index is None else self._index.lineCount()
+
+    def line(self, line: int) -> str:
+        return self._line(line)[0]
+
+    def setSyntaxStyle(self, style: QSyntaxStyle | None):
+        self._syntaxStyle = style or QSyntaxStyle.defaultStyle()
+        if self._highlighter is not None:
+            self._highlighter.setSyntaxStyle(self._syntaxStyle)
+        self._lineCache.clear()
+        self.viewport().update()
+        self._lineNumberArea.update()
+
+    def syntaxStyle(self) -> QSyntaxStyle:
+        return self._syntaxStyle
+
+    def setHighlighter(self, highlighter: QStyleSyntaxHighlighter | None):
+        # only highlightText() of the highlighter is used, it should not be attached
+        # to a document
+        self._highlighter = highlighter
+        if highlighter is not None:
+            highlighter.setSyntaxStyle(self._syntaxStyle)
+        self._lineCache.clear()
+        self.viewport().update()
+
+    def highlighter(self) -> QStyleSyntaxHighlighter | None:
+        return self._highlighter
+
+    def currentLine(self) -> int:
+        return self._currentLine
+
+    def goToLine(self, line: int):
+        # O(1) in the size of the file once the line is indexed
+        line = max(0, min(line, self.lineCount() - 1))
+        self._setCurrentLine(line)
+        first = self.firstVisibleLine()
+        if line < first or line >= first + self.visibleLineCount() - 1:
+            self.verticalScrollBar().setValue(
+                max(0, line - self.visibleLineCount() // 2)
+            )
+
+    def firstVisibleLine(self) -> int:
+        return self.verticalScrollBar().value()
+
+    def visibleLineCount(self) -> int:
+        lineHeight = max(1, self.fontMetrics().height())
+        return self.viewport().height() // lineHeight + 1
+
+    def _setCurrentLine(self, line: int):
+        if line == self._currentLine:
+            return
+        self._currentLine = line
+        self.viewport().update()
+        self._lineNumberArea.update()
+        # noinspection PyUnresolvedReferences
+        self.currentLineChanged.emit(line)
+
+    def _emitIndexed(self):
+        try:
+            # noinspection PyUnresolvedReferences
+            self._indexed.emit()
+        except RuntimeError:
+            # the viewer has been deleted meanwhile
+            pass
+
+    def _onIndexed(self):
+        if self._index is None:
+            return
+        self._updateScrollBars()
+        self.viewport().update()
+        self._lineNumberArea.update()
+        # noinspection PyUnresolvedReferences
+        self.indexProgress.emit(self._index.indexedBytes(), self._index.size)
+        if self._index.done and not self._indexFinished:
+            self._indexFinished = True
+            # noinspection PyUnresolvedReferences
+            self.indexFinished.emit(self._index.lineCount())
+
+    def _onScrolled(self, _):
+        self.viewport().update()
+        self._lineNumberArea.update()
+
+    def _updateScrollBars(self):
+        width = self._lineNumberArea.sizeHint().width()
+        self.setViewportMargins(width, 0, 0, 0)
+        rect = self.contentsRect()
+        self._lineNumberArea.setGeometry(
+            QRect(rect.left(), rect.top(), width, rect.height())
+        )
+        pageLines = max(1, self.visibleLineCount() - 1)
+        vbar = self.verticalScrollBar()
+        vbar.setPageStep(pageLines)
+        vbar.setRange(0, max(0, self.lineCount() - pageLines))
+        hbar = self.horizontalScrollBar()
+        hbar.setPageStep(self.viewport().width())
+        hbar.setSingleStep(self.fontMetrics().horizontalAdvance("0") * 4)
+        hbar.setRange(0, max(0, self._maxLineWidth - self.viewport().width()))
+
+    def _line(self, line: int) -> _LineData:
+        cached = self._lineCache.get(line, None)
+        if cached is not None:
+            self._lineCache.move_to_end(line)
+            return cached
+        index = self._index
+        if index is None or line < 0 or line >= index.lineCount():
+            return "", []
+        start = index.lineStart(line)
+        # a character takes at most 4 bytes in the usual encodings
+        data = index.readLine(start, LARGE_FILE_LINE_LIMIT * 4)
+        text = data.decode(self._encoding, "replace")
+        if text.endswith("\r"):
+            text = text[:-1]
+        text = text[:LARGE_FILE_LINE_LIMIT]
+        ranges = []
+        if self._highlighter is not None:
+            ranges = self._highlighter.formatRanges(text)
+        self._lineCache[line] = (text, ranges)
+        if len(self._lineCache) > LARGE_FILE_CACHE_LINES:
+            self._lineCache.popitem(last=False)
+        return text, ranges
+
+    def paintEvent(self, event: QPaintEvent, **kwargs):
+        painter = QPainter(self.viewport())
+        textFormat = self._syntaxStyle.getFormat("Text")
+        painter.fillRect(event.rect(), textFormat.background().color())
+        if self._index is None:
+            return
+        lineHeight = self.fontMetrics().height()
+        first = self.firstVisibleLine()
+        last = min(self.lineCount(), first + self.visibleLineCount()) - 1
+        if first <= self._currentLine <= last:
+            painter.fillRect(
+                0,
+                (self._currentLine - first) * lineHeight,
+                self.viewport().width(),
+                lineHeight,
+                self._syntaxStyle.getFormat("CurrentLine").background().color(),
+            )
+        option = QTextOption()
+        option.setWrapMode(QTextOption.WrapMode.NoWrap)
+        option.setTabStopDistance(self.fontMetrics().horizontalAdvance(" ") * 4)
+        painter.setPen(textFormat.foreground().color())
+        left = -self.horizontalScrollBar().value()
+        maxLineWidth = self._maxLineWidth
+        for line in range(first, last + 1):
+            text, ranges = self._line(line)
+            layout = QTextLayout(text, self.font())
+            layout.setTextOption(option)
+            layout.setFormats(ranges)
+            layout.beginLayout()
+            textLine = layout.createLine()
+            layout.endLayout()
+            layout.draw(painter, QPointF(left, (line - first) * lineHeight))
+            maxLineWidth = max(maxLineWidth, int(textLine.naturalTextWidth()) + 1)
+        if maxLineWidth != self._maxLineWidth:
+            # the scrollable width grows with the widest line displayed so far
+            self._maxLineWidth = maxLineWidth
+            self._updateScrollBars()
+
+    def resizeEvent(self, event: QResizeEvent, **kwargs):
+        super().resizeEvent(event)
+        self._updateScrollBars()
+
+    def mousePressEvent(self, event: QMouseEvent, **kwargs):
+        lineHeight = max(1, self.fontMetrics().height())
+        line = self.firstVisibleLine() + int(event.pos().y() // lineHeight)
+        if line < self.lineCount():
+            self._setCurrentLine(line)
+        super().mousePressEvent(event)
+
+    def keyPressEvent(self, event: QKeyEvent, **kwargs):
+        key = event.key()
+        control = bool(event.modifiers() & Qt.KeyboardModifier.ControlModifier)
+        page = max(1, self.visibleLineCount() - 1)
+        if key == Qt.Key.Key_Up:
+            self.goToLine(self._currentLine - 1)
+        elif key == Qt.Key.Key_Down:
+            self.goToLine(self._currentLine + 1)
+        elif key == Qt.Key.Key_PageUp:
+            self.goToLine(self._currentLine - page)
+        elif key == Qt.Key.Key_PageDown:
+            self.goToLine(self._currentLine + page)
+        elif key == Qt.Key.Key_Home and control:
+            self.goToLine(0)
+        elif key == Qt.Key.Key_End and control:
+            self.goToLine(self.lineCount() - 1)
+        elif key == Qt.Key.Key_Left:
+            self.horizontalScrollBar().triggerAction(
+                QAbstractSlider.SliderAction.SliderSingleStepSub
+            )
+        elif key == Qt.Key.Key_Right:
+            self.horizontalScrollBar().triggerAction(
+                QAbstractSlider.SliderAction.SliderSingleStepAdd
+            )
+        else:
+            super().keyPressEvent(event)
@@ -1,11 +1,28 @@
 from __future__ import annotations
 
-from qtpy.QtCore import QSize, Qt
-from qtpy.QtGui import QPaintEvent, QPainter
+from qtpy.QtCore import QSize, Qt, QPoint, QPointF
+from qtpy.QtGui import (
+    QColor,
+    QMouseEvent,
+    QPaintEvent,
+    QPainter,
+    QPolygonF,
+    QTextFormat,
+)
 from qtpy.QtWidgets import QWidget
 
 from . import QCodeEditor
 from . import QSyntaxStyle
+from . import instrumentation
+from .QDiffMarkers import (
+    DIFF_ADDED,
+    DIFF_DELETED,
+    DIFF_DELETED_BELOW,
+    DIFF_MODIFIED,
+)
+
+FOLD_MARKER_AREA_WIDTH: int = 12
+DIFF_MARKER_AREA_WIDTH: int = 4
 
 
 # noinspection PyPep8Naming
@@ -27,6 +44,7 @@ class QLineNumberArea(QWidget):
             max_ /= 10.0
             digits += 1
         space = 13 + self._codeEditParent.fontMetrics().width("0") * digits
+        space += self._foldMarkerAreaWidth() + self._diffMarkerAreaWidth()
         return QSize(space, 0)
 
     def setSyntaxStyle(self, style: QSyntaxStyle.QSyntaxStyle | None):
@@ -35,6 +53,17 @@ class QLineNumberArea(QWidget):
     def syntaxStyle(self) -> QSyntaxStyle.QSyntaxStyle | None:
         return self._syntaxStyle
 
+    def _foldMarkerAreaWidth(self) -> int:
+        if self._codeEditParent.isFoldingAvailable():
+            return FOLD_MARKER_AREA_WIDTH
+        return 0
+
+    def _diffMarkerAreaWidth(self) -> int:
+        if self._codeEditParent.diffMarkers() is not None:
+            return DIFF_MARKER_AREA_WIDTH
+        return 0
+
+    @instrumentation.instrumented("lineNumberArea.paintEvent")
     def paintEvent(self, event: QPaintEvent, **kwargs):
         painter = QPainter(self)
         bgColor = self._syntaxStyle.getFormat("Text").background().color()
@@ -61,6 +90,17 @@ class QLineNumberArea(QWidget):
         otherLines = self._syntaxStyle.getFormat("LineNumber").foreground().color()
         painter.setFont(self._codeEditParent.font())
 
+        foldRegions = self._codeEditParent.foldRegions()
+        foldingStrategy = None
+        markerWidth = self._foldMarkerAreaWidth()
+        if markerWidth > 0:
+            # noinspection PyProtectedMember
+            foldingStrategy = self._codeEditParent._highlighter.foldingStrategy()
+        numberWidth = self.sizeHint().width() - markerWidth
+        lineHeight = self._codeEditParent.fontMetrics().height()
+        diffMarkers = self._codeEditParent.diffMarkers()
+
+        # Only the visible blocks are walked, collapsed regions are jumped over
         while block.isValid() and top <= event.rect().bottom():
             if block.isVisible() and bottom >= event.rect().top():
                 number = str(blockNumber + 1)
@@ -68,12 +108,24 @@ class QLineNumberArea(QWidget):
                 painter.drawText(
                     -5,
                     top,
-                    self.sizeHint().width(),
-                    self._codeEditParent.fontMetrics().height(),
+                    numberWidth,
+                    lineHeight,
                     Qt.AlignmentFlag.AlignRight,
                     number,
                 )
-            block = block.next()
+                if foldingStrategy is not None and foldingStrategy.isFoldStart(block):
+                    self._drawFoldMarker(
+                        painter,
+                        numberWidth,
+                        top,
+                        lineHeight,
+                        foldRegions.isCollapsed(blockNumber),
+                    )
+                if diffMarkers is not None:
+                    status = diffMarkers.lineStatus(blockNumber)
+                    if status:
+                        self._drawDiffMarker(painter, status, top, bottom - top)
+            block = foldRegions.nextVisibleBlock(block)
             top = bottom
             bottom = top + int(
                 self._codeEditParent.document()
@@ -81,4 +133,73 @@ class QLineNumberArea(QWidget):
                 .blockBoundingRect(block)
                 .height()
             )
-            blockNumber += 1
+            blockNumber = block.blockNumber()
+
+    def _drawFoldMarker(
+        self, painter: QPainter, left: int, top: int, height: int, collapsed: bool
+    ):
+        size = min(FOLD_MARKER_AREA_WIDTH, height) - 4
+        x = left + (FOLD_MARKER_AREA_WIDTH - size) / 2.0
+        y = top + (height - size) / 2.0
+        if collapsed:
+            points = [
+                QPointF(x, y),
+                QPointF(x + size, y + size / 2.0),
+                QPointF(x, y + size),
+            ]
+        else:
+            points = [
+                QPointF(x, y),
+                QPointF(x + size, y),
+                QPointF(x + size / 2.0, y + size),
+            ]
+        color = self._syntaxStyle.getFormat("LineNumber").foreground().color()
+        painter.setPen(color)
+        painter.setBrush(color)
+        painter.drawPolygon(QPolygonF(points))
+
+    def _drawDiffMarker(self, painter: QPainter, status: int, top: int, height: int):
+        width = DIFF_MARKER_AREA_WIDTH - 1
+        if status & DIFF_ADDED:
+            color = self._diffColor("AddedLine", Qt.GlobalColor.darkGreen)
+            painter.fillRect(0, top, width, height, color)
+        elif status & DIFF_MODIFIED:
+            color = self._diffColor("ModifiedLine", Qt.GlobalColor.darkBlue)
+            painter.fillRect(0, top, width, height, color)
+        if status & (DIFF_DELETED | DIFF_DELETED_BELOW):
+            color = self._diffColor("RemovedLine", Qt.GlobalColor.darkRed)
+            size = min(DIFF_MARKER_AREA_WIDTH * 2, height / 2.0)
+            y = top if status & DIFF_DELETED else top + height
+            painter.setPen(color)
+            painter.setBrush(color)
+            painter.drawPolygon(
+                QPolygonF(
+                    [
+                        QPointF(0, y - size / 2.0),
+                        QPointF(size, y),
+                        QPointF(0, y + size / 2.0),
+                    ]
+                )
+            )
+
+    def _diffColor(self, name: str, default) -> QColor:
+        format_ = self._syntaxStyle.getFormat(name)
+        if format_.hasProperty(QTextFormat.ForegroundBrush):
+            return format_.foreground().color()
+        return QColor(default)
+
+    def mousePressEvent(self, event: QMouseEvent, **kwargs):
+        markerWidth = self._foldMarkerAreaWidth()
+        x = event.pos().x()
+        if markerWidth <= 0 or x < self.width() - markerWidth:
+            super().mousePressEvent(event)
+            return
+        cursor = self._codeEditParent.cursorForPosition(QPoint(0, event.pos().y()))
+        blockNumber = cursor.blockNumber()
+        if self._codeEditParent.isFolded(
+            blockNumber
+        ) or self._codeEditParent.isFoldable(blockNumber):
+            self._codeEditParent.toggleFold(blockNumber)
+            event.accept()
+            return
+        super().mousePressEvent(event)
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+
+from qtpy.QtCore import QSize, QRect, Qt, Signal, QPoint
+from qtpy.QtGui import QPaintEvent, QPainter, QImage, QColor, QMouseEvent, QWheelEvent
+from qtpy.QtWidgets import QWidget
+
+from . import QCodeEditor
+from .QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+
+# Height and width (in pixels) of a line and a character in the minimap
+MINIMAP_LINE_HEIGHT: int = 2
+MINIMAP_CHAR_WIDTH: int = 1
+# Number of document lines rendered in one cached tile
+MINIMAP_TILE_LINES: int = 256
+MINIMAP_MAX_COLUMNS: int = 120
+
+# (text, [(start, length, rgba), ...]) of one line
+_LineData = Tuple[str, List[Tuple[int, int, int]]]
+
+_renderExecutor: ThreadPoolExecutor | None = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _renderExecutor
+    if _renderExecutor is None:
+        _renderExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="QMinimap"
+        )
+    return _renderExecutor
+
+
+def _renderTile(lines: List[_LineData], textColor: int, background: int) -> QImage:
+    # runs in a worker thread, only plain data and QImage are touched here
+    image = QImage(
+        MINIMAP_MAX_COLUMNS * MINIMAP_CHAR_WIDTH,
+        MINIMAP_TILE_LINES * MINIMAP_LINE_HEIGHT,
+        QImage.Format_ARGB32_Premultiplied,
+    )
+    image.fill(QColor.fromRgba(background))
+    painter = QPainter(image)
+    defaultColor = QColor.fromRgba(textColor)
+    colors: Dict[int, QColor] = {}
+    height = max(1, MINIMAP_LINE_HEIGHT - 1)
+    for row, (text, ranges) in enumerate(lines):
+        y = row * MINIMAP_LINE_HEIGHT
+        # per character color, then runs of non blank characters are filled at once
+        charColors = [textColor] * len(text)
+        for start, length, rgba in ranges:
+            charColors[start : start + length] = [rgba] * len(
+                charColors[start : start + length]
+            )
+        column = 0
+        size = len(text)
+        while column < size:
+            if text[column].isspace():
+                column += 1
+                continue
+            runStart = column
+            rgba = charColors[column]
+            while column < size and not text[column].isspace():
+                if charColors[column] != rgba:
+                    break
+                column += 1
+            color = colors.get(rgba)
+            if color is None:
+                color = defaultColor if rgba == textColor else QColor.fromRgba(rgba)
+                colors[rgba] = color
+            painter.fillRect(
+                runStart * MINIMAP_CHAR_WIDTH,
+                y,
+                (column - runStart) * MINIMAP_CHAR_WIDTH,
+                height,
+                color,
+            )
+    painter.end()
+    return image
+
+
+# noinspection PyPep8Naming
+class QMinimap(QWidget):
+    # tile index, tile generation, image; emitted from the render thread
+    _tileRendered = Signal(int, int, QImage)
+
+    def __init__(
+        self,
+        editor: QCodeEditor.QCodeEditor | None = None,
+        parent: QWidget | None = None,
+    ):
+        super().__init__(parent)
+
+        self._editor: QCodeEditor.QCodeEditor | None = None
+        self._highlighter: QStyleSyntaxHighlighter | None = None
+        self._blockCount: int = 0
+        self._tiles: Dict[int, QImage] = {}
+        self._dirtyTiles: Set[int] = set()
+        self._generations: Dict[int, int] = {}
+        self._rendering: Set[int] = set()
+
+        # noinspection PyUnresolvedReferences
+        self._tileRendered.connect(self._onTileRendered)
+
+        if editor is not None:
+            self.setEditor(editor)
+
+    def sizeHint(self) -> QSize:
+        return QSize(MINIMAP_MAX_COLUMNS * MINIMAP_CHAR_WIDTH, 0)
+
+    def editor(self) -> QCodeEditor.QCodeEditor | None:
+        return self._editor
+
+    def setEditor(self, editor: QCodeEditor.QCodeEditor | None):
+        if self._editor is not None:
+            doc = self._editor.document()
+            # noinspection PyUnresolvedReferences
+            doc.contentsChange.disconnect(self._onContentsChange)
+            # noinspection PyUnresolvedReferences
+            self._editor.verticalScrollBar().valueChanged.disconnect(self._onScrolled)
+            # noinspection PyUnresolvedReferences
+            self._editor.highlighterChanged.disconnect(self._setHighlighter)
+        self._setHighlighter(None)
+        self._editor = editor
+        self._invalidateAll()
+        if editor is None:
+            return
+        self._blockCount = editor.document().blockCount()
+        # noinspection PyUnresolvedReferences
+        editor.document().contentsChange.connect(self._onContentsChange)
+        # noinspection PyUnresolvedReferences
+        editor.verticalScrollBar().valueChanged.connect(self._onScrolled)
+        # noinspection PyUnresolvedReferences
+        editor.highlighterChanged.connect(self._setHighlighter)
+        self._setHighlighter(editor.highlighter())
+
+    def _setHighlighter(self, highlighter: QStyleSyntaxHighlighter | None):
+        if self._highlighter is not None:
+            # noinspection PyUnresolvedReferences
+            self._highlighter.blocksHighlighted.disconnect(self._invalidateBlocks)
+        self._highlighter = highlighter
+        if highlighter is not None:
+            # noinspection PyUnresolvedReferences
+            highlighter.blocksHighlighted.connect(self._invalidateBlocks)
+        self._invalidateAll()
+
+    def _invalidateAll(self):
+        self._dirtyTiles.update(self._tiles.keys())
+        self.update()
+
+    def _invalidateBlocks(self, first: int, last: int):
+        # the cached image of a dirty tile is still painted until it is re-rendered
+        for tile in range(first // MINIMAP_TILE_LINES, last // MINIMAP_TILE_LINES + 1):
+            if tile in self._tiles:
+                self._dirtyTiles.add(tile)
+        self.update()
+
+    def _onContentsChange(self, position: int, charsRemoved: int, charsAdded: int):
+        doc = self._editor.document()
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(min(position + charsAdded, doc.characterCount() - 1))
+        last = last.blockNumber()
+        blockCount = doc.blockCount()
+        if blockCount != self._blockCount:
+            # the following lines moved, drop the tiles past the end
+            self._blockCount = blockCount
+            lastTile = (blockCount - 1) // MINIMAP_TILE_LINES
+            for tile in [t for t in self._tiles if t > lastTile]:
+                del self._tiles[tile]
+                self._dirtyTiles.discard(tile)
+            last = blockCount - 1
+        self._invalidateBlocks(first, last)
+
+    def _onScrolled(self, _):
+        self.update()
+
+    def _scrollOffset(self) -> int:
+        contentHeight = self._editor.document().blockCount() * MINIMAP_LINE_HEIGHT
+        if contentHeight <= self.height():
+            return 0
+        vbar = self._editor.verticalScrollBar()
+        fraction = vbar.value() / max(1, vbar.maximum())
+        return int(fraction * (contentHeight - self.height()))
+
+    def _collectTile(self, tile: int) -> List[_LineData]:
+        doc = self._editor.document()
+        block = doc.findBlockByNumber(tile * MINIMAP_TILE_LINES)
+        lines: List[_LineData] = []
+        for _ in range(MINIMAP_TILE_LINES):
+            if not block.isValid():
+                break
+            text = block.text()[:MINIMAP_MAX_COLUMNS]
+            ranges = []
+            for formatRange in block.layout().formats():
+                if formatRange.start >= MINIMAP_MAX_COLUMNS:
+                    continue
+                brush = formatRange.format.foreground()
+                if brush.style() == Qt.BrushStyle.NoBrush:
+                    continue
+                ranges.append(
+                    (formatRange.start, formatRange.length, brush.color().rgba())
+                )
+            lines.append((text, ranges))
+            block = block.next()
+        return lines
+
+    def _requestTile(self, tile: int):
+        if tile in self._rendering:
+            return
+        style = self._editor.syntaxStyle()
+        textFormat = style.getFormat("Text")
+        lines = self._collectTile(tile)
+        generation = self._generations.get(tile, 0) + 1
+        self._generations[tile] = generation
+        self._dirtyTiles.discard(tile)
+        self._rendering.add(tile)
+        textColor = textFormat.foreground().color().rgba()
+        background = textFormat.background().color().rgba()
+
+        def render():
+            image = _renderTile(lines, textColor, background)
+            try:
+                # noinspection PyUnresolvedReferences
+                self._tileRendered.emit(tile, generation, image)
+            except RuntimeError:
+                # the widget has been deleted meanwhile
+                pass
+
+        _executor().submit(render)
+
+    def _onTileRendered(self, tile: int, generation: int, image: QImage):
+        self._rendering.discard(tile)
+        if self._generations.get(tile) != generation:
+            return
+        self._tiles[tile] = image
+        self.update()
+
+    def paintEvent(self, event: QPaintEvent, **kwargs):
+        painter = QPainter(self)
+        if self._editor is None:
+            return
+        style = self._editor.syntaxStyle()
+        painter.fillRect(event.rect(), style.getFormat("Text").background().color())
+
+        offset = self._scrollOffset()
+        tileHeight = MINIMAP_TILE_LINES * MINIMAP_LINE_HEIGHT
+        lastLine = self._editor.document().blockCount() - 1
+        firstTile = offset // tileHeight
+        lastTile = min(
+            (offset + self.height()) // tileHeight, lastLine // MINIMAP_TILE_LINES
+        )
+        # only the visible tiles are painted and (re-)rendered
+        for tile in range(firstTile, lastTile + 1):
+            image = self._tiles.get(tile)
+            if image is not None:
+                painter.drawImage(QPoint(0, tile * tileHeight - offset), image)
+            if image is None or tile in self._dirtyTiles:
+                self._requestTile(tile)
+
+        # visible part of the editor
+        # noinspection PyProtectedMember
+        firstVisible = self._editor._getFirstVisibleBlock()
+        viewport = self._editor.viewport()
+        lastVisible = self._editor.cursorForPosition(
+            QPoint(0, viewport.height() - 1)
+        ).blockNumber()
+        top = firstVisible * MINIMAP_LINE_HEIGHT - offset
+        height = (lastVisible - firstVisible + 1) * MINIMAP_LINE_HEIGHT
+        color = style.getFormat("Selection").background().color()
+        color.setAlpha(60)
+        painter.fillRect(QRect(0, top, self.width(), height), color)
+
+    def _scrollEditorTo(self, y: int):
+        # O(1) mapping from the minimap to a line
+        line = (self._scrollOffset() + y) // MINIMAP_LINE_HEIGHT
+        doc = self._editor.document()
+        block = doc.findBlockByNumber(max(0, min(line, doc.blockCount() - 1)))
+        top = doc.documentLayout().blockBoundingRect(block).top()
+        vbar = self._editor.verticalScrollBar()
+        vbar.setValue(int(top - self._editor.viewport().height() / 2))
+
+    def mousePressEvent(self, event: QMouseEvent, **kwargs):
+        if self._editor is None or event.button() != Qt.MouseButton.LeftButton:
+            super().mousePressEvent(event)
+            return
+        self._scrollEditorTo(event.pos().y())
+        event.accept()
+
+    def mouseMoveEvent(self, event: QMouseEvent, **kwargs):
+        if self._editor is None or not (event.buttons() & Qt.MouseButton.LeftButton):
+            super().mouseMoveEvent(event)
+            return
+        self._scrollEditorTo(event.pos().y())
+        event.accept()
+
+    def wheelEvent(self, event: QWheelEvent, **kwargs):
+        if self._editor is None:
+            super().wheelEvent(event)
+            return
+        vbar = self._editor.verticalScrollBar()
+        vbar.setValue(vbar.value() - event.angleDelta().y())
+        event.accept()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import os
+import warnings
+from typing import Dict, List, Set, Tuple
+
+from qtpy.QtCore import QFileSystemWatcher, QObject, Signal
+
+from . import utils
+from .QSyntaxStyle import QSyntaxStyle
+
+# Formats only used by the editor widgets, changing them needs no rehighlighting
+EDITOR_FORMATS: Set[str] = {
+    "Text",
+    "Selection",
+    "CurrentLine",
+    "CurrentLineNumber",
+    "LineNumber",
+    "Parentheses",
+    "Occurrences",
+    "Error",
+    "Warning",
+    "AddedLine",
+    "RemovedLine",
+    "ModifiedLine",
+}
+
+# (size, modification time in ns) of a style file
+_FileState = Tuple[int, int]
+
+
+def _fileState(path: str) -> _FileState | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# noinspection PyPep8Naming
+class QStyleRegistry(QObject):
+    # Styles loaded from any path, parsed once per version of the file and shared by
+    # every editor using them. Reloading a changed file updates the shared
+    # QSyntaxStyle in place, only the formats whose entry changed are rebuilt.
+
+    # style, names of the changed formats
+    styleChanged = Signal(object, object)
+
+    _instance: QStyleRegistry | None = None
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+
+        # absolute path -> (style, state of the file when loaded)
+        self._styles: Dict[str, Tuple[QSyntaxStyle, _FileState | None]] = {}
+        self._watcher: QFileSystemWatcher | None = None
+
+    @classmethod
+    def instance(cls) -> QStyleRegistry:
+        if cls._instance is None:
+            cls._instance = QStyleRegistry()
+        return cls._instance
+
+    def style(self, path: str) -> QSyntaxStyle | None:
+        # path of a style file or of a file in the package resources
+        path = self._resolve(path)
+        if path is None:
+            return None
+        cached = self._styles.get(path, None)
+        if cached is not None:
+            if cached[1] != _fileState(path):
+                self.reload(path)
+            return cached[0]
+        style = QSyntaxStyle()
+        state = _fileState(path)
+        if not style.load(path):
+            return None
+        self._styles[path] = (style, state)
+        if self._watcher is not None:
+            self._watcher.addPath(path)
+        return style
+
+    def styles(self) -> List[str]:
+        return list(self._styles.keys())
+
+    def pathOf(self, style: QSyntaxStyle) -> str | None:
+        for path, (cached, _) in self._styles.items():
+            if cached is style:
+                return path
+        return None
+
+    def reload(self, path: str | None = None) -> Set[str]:
+        # Reloads the style of path (or every style) if its file changed, returns
+        # the names of the changed formats
+        if path is None:
+            changed = set()
+            for stylePath in list(self._styles.keys()):
+                changed |= self.reload(stylePath)
+            return changed
+        path = self._resolve(path)
+        cached = self._styles.get(path, None)
+        if cached is None:
+            return set()
+        style, state = cached
+        newState = _fileState(path)
+        if newState is None or newState == state:
+            return set()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+        except (OSError, ValueError) as e:
+            # e.g. the file is being written, the next change reloads it
+            warnings.warn(f"Can't reload style {path}: {e}")
+            return set()
+        self._styles[path] = (style, newState)
+        changed = style.update(schema)
+        if changed:
+            # noinspection PyUnresolvedReferences
+            self.styleChanged.emit(style, changed)
+        return changed
+
+    def remove(self, path: str):
+        path = self._resolve(path)
+        if self._styles.pop(path, None) is not None and self._watcher is not None:
+            self._watcher.removePath(path)
+
+    def setWatching(self, enable: bool):
+        # reloads the styles as soon as their files change
+        if enable == (self._watcher is not None):
+            return
+        if not enable:
+            self._watcher.deleteLater()
+            self._watcher = None
+            return
+        self._watcher = QFileSystemWatcher(self)
+        if self._styles:
+            self._watcher.addPaths(list(self._styles.keys()))
+        # noinspection PyUnresolvedReferences
+        self._watcher.fileChanged.connect(self._onFileChanged)
+
+    def isWatching(self) -> bool:
+        return self._watcher is not None
+
+    def _onFileChanged(self, path: str):
+        self.reload(path)
+        # files saved by replacing them are no longer watched
+        if path in self._styles and path not in self._watcher.files():
+            if os.path.isfile(path):
+                self._watcher.addPath(path)
+
+    @staticmethod
+    def _resolve(path: str) -> str | None:
+        if os.path.isfile(path):
+            return os.path.normcase(os.path.abspath(path))
+        resource = utils.get_resource_file(path)
+        if resource is None:
+            warnings.warn(f"Can't find style {path}")
+            return None
+        return os.path.normcase(resource)
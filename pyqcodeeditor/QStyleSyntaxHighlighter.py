@@ -1,19 +1,740 @@
 from __future__ import annotations
 
-from qtpy.QtGui import QSyntaxHighlighter, QTextDocument
+import time
+import warnings
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from qtpy.QtCore import QRegularExpression, QRegularExpressionMatch, QTimer, Signal
+from qtpy.QtGui import (
+    QSyntaxHighlighter,
+    QTextDocument,
+    QTextCursor,
+    QTextBlock,
+    QTextBlockUserData,
+    QTextCharFormat,
+    QTextLayout,
+    QColor,
+    QFont,
+)
 
 from . import QSyntaxStyle
+from . import instrumentation
+from .QCodeFolding import QFoldingStrategy
+
+# Time budget (in seconds) of one deferred highlighting step, the rest of the pending
+# blocks is highlighted on the next event loop iteration.
+LAZY_HIGHLIGHT_SLICE: float = 0.03
+# Blocks after the edited and the visible ones highlighted right away when a block
+# state change cascades (e.g. typing a comment opener), the following ones are
+# highlighted by deferred steps.
+HIGHLIGHT_CASCADE_BLOCKS: int = 50
+# Blocks longer than this (in characters, e.g. minified JSON) are highlighted only
+# around their visible part, LONG_LINE_MARGIN characters on each side of it. The
+# constructs spanning the rest of the line are not followed, and such a block passes
+# the state of the previous block on.
+LONG_LINE_LENGTH: int = 20000
+LONG_LINE_MARGIN: int = 4000
+# Time (in seconds) a pattern may spend matching one block through matches(). A
+# pattern over budget stops for the rest of the block and is downgraded to a copy
+# limited to RULE_MATCH_LIMIT backtracking steps per match attempt, it is disabled
+# if the copy goes over budget as well. A QLexerHighlighter gives the budget to each
+# search of its combined pattern, and guards the rule found slow within it.
+RULE_TIME_BUDGET: float = 0.01
+RULE_MATCH_LIMIT: int = 100000
 
 
 # noinspection PyPep8Naming
 class QStyleSyntaxHighlighter(QSyntaxHighlighter):
+    # first and last block numbers of the blocks highlighted since the last emission
+    blocksHighlighted = Signal(int, int)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        override = cls.__dict__.get("highlightBlock", None)
+        if override is None or override is QStyleSyntaxHighlighter.highlightBlock:
+            return
+
+        # A highlighter written against QSyntaxHighlighter overrides highlightBlock(),
+        # it becomes its highlightText() so that the bookkeeping of highlightBlock()
+        # (suspend, cascade limit, long lines, folding) still applies to it.
+        def highlightText(self, text: str):
+            self._overridingClasses.append(cls)
+            try:
+                override(self, text)
+            finally:
+                self._overridingClasses.pop()
+
+        cls.highlightText = highlightText
+        cls.highlightBlock = QStyleSyntaxHighlighter.highlightBlock
+
     def __init__(self, document: QTextDocument | None = None):
         super().__init__(document)
 
         self._syntaxStyle: QSyntaxStyle.QSyntaxStyle | None = None
+        self._suspended: bool = False
+        self._suspendCount: int = 0
+        self._lastHighlightedBlock: int = -1
+        self._pendingRanges: List[Tuple[QTextCursor, QTextCursor]] = []
+        # [start, end] positions, moved by _onContentsChange()
+        self._dirtyRanges: List[List[int]] = []
+        # positions where a state cascade has been stopped, moved by
+        # _onContentsChange() until they become pending ranges
+        self._cascadePositions: List[int] = []
+        # last block QSyntaxHighlighter may highlight while reformatting after an
+        # edit, -1 outside of the reformatting
+        self._cascadeLimit: int = -1
+        self._visibleFirst: int = -1
+        self._visibleLast: int = -1
+        # [start, end] positions shown by the editor in the long blocks
+        self._visibleRanges: List[Tuple[int, int]] = []
+        # block number -> (length, start, end) of the columns highlighted in the long
+        # blocks
+        self._longLineWindows: Dict[int, Tuple[int, int, int]] = {}
+        # column of the text given to highlightText() in the current block
+        self._formatOffset: int = 0
+        # (start, length, kind, priority) recorded by addSpan() in the current block
+        self._spans: List[Tuple[int, int, str, int]] = []
+        # id(pattern) -> (pattern, match limited copy or None if disabled)
+        self._guardedPatterns: Dict[
+            int, Tuple[QRegularExpression, QRegularExpression | None]
+        ] = {}
+        # duration of the last relayout of a deferred step
+        self._relayoutTime: float = 0.0
+        self._foldingStrategy: QFoldingStrategy | None = self.createFoldingStrategy()
+
+        # State of the block being highlighted outside QSyntaxHighlighter's own
+        # reformat loop, see _highlightBlocksDirectly()
+        self._directBlock: QTextBlock | None = None
+        self._directFormats: List[QTextCharFormat | None] | None = None
+        # classes whose highlightBlock() override is running as highlightText()
+        self._overridingClasses: List[type] = []
+
+        self._lazyTimer = QTimer(self)
+        self._lazyTimer.setSingleShot(True)
+        self._lazyTimer.setInterval(0)
+        # noinspection PyUnresolvedReferences
+        self._lazyTimer.timeout.connect(self._highlightPending)
+
+        # blocksHighlighted is emitted once per event loop iteration
+        self._highlightedFirst: int = -1
+        self._highlightedLast: int = -1
+        self._notifyTimer = QTimer(self)
+        self._notifyTimer.setSingleShot(True)
+        self._notifyTimer.setInterval(0)
+        # noinspection PyUnresolvedReferences
+        self._notifyTimer.timeout.connect(self._notifyHighlighted)
+
+        if document is not None:
+            # _onContentsChange() must run before QSyntaxHighlighter's reformatting
+            super().setDocument(None)
+            self.setDocument(document)
 
     def setSyntaxStyle(self, style: QSyntaxStyle.QSyntaxStyle | None):
         self._syntaxStyle = style
 
     def syntaxStyle(self) -> QSyntaxStyle.QSyntaxStyle | None:
         return self._syntaxStyle
+
+    def setDocument(self, doc: QTextDocument | None):
+        oldDoc = self.document()
+        if oldDoc is not None:
+            # noinspection PyUnresolvedReferences
+            oldDoc.contentsChange.disconnect(self._onContentsChange)
+            # noinspection PyUnresolvedReferences
+            oldDoc.contentsChange.disconnect(self._onReformatted)
+        self._pendingRanges.clear()
+        self._dirtyRanges.clear()
+        self._cascadePositions.clear()
+        self._longLineWindows.clear()
+        self._lazyTimer.stop()
+        if doc is not None:
+            # connected around QSyntaxHighlighter's reformatting slot
+            # noinspection PyUnresolvedReferences
+            doc.contentsChange.connect(self._onContentsChange)
+        super().setDocument(doc)
+        if doc is not None:
+            # noinspection PyUnresolvedReferences
+            doc.contentsChange.connect(self._onReformatted)
+
+    def setVisibleBlocks(self, first: int, last: int):
+        # block numbers shown by the editor, highlighted right away after an edit
+        self._visibleFirst = first
+        self._visibleLast = last
+
+    def visibleBlocks(self) -> Tuple[int, int]:
+        return self._visibleFirst, self._visibleLast
+
+    def setVisibleRanges(self, ranges: List[Tuple[int, int]]):
+        # [start, end] positions shown by the editor in the blocks longer than
+        # LONG_LINE_LENGTH, these blocks are highlighted around them
+        self._visibleRanges = list(ranges)
+        doc = self.document()
+        if doc is None:
+            return
+        for start, end in self._visibleRanges:
+            block = doc.findBlock(start)
+            window = self._longLineWindows.get(block.blockNumber(), None)
+            if window is None:
+                continue
+            length, first, last = window
+            position = block.position()
+            if (
+                length != block.length() - 1
+                or start - position < first
+                or min(length, end - position) > last
+            ):
+                # scrolled out of the highlighted columns
+                self.rehighlightLater(position, position)
+
+    def visibleRanges(self) -> List[Tuple[int, int]]:
+        return list(self._visibleRanges)
+
+    def suspend(self):
+        self._suspendCount += 1
+        self._suspended = True
+
+    def resume(self, lazy: bool = False):
+        if self._suspendCount <= 0:
+            return
+        self._suspendCount -= 1
+        if self._suspendCount > 0:
+            return
+        self._suspended = False
+
+        dirtyRanges = self._dirtyRanges
+        self._dirtyRanges = []
+        if lazy:
+            for start, end in dirtyRanges:
+                self.rehighlightLater(start, end)
+            return
+
+        doc = self.document()
+        if doc is None:
+            return
+        dirtyRanges.sort()
+        firstPosition = -1
+        endPosition = -1
+        lastPosition = doc.characterCount() - 1
+        for start, end in dirtyRanges:
+            block = doc.findBlock(min(start, lastPosition))
+            if firstPosition < 0:
+                firstPosition = block.position()
+            lastNumber = doc.findBlock(min(end, lastPosition)).blockNumber()
+            block = self._highlightBlocksDirectly(
+                block, lastNumber, float("inf"), markDirty=False
+            )
+            endPosition = block.position() if block.isValid() else doc.characterCount()
+        # a single relayout for all the ranges
+        if endPosition > firstPosition >= 0:
+            doc.markContentsDirty(firstPosition, endPosition - firstPosition)
+        if self._pendingRanges:
+            self._lazyTimer.start()
+
+    def isSuspended(self) -> bool:
+        return self._suspended
+
+    @contextmanager
+    def suspended(self, lazy: bool = False) -> Iterator[QStyleSyntaxHighlighter]:
+        self.suspend()
+        try:
+            yield self
+        finally:
+            self.resume(lazy)
+
+    @instrumentation.instrumented("highlighter.highlightBlock")
+    def highlightBlock(self, text: str):
+        # Blocks skipped here keep their previous state, so QSyntaxHighlighter stops
+        # the state cascade right after them.
+        if self._overridingClasses:
+            # super().highlightBlock() within an override: the highlighting of the
+            # classes after it
+            super(self._overridingClasses[-1], self).highlightText(text)
+            return
+        if self._suspended:
+            return
+        number = self.currentBlock().blockNumber()
+        if 0 <= self._cascadeLimit < number and self._directBlock is None:
+            # The state change of an edit cascades beyond the visible blocks. This
+            # block keeps its state, which stops the cascade, it is highlighted (and
+            # the cascade resumed) by deferred steps. If the state flips back
+            # meanwhile (e.g. the comment is closed), the first step finds the state
+            # unchanged and stops there.
+            self._cascadePositions.append(self.currentBlock().position())
+            self._lazyTimer.start()
+            return
+        self._lastHighlightedBlock = number
+        self._highlightWindow(number, text)
+        strategy = self._foldingStrategy
+        if strategy is not None:
+            if len(text) > LONG_LINE_LENGTH:
+                # not scanned as a whole on every edit, as for the highlighting
+                data = strategy.longBlockData(text)
+            else:
+                data = strategy.blockData(text, self._isStringOrComment)
+            self.setCurrentBlockUserData(data)
+        self._markHighlighted(number, number)
+
+    def _isStringOrComment(self, column: int) -> bool:
+        # whether the character at column of the current block has been formatted as
+        # a string or a comment, the columns out of its highlighted window are not
+        style = self.syntaxStyle()
+        if style is None:
+            return False
+        format_ = self.format(column - self._formatOffset)
+        if format_.isEmpty():
+            return False
+        return format_ in (style.getFormat("String"), style.getFormat("Comment"))
+
+    def _highlightWindow(self, number: int, text: str):
+        length = len(text)
+        start = 0
+        if length > LONG_LINE_LENGTH:
+            position = self.currentBlock().position()
+            # the start of the line when it is not visible
+            first = last = 0
+            for visibleStart, visibleEnd in self._visibleRanges:
+                if position <= visibleStart <= position + length:
+                    first = visibleStart - position
+                    last = min(max(visibleEnd - position, first), length)
+                    break
+            start = max(0, first - LONG_LINE_MARGIN)
+            end = min(length, last + LONG_LINE_MARGIN)
+            self._longLineWindows[number] = (length, start, end)
+            text = text[start:end]
+        elif self._longLineWindows:
+            self._longLineWindows.pop(number, None)
+        self._formatOffset = start
+        if self._directFormats is not None:
+            self._directFormats = [None] * len(text)
+        self._spans = []
+        self.highlightText(text)
+        self._applySpans(len(text))
+        if length > LONG_LINE_LENGTH:
+            self.setCurrentBlockState(self.previousBlockState())
+
+    def highlightText(self, text: str):
+        pass
+
+    def addSpan(self, start: int, length: int, kind: str, priority: int = 0):
+        # Records the format named kind over the text given to highlightText(). The
+        # spans are resolved at the end of the block: a span wins over the ones of
+        # lower priority it overlaps and over the earlier ones of the same priority,
+        # then each run of a format is set with one setFormat() call.
+        if length > 0:
+            self._spans.append((start, length, kind, priority))
+
+    def addSpans(self, spans: Iterable[Tuple[int, int, str]], priority: int = 0):
+        # addSpan() for each (start, length, kind) of spans
+        self._spans.extend(
+            (start, length, kind, priority)
+            for start, length, kind in spans
+            if length > 0
+        )
+
+    def _applySpans(self, size: int):
+        spans = self._spans
+        if not spans:
+            return
+        self._spans = []
+        priority = spans[0][3]
+        previousEnd = 0
+        for start, length, _, spanPriority in spans:
+            if start < previousEnd or spanPriority != priority:
+                spans = self._resolveSpans(spans, size)
+                break
+            previousEnd = start + length
+        # ordered spans without overlaps, adjacent ones of the same kind merged
+        style = self.syntaxStyle()
+        runStart = runEnd = 0
+        runKind = None
+        for start, length, kind, _ in spans:
+            if kind == runKind and start == runEnd:
+                runEnd = start + length
+                continue
+            if runKind is not None:
+                format_ = style.getFormat(runKind)
+                # the block starts without formats
+                if not format_.isEmpty():
+                    self.setFormat(runStart, runEnd - runStart, format_)
+            runStart, runEnd, runKind = start, start + length, kind
+        if runKind is not None:
+            format_ = style.getFormat(runKind)
+            if not format_.isEmpty():
+                self.setFormat(runStart, runEnd - runStart, format_)
+
+    @staticmethod
+    def _resolveSpans(
+        spans: List[Tuple[int, int, str, int]], size: int
+    ) -> List[Tuple[int, int, str, int]]:
+        # the kind of each character, painted from the lowest priority (sorted() is
+        # stable: the later spans of a priority are painted last)
+        kinds: List[str | None] = [None] * size
+        bounds = [0, size]
+        for start, length, kind, _ in sorted(spans, key=itemgetter(3)):
+            end = min(size, start + length)
+            start = max(0, start)
+            if start < end:
+                kinds[start:end] = [kind] * (end - start)
+                bounds.append(start)
+                bounds.append(end)
+        # the kind only changes at the bounds of the spans
+        bounds = sorted(set(bounds))
+        return [
+            (start, end - start, kinds[start], 0)
+            for start, end in zip(bounds, bounds[1:])
+            if kinds[start] is not None
+        ]
+
+    def matches(
+        self, pattern: QRegularExpression, text: str
+    ) -> Iterator[QRegularExpressionMatch]:
+        # pattern.globalMatch(text) within the time budget of the block
+        matching = self.guardedPattern(pattern)
+        if matching is None:
+            return
+        start = time.perf_counter()
+        iterator = matching.globalMatch(text)
+        spent = time.perf_counter() - start
+        # globalMatch already looks for the first match
+        while spent <= RULE_TIME_BUDGET and iterator.hasNext():
+            start = time.perf_counter()
+            match = iterator.next()
+            spent += time.perf_counter() - start
+            yield match
+        # a pause of the process (GC, scheduling) may fall within one of the
+        # searches: a downgrade is harmless, only a scan of the limited copy slow
+        # twice in a row disables the pattern
+        if spent > RULE_TIME_BUDGET and (
+            matching is pattern or self._slowScan(matching, text)
+        ):
+            self.overBudget(pattern)
+
+    @staticmethod
+    def _slowScan(pattern: QRegularExpression, text: str) -> bool:
+        # scan of text by the limited copy of a pattern, stopped at the time budget
+        start = time.perf_counter()
+        iterator = pattern.globalMatch(text)
+        while iterator.hasNext():
+            iterator.next()
+            if time.perf_counter() - start > RULE_TIME_BUDGET:
+                return True
+        return time.perf_counter() - start > RULE_TIME_BUDGET
+
+    def guardedPattern(self, pattern: QRegularExpression) -> QRegularExpression | None:
+        # the pattern to match with in place of pattern, None if it is disabled
+        if not self._guardedPatterns:
+            return pattern
+        guarded = self._guardedPatterns.get(id(pattern), None)
+        return pattern if guarded is None else guarded[1]
+
+    def limitPattern(self, pattern: QRegularExpression):
+        # downgrades pattern to its copy limited to RULE_MATCH_LIMIT, e.g. ahead of
+        # time for a pattern regex_safety finds catastrophic
+        if id(pattern) in self._guardedPatterns:
+            return
+        limited = QRegularExpression(
+            f"(*LIMIT_MATCH={RULE_MATCH_LIMIT}){pattern.pattern()}",
+            pattern.patternOptions(),
+        )
+        # the pattern is kept so that its id is not reused
+        self._guardedPatterns[id(pattern)] = (pattern, limited)
+
+    def overBudget(self, pattern: QRegularExpression):
+        # pattern went over RULE_TIME_BUDGET on a block: downgraded the first time,
+        # disabled the next one
+        guarded = self._guardedPatterns.get(id(pattern), None)
+        if guarded is None:
+            self.limitPattern(pattern)
+        elif guarded[1] is not None:
+            self._guardedPatterns[id(pattern)] = (pattern, None)
+            warnings.warn(
+                f"Highlighting pattern {pattern.pattern()!r} disabled, it went over "
+                f"its time budget of {RULE_TIME_BUDGET * 1000:g} ms per line"
+            )
+
+    def downgradedPatterns(self) -> List[str]:
+        # patterns limited after going over their time budget
+        return [
+            pattern.pattern()
+            for pattern, limited in self._guardedPatterns.values()
+            if limited is not None
+        ]
+
+    def disabledPatterns(self) -> List[str]:
+        return [
+            pattern.pattern()
+            for pattern, limited in self._guardedPatterns.values()
+            if limited is None
+        ]
+
+    def resetPatternGuards(self):
+        self._guardedPatterns.clear()
+
+    def createFoldingStrategy(self) -> QFoldingStrategy | None:
+        return None
+
+    def foldingStrategy(self) -> QFoldingStrategy | None:
+        return self._foldingStrategy
+
+    def rehighlightLater(self, start: int, end: int):
+        doc = self.document()
+        if doc is None:
+            return
+        startCursor = QTextCursor(doc)
+        startCursor.setPosition(max(0, min(start, doc.characterCount() - 1)))
+        endCursor = QTextCursor(doc)
+        endCursor.setPosition(max(0, min(end, doc.characterCount() - 1)))
+        # cursors keep track of the range while the document is being edited
+        self._pendingRanges.append((startCursor, endCursor))
+        self._lazyTimer.start()
+
+    def hasPendingHighlight(self) -> bool:
+        return len(self._pendingRanges) > 0 or len(self._cascadePositions) > 0
+
+    def _markHighlighted(self, first: int, last: int):
+        if self._highlightedFirst < 0:
+            self._highlightedFirst = first
+            self._highlightedLast = last
+            self._notifyTimer.start()
+            return
+        self._highlightedFirst = min(self._highlightedFirst, first)
+        self._highlightedLast = max(self._highlightedLast, last)
+
+    def _notifyHighlighted(self):
+        first = self._highlightedFirst
+        last = self._highlightedLast
+        self._highlightedFirst = -1
+        self._highlightedLast = -1
+        if first >= 0:
+            # noinspection PyUnresolvedReferences
+            self.blocksHighlighted.emit(first, last)
+
+    def _onContentsChange(self, position: int, charsRemoved: int, charsAdded: int):
+        # Plain positions moved here rather than QTextCursors: clear() and
+        # setPlainText() emit contentsChange while the document updates its cursors,
+        # creating one at that time corrupts the document.
+        end = position + charsAdded
+
+        def move(p: int) -> int:
+            if p <= position:
+                return p
+            if p >= position + charsRemoved:
+                return p + charsAdded - charsRemoved
+            return position
+
+        if self._cascadePositions:
+            self._cascadePositions = [move(p) for p in self._cascadePositions]
+        if not self._suspended:
+            document = self.document()
+            # the end of an edit at the end of the document is past the last block
+            lastEdited = document.findBlock(
+                min(end, document.characterCount() - 1)
+            ).blockNumber()
+            self._cascadeLimit = (
+                max(lastEdited, self._visibleLast) + HIGHLIGHT_CASCADE_BLOCKS
+            )
+            return
+
+        merged = False
+        for dirtyRange in self._dirtyRanges:
+            dirtyRange[0] = move(dirtyRange[0])
+            dirtyRange[1] = move(dirtyRange[1])
+            # merge with a recorded range the edit touches
+            if not merged and dirtyRange[0] <= end and position <= dirtyRange[1]:
+                dirtyRange[0] = min(dirtyRange[0], position)
+                dirtyRange[1] = max(dirtyRange[1], end)
+                merged = True
+        if not merged:
+            self._dirtyRanges.append([position, end])
+
+    def _onReformatted(self):
+        # QSyntaxHighlighter has highlighted the edited blocks
+        self._cascadeLimit = -1
+
+    def setFormat(self, start: int, count: int, format_: QTextCharFormat):
+        if self._directFormats is None:
+            super().setFormat(start + self._formatOffset, count, format_)
+            return
+        if isinstance(format_, QColor):
+            color = format_
+            format_ = QTextCharFormat()
+            format_.setForeground(color)
+        elif isinstance(format_, QFont):
+            font = format_
+            format_ = QTextCharFormat()
+            format_.setFont(font)
+        size = len(self._directFormats)
+        start = max(0, start)
+        end = min(size, start + count)
+        if start < end:
+            self._directFormats[start:end] = [format_] * (end - start)
+
+    def format(self, pos: int) -> QTextCharFormat:
+        if self._directFormats is None:
+            return super().format(pos + self._formatOffset)
+        if 0 <= pos < len(self._directFormats):
+            return self._directFormats[pos] or QTextCharFormat()
+        return QTextCharFormat()
+
+    def currentBlock(self) -> QTextBlock:
+        if self._directBlock is None:
+            return super().currentBlock()
+        return self._directBlock
+
+    def previousBlockState(self) -> int:
+        if self._directBlock is None:
+            return super().previousBlockState()
+        previous = self._directBlock.previous()
+        return previous.userState() if previous.isValid() else -1
+
+    def currentBlockState(self) -> int:
+        if self._directBlock is None:
+            return super().currentBlockState()
+        return self._directBlock.userState()
+
+    def setCurrentBlockState(self, newState: int):
+        if self._directBlock is None:
+            super().setCurrentBlockState(newState)
+            return
+        self._directBlock.setUserState(newState)
+
+    def currentBlockUserData(self) -> QTextBlockUserData | None:
+        if self._directBlock is None:
+            return super().currentBlockUserData()
+        return self._directBlock.userData()
+
+    def setCurrentBlockUserData(self, data: QTextBlockUserData | None):
+        if self._directBlock is None:
+            super().setCurrentBlockUserData(data)
+            return
+        self._directBlock.setUserData(data)
+
+    def _highlightBlocksDirectly(
+        self,
+        block: QTextBlock,
+        lastNumber: int,
+        deadline: float,
+        markDirty: bool = True,
+    ) -> QTextBlock:
+        # Highlights the blocks up to lastNumber (and the following ones as long as
+        # their state changes) without going through QSyntaxHighlighter. Every
+        # QSyntaxHighlighter.rehighlightBlock() call makes the document relayout, which
+        # costs O(document size) per block in a QTextEdit, so the formats are applied
+        # here and the layout is invalidated only once for the whole range.
+        # Returns the first block that has not been highlighted.
+        doc = self.document()
+        firstPosition = block.position()
+        endPosition = firstPosition
+        try:
+            while block.isValid() and time.perf_counter() < deadline:
+                number = block.blockNumber()
+                stateBefore = block.userState()
+                text = block.text()
+                self._directBlock = block
+                # sized by highlightBlock() to the highlighted columns
+                self._directFormats = []
+                self.highlightBlock(text)
+                self._applyDirectFormats(block)
+                endPosition = block.position() + block.length()
+                self._lastHighlightedBlock = number
+                stateAfter = block.userState()
+                block = block.next()
+                if number >= lastNumber and stateAfter == stateBefore:
+                    break
+        finally:
+            self._directBlock = None
+            self._directFormats = None
+        if markDirty and endPosition > firstPosition:
+            doc.markContentsDirty(firstPosition, endPosition - firstPosition)
+        return block
+
+    def _applyDirectFormats(self, block: QTextBlock):
+        block.layout().setFormats(self._directFormatRanges())
+
+    def _directFormatRanges(self) -> List[QTextLayout.FormatRange]:
+        ranges = []
+        position = 0
+        offset = self._formatOffset
+        for format_, chars in groupby(self._directFormats, key=id):
+            length = sum(1 for _ in chars)
+            format_ = self._directFormats[position]
+            if format_ is not None:
+                formatRange = QTextLayout.FormatRange()
+                formatRange.start = position + offset
+                formatRange.length = length
+                formatRange.format = format_
+                ranges.append(formatRange)
+            position += length
+        return ranges
+
+    def formatRanges(self, text: str) -> List[QTextLayout.FormatRange]:
+        # Highlights a line that is not in a document (e.g. from a file too large to
+        # be loaded), constructs spanning several lines are not followed. The block
+        # state functions act on an invalid block: they read -1 and write nothing.
+        self._directBlock = QTextBlock()
+        self._directFormats = [None] * len(text)
+        self._formatOffset = 0
+        self._spans = []
+        try:
+            self.highlightText(text)
+            self._applySpans(len(text))
+            return self._directFormatRanges()
+        finally:
+            self._directBlock = None
+            self._directFormats = None
+
+    def _highlightPending(self):
+        doc = self.document()
+        if doc is None:
+            self._pendingRanges.clear()
+            return
+        if self._suspended:
+            return
+
+        if self._cascadePositions:
+            for position in sorted(set(self._cascadePositions)):
+                self.rehighlightLater(position, position)
+            self._cascadePositions.clear()
+        # a range reads the state left by the ranges before it: an earlier edit may
+        # have changed the state a later range is cascading with
+        self._pendingRanges.sort(key=lambda cursors: cursors[0].position())
+        merged: List[Tuple[QTextCursor, QTextCursor]] = []
+        for startCursor, endCursor in self._pendingRanges:
+            if merged and startCursor.position() <= merged[-1][1].position():
+                if endCursor.position() > merged[-1][1].position():
+                    merged[-1][1].setPosition(endCursor.position())
+                continue
+            merged.append((startCursor, endCursor))
+        self._pendingRanges = merged
+        # the relayout of a large QTextEdit document takes a while whatever the
+        # number of blocks, the slice is at least as long
+        deadline = time.perf_counter() + max(LAZY_HIGHLIGHT_SLICE, self._relayoutTime)
+        firstPosition = -1
+        endPosition = -1
+        while self._pendingRanges:
+            startCursor, endCursor = self._pendingRanges[0]
+            block = doc.findBlock(startCursor.position())
+            if firstPosition < 0:
+                firstPosition = block.position()
+            lastNumber = doc.findBlock(endCursor.position()).blockNumber()
+            block = self._highlightBlocksDirectly(
+                block, lastNumber, deadline, markDirty=False
+            )
+            endPosition = block.position() if block.isValid() else doc.characterCount()
+            # checked before the relayout, which may take longer than the slice
+            if block.isValid() and time.perf_counter() >= deadline:
+                startCursor.setPosition(block.position())
+                if startCursor.position() > endCursor.position():
+                    # the state is still cascading after the end of the range
+                    endCursor.setPosition(block.position())
+                self._lazyTimer.start()
+                break
+            self._pendingRanges.pop(0)
+        # a single relayout for the ranges of the slice
+        if endPosition > firstPosition >= 0:
+            start = time.perf_counter()
+            doc.markContentsDirty(firstPosition, endPosition - firstPosition)
+            self._relayoutTime = time.perf_counter() - start
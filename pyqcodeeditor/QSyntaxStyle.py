@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import json
+import os
 import traceback
 import warnings
-from typing import Dict, Any
+from typing import Any, Dict, List, Set
 
 from qtpy.QtCore import QObject
 from qtpy.QtGui import QTextCharFormat, QColor, QFont
@@ -31,11 +32,18 @@ class QSyntaxStyle(object):
         self._name: str = ""
         self._loaded: bool = False
         self._data: Dict[str, QTextCharFormat] = {}
+        # style entries of the schema, a format is only rebuilt when its entry changes
+        self._entries: Dict[str, Dict[str, Any]] = {}
 
     def load(self, file: str, encoding="utf-8", errors="strict") -> bool:
+        # file is a path or the path of a file in the package resources
         self._loaded = False
         try:
-            with utils.open_resource_text_file(file, encoding, errors) as f:
+            if os.path.isfile(file):
+                f = open(file, "r", encoding=encoding, errors=errors)
+            else:
+                f = utils.open_resource_text_file(file, encoding, errors)
+            with f:
                 data = json.load(f)
                 if isinstance(data, dict):
                     self._processStyleSchema(data)
@@ -44,6 +52,13 @@ class QSyntaxStyle(object):
             traceback.print_exc()
         return self._loaded
 
+    def update(self, style_schema: Dict[str, Any]) -> Set[str]:
+        # Applies a new version of the schema, returns the names of the formats that
+        # have been added, changed or removed. The other formats are left untouched.
+        if not isinstance(style_schema, dict):
+            return set()
+        return self._processStyleSchema(style_schema)
+
     def name(self) -> str:
         return self._name
 
@@ -51,60 +66,89 @@ class QSyntaxStyle(object):
         return self._loaded
 
     def getFormat(self, name: str) -> QTextCharFormat:
-        return self._data.get(name, QTextCharFormat())
+        format_ = self._data.get(name, None)
+        return format_ if format_ is not None else QTextCharFormat()
+
+    def formatNames(self) -> List[str]:
+        return list(self._data.keys())
 
-    def _processStyleSchema(self, style_schema: Dict[str, Any]):
+    def _processStyleSchema(self, style_schema: Dict[str, Any]) -> Set[str]:
         name = style_schema.get("name", None)
         if not isinstance(name, str) or name.strip() == "":
-            return
+            return set()
         styles = style_schema.get("style", None)
         if not isinstance(styles, list):
-            return
+            return set()
         self._loaded = True
+        self._name = name
 
+        entries = {}
         for style in styles:
             if not isinstance(style, dict):
                 continue
             style_name = style.get("name", None)
             if not isinstance(style_name, str) or style_name.strip() == "":
                 continue
-            style_format = QTextCharFormat()
-
-            background = style.get("background", None)
-            if background:
-                style_format.setBackground(QColor(str(background)))
-
-            foreground = style.get("foreground", None)
-            if foreground:
-                style_format.setForeground(QColor(str(foreground)))
+            entries[style_name] = style
 
-            bold = style.get("bold", "")
-            if bold == "true":
-                style_format.setFontWeight(QFont.Bold)
-
-            italic = style.get("italic", "")
-            if italic == "true":
-                style_format.setFontItalic(True)
-
-            underlineStyle = style.get("underlineStyle", "")
-            underlineStyle = UNDERLINE_STYLES.get(
-                underlineStyle, QTextCharFormat.UnderlineStyle.NoUnderline
-            )
-            style_format.setUnderlineStyle(underlineStyle)
-            self._data[style_name] = style_format
+        changed = set(self._entries.keys() - entries.keys())
+        for style_name in changed:
+            del self._data[style_name]
+        for style_name, style in entries.items():
+            if self._entries.get(style_name, None) == style:
+                continue
+            self._data[style_name] = self._createFormat(style)
+            changed.add(style_name)
+        self._entries = entries
+        return changed
+
+    @staticmethod
+    def _createFormat(style: Dict[str, Any]) -> QTextCharFormat:
+        style_format = QTextCharFormat()
+
+        background = style.get("background", None)
+        if background:
+            style_format.setBackground(QColor(str(background)))
+
+        foreground = style.get("foreground", None)
+        if foreground:
+            style_format.setForeground(QColor(str(foreground)))
+
+        bold = style.get("bold", "")
+        if bold == "true":
+            style_format.setFontWeight(QFont.Bold)
+
+        italic = style.get("italic", "")
+        if italic == "true":
+            style_format.setFontItalic(True)
+
+        underlineColor = style.get("underlineColor", None)
+        if underlineColor:
+            style_format.setUnderlineColor(QColor(str(underlineColor)))
+
+        underlineStyle = style.get("underlineStyle", "")
+        underlineStyle = UNDERLINE_STYLES.get(
+            underlineStyle, QTextCharFormat.UnderlineStyle.NoUnderline
+        )
+        style_format.setUnderlineStyle(underlineStyle)
+        return style_format
 
     def clear(self):
         self._loaded = False
         self._data.clear()
+        self._entries.clear()
         self._name = ""
 
     @classmethod
     def defaultStyle(cls) -> "QSyntaxStyle":
-        if not isinstance(cls._defaultStyle, QSyntaxStyle):
-            cls._defaultStyle = QSyntaxStyle()
-        if cls._defaultStyle.isLoaded():
+        if isinstance(cls._defaultStyle, QSyntaxStyle) and cls._defaultStyle.isLoaded():
             return cls._defaultStyle
-        file = utils.get_resource_file("default_style.json")
-        if not cls._defaultStyle.load(file):
+        # shared through the registry like the other styles
+        from .QStyleRegistry import QStyleRegistry
+
+        style = QStyleRegistry.instance().style("default_style.json")
+        if style is None:
             warnings.warn("Can't load default style.")
+            style = QSyntaxStyle()
+        cls._defaultStyle = style
         return cls._defaultStyle
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import bisect
+from itertools import accumulate
+from typing import Iterator, List
+
+# Snapshots are plain python objects, they can be read from any thread and sent to
+# other processes, no Qt object is involved.
+
+
+# noinspection PyPep8Naming
+class QTextSnapshot(object):
+    # Immutable view of the text of a document at some revision. The chunk lists are
+    # shared with the QTextStore the snapshot has been taken from, which copies them
+    # before its next change.
+
+    def __init__(
+        self,
+        chunks: List[str],
+        lineCounts: List[int],
+        length: int,
+        revision: int = 0,
+    ):
+        self._chunks: List[str] = chunks
+        # number of "\n" in each chunk
+        self._lineCounts: List[int] = lineCounts
+        self._length: int = length
+        self._revision: int = revision
+        # prefix sums, computed on the first lookup
+        self._offsets: List[int] | None = None
+        self._lineOffsets: List[int] | None = None
+
+    def __getstate__(self):
+        return self._chunks, self._lineCounts, self._length, self._revision
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def revision(self) -> int:
+        return self._revision
+
+    def length(self) -> int:
+        return self._length
+
+    def lineCount(self) -> int:
+        return sum(self._lineCounts) + 1
+
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def chunks(self) -> Iterator[str]:
+        return iter(self._chunks)
+
+    def slice(self, start: int, end: int) -> str:
+        start = max(0, start)
+        end = min(self._length, end)
+        if end <= start:
+            return ""
+        offsets = self._chunkOffsets()
+        first = bisect.bisect_right(offsets, start) - 1
+        last = bisect.bisect_right(offsets, end - 1) - 1
+        text = "".join(self._chunks[first : last + 1])
+        return text[start - offsets[first] : end - offsets[first]]
+
+    def lineStart(self, line: int) -> int:
+        # position of the first character of a 0-based line
+        if line <= 0:
+            return 0
+        if line >= self.lineCount():
+            return self._length
+        lineOffsets = self._chunkLineOffsets()
+        # the chunk holding the line-th "\n"
+        index = bisect.bisect_left(lineOffsets, line) - 1
+        chunk = self._chunks[index]
+        position = -1
+        for _ in range(line - lineOffsets[index]):
+            position = chunk.find("\n", position + 1)
+        return self._chunkOffsets()[index] + position + 1
+
+    def lineAt(self, position: int) -> int:
+        position = max(0, min(self._length, position))
+        offsets = self._chunkOffsets()
+        index = max(0, bisect.bisect_right(offsets, position) - 1)
+        if index >= len(self._chunks):
+            return self.lineCount() - 1
+        local = position - offsets[index]
+        return self._chunkLineOffsets()[index] + self._chunks[index].count(
+            "\n", 0, local
+        )
+
+    def line(self, line: int) -> str:
+        start = self.lineStart(line)
+        end = self.lineStart(line + 1)
+        text = self.slice(start, end)
+        return text[:-1] if text.endswith("\n") else text
+
+    def lines(self, first: int = 0, last: int = -1) -> Iterator[str]:
+        lineCount = self.lineCount()
+        if last < 0 or last >= lineCount:
+            last = lineCount - 1
+        text = self.slice(self.lineStart(first), self.lineStart(last + 1))
+        if last + 1 < lineCount:
+            # separator of the last line
+            text = text[:-1]
+        return iter(text.split("\n"))
+
+    def _chunkOffsets(self) -> List[int]:
+        if self._offsets is None:
+            self._offsets = [0]
+            self._offsets.extend(accumulate(len(chunk) for chunk in self._chunks))
+        return self._offsets
+
+    def _chunkLineOffsets(self) -> List[int]:
+        if self._lineOffsets is None:
+            self._lineOffsets = [0]
+            self._lineOffsets.extend(accumulate(self._lineCounts))
+        return self._lineOffsets
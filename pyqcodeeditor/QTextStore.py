@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from typing import List
+
+from .QTextSnapshot import QTextSnapshot
+
+# Size (in characters) of the chunks the text is split into, an edit copies only the
+# chunks it touches
+TEXT_STORE_CHUNK_SIZE: int = 4096
+
+
+# noinspection PyPep8Naming
+class QTextStore(object):
+    # Shadow copy of a document's text kept as a list of chunks, taking a snapshot
+    # shares the lists (O(1)) and the next change copies them (O(chunk count)).
+
+    def __init__(self, text: str = ""):
+        self._chunks: List[str] = []
+        self._lineCounts: List[int] = []
+        self._length: int = 0
+        self._shared: bool = False
+        self.setText(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def length(self) -> int:
+        return self._length
+
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def setText(self, text: str):
+        self._chunks = _split(text)
+        self._lineCounts = [chunk.count("\n") for chunk in self._chunks]
+        self._length = len(text)
+        self._shared = False
+
+    def snapshot(self, revision: int = 0) -> QTextSnapshot:
+        self._shared = True
+        return QTextSnapshot(self._chunks, self._lineCounts, self._length, revision)
+
+    def replace(self, position: int, charsRemoved: int, addedText: str) -> str:
+        # Returns the removed text
+        if self._shared:
+            self._chunks = list(self._chunks)
+            self._lineCounts = list(self._lineCounts)
+            self._shared = False
+        chunks = self._chunks
+        position = max(0, min(self._length, position))
+        end = min(self._length, position + charsRemoved)
+
+        # chunks [first, last) hold the replaced range
+        first = 0
+        offset = 0
+        while first < len(chunks) and offset + len(chunks[first]) < position:
+            offset += len(chunks[first])
+            first += 1
+        last = first
+        lastEnd = offset
+        while last < len(chunks) and (lastEnd < end or last == first):
+            lastEnd += len(chunks[last])
+            last += 1
+        if last < len(chunks) and lastEnd - offset < TEXT_STORE_CHUNK_SIZE // 4:
+            # small chunks are merged with the next one
+            lastEnd += len(chunks[last])
+            last += 1
+
+        text = "".join(chunks[first:last])
+        removedText = text[position - offset : end - offset]
+        text = text[: position - offset] + addedText + text[end - offset :]
+        newChunks = _split(text)
+        chunks[first:last] = newChunks
+        self._lineCounts[first:last] = [chunk.count("\n") for chunk in newChunks]
+        self._length += len(addedText) - len(removedText)
+        return removedText
+
+
+def _split(text: str) -> List[str]:
+    if not text:
+        return []
+    if len(text) <= 2 * TEXT_STORE_CHUNK_SIZE:
+        return [text]
+    return [
+        text[index : index + TEXT_STORE_CHUNK_SIZE]
+        for index in range(0, len(text), TEXT_STORE_CHUNK_SIZE)
+    ]
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, List, Tuple
+
+from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtGui import QTextCursor
+
+from . import QCodeEditor
+from .QDocumentChangeLog import QDocumentChange
+
+# Approximate size (in bytes) of the python objects of an edit besides its texts
+UNDO_EDIT_OVERHEAD: int = 120
+# Consecutive typing (or deleting) closer than this (in seconds) is one undo step
+UNDO_COALESCE_INTERVAL: float = 1.0
+
+# (position, removed text, added text)
+_Edit = Tuple[int, str, str]
+
+
+def _editSize(edit: _Edit) -> int:
+    return sys.getsizeof(edit[1]) + sys.getsizeof(edit[2]) + UNDO_EDIT_OVERHEAD
+
+
+def _stepSize(step: List[_Edit]) -> int:
+    return sum(_editSize(edit) for edit in step)
+
+
+def _isTyping(edit: _Edit) -> bool:
+    # a few characters added or removed, whitespace ends a typing step
+    position, removed, added = edit
+    if removed and added:
+        return False
+    text = removed or added
+    return 0 < len(text) <= 2 and not any(char.isspace() for char in text)
+
+
+# noinspection PyPep8Naming
+class QUndoHistory(QObject):
+    # Undo / redo steps of an editor, built from its change log instead of the
+    # unbounded undo stack of QTextDocument (which is disabled). The memory held by
+    # the steps is accounted and bounded by a number of steps and / or bytes, the
+    # oldest steps are dropped first. All the changes made until control returns to
+    # the event loop (an edit block, a replace-all...) form one step.
+    #
+    # The history keeps the modified state of the document as its undo stack would:
+    # the position of the steps where the document was last set unmodified (loaded,
+    # saved) is its clean index, the document is modified everywhere else.
+
+    undoAvailable = Signal(bool)
+    redoAvailable = Signal(bool)
+    # bytes held by the undo and redo steps
+    memoryChanged = Signal(int)
+
+    def __init__(
+        self,
+        editor: QCodeEditor.QCodeEditor | None = None,
+        parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+
+        self._editor: QCodeEditor.QCodeEditor | None = None
+        self._undoSteps: Deque[List[_Edit]] = deque()
+        self._redoSteps: Deque[List[_Edit]] = deque()
+        self._undoBytes: int = 0
+        self._redoBytes: int = 0
+        self._maximumSteps: int = 0
+        self._maximumBytes: int = 0
+        self._coalesceTyping: bool = True
+        # the step changes are added to until the event loop runs
+        self._stepOpen: bool = False
+        self._lastTyping: float = 0.0
+        self._applying: bool = False
+        self._paused: int = 0
+        # steps dropped from the oldest end of the undo steps
+        self._dropped: int = 0
+        # index() where the document is unmodified, -1 if it can't be reached
+        self._cleanIndex: int = 0
+        self._settingModified: bool = False
+
+        if editor is not None:
+            self.setEditor(editor)
+
+    def setEditor(self, editor: QCodeEditor.QCodeEditor | None):
+        if self._editor is not None:
+            doc = self._editor.document()
+            # noinspection PyUnresolvedReferences
+            self._editor.changeLog().changed.disconnect(self._onChanged)
+            # noinspection PyUnresolvedReferences
+            doc.modificationChanged.disconnect(self._onModificationChanged)
+            doc.setUndoRedoEnabled(True)
+        self._editor = editor
+        self.clear()
+        if editor is None:
+            return
+        doc = editor.document()
+        # also drops the steps QTextDocument holds already
+        doc.setUndoRedoEnabled(False)
+        # noinspection PyUnresolvedReferences
+        editor.changeLog().changed.connect(self._onChanged)
+        # noinspection PyUnresolvedReferences
+        doc.modificationChanged.connect(self._onModificationChanged)
+
+    def editor(self) -> QCodeEditor.QCodeEditor | None:
+        return self._editor
+
+    def setMaximumSteps(self, steps: int):
+        # 0 for no limit
+        self._maximumSteps = max(0, steps)
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        self._enforceLimits()
+        self._notify(canUndo, canRedo)
+
+    def maximumSteps(self) -> int:
+        return self._maximumSteps
+
+    def setMaximumBytes(self, size: int):
+        # 0 for no limit, a step larger than the limit can't be undone
+        self._maximumBytes = max(0, size)
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        self._enforceLimits()
+        self._notify(canUndo, canRedo)
+
+    def maximumBytes(self) -> int:
+        return self._maximumBytes
+
+    def setCoalesceTyping(self, enable: bool):
+        self._coalesceTyping = enable
+
+    def coalesceTyping(self) -> bool:
+        return self._coalesceTyping
+
+    def memoryUsage(self) -> int:
+        # approximate bytes held by the undo and redo steps
+        return self._undoBytes + self._redoBytes
+
+    def undoSteps(self) -> int:
+        return len(self._undoSteps)
+
+    def redoSteps(self) -> int:
+        return len(self._redoSteps)
+
+    def canUndo(self) -> bool:
+        return len(self._undoSteps) > 0
+
+    def canRedo(self) -> bool:
+        return len(self._redoSteps) > 0
+
+    def index(self) -> int:
+        # steps done since the history was cleared, dropped ones included
+        return self._dropped + len(self._undoSteps)
+
+    def cleanIndex(self) -> int:
+        return self._cleanIndex
+
+    def setClean(self):
+        # the current text is unmodified, e.g. after a save
+        self._cleanIndex = self.index()
+        self._updateModified()
+
+    def isClean(self) -> bool:
+        return self.index() == self._cleanIndex
+
+    def clear(self):
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        self._undoSteps.clear()
+        self._redoSteps.clear()
+        self._undoBytes = 0
+        self._redoBytes = 0
+        self._stepOpen = False
+        self._dropped = 0
+        modified = self._editor is not None and self._editor.document().isModified()
+        self._cleanIndex = -1 if modified else 0
+        self._notify(canUndo, canRedo)
+
+    @contextmanager
+    def paused(self) -> Iterator[QUndoHistory]:
+        # the changes made meanwhile are not recorded
+        self._paused += 1
+        try:
+            yield self
+        finally:
+            self._paused -= 1
+
+    def undo(self):
+        if self._editor is None or not self._undoSteps:
+            return
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        self._stepOpen = False
+        self._lastTyping = 0.0
+        step = self._undoSteps.pop()
+        size = _stepSize(step)
+        self._undoBytes -= size
+        cursor = self._apply(
+            [(position, added, removed) for position, removed, added in reversed(step)]
+        )
+        position, removed, _ = step[0]
+        cursor.setPosition(position + len(removed))
+        self._editor.setTextCursor(cursor)
+        self._redoSteps.append(step)
+        self._redoBytes += size
+        self._updateModified()
+        self._notify(canUndo, canRedo)
+
+    def redo(self):
+        if self._editor is None or not self._redoSteps:
+            return
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        self._stepOpen = False
+        self._lastTyping = 0.0
+        step = self._redoSteps.pop()
+        size = _stepSize(step)
+        self._redoBytes -= size
+        cursor = self._apply(step)
+        position, _, added = step[-1]
+        cursor.setPosition(position + len(added))
+        self._editor.setTextCursor(cursor)
+        self._undoSteps.append(step)
+        self._undoBytes += size
+        self._updateModified()
+        self._notify(canUndo, canRedo)
+
+    def _apply(self, edits: List[_Edit]) -> QTextCursor:
+        cursor = QTextCursor(self._editor.document())
+        self._applying = True
+        try:
+            cursor.beginEditBlock()
+            for position, removed, added in edits:
+                cursor.setPosition(position)
+                cursor.setPosition(
+                    position + len(removed), QTextCursor.MoveMode.KeepAnchor
+                )
+                cursor.insertText(added)
+            cursor.endEditBlock()
+        finally:
+            self._applying = False
+        return cursor
+
+    def _onChanged(self, change: QDocumentChange):
+        if self._applying or self._paused:
+            return
+        canUndo = self.canUndo()
+        canRedo = self.canRedo()
+        edit = (change.position, change.removedText, change.addedText)
+        # a new change makes the redo steps unreachable
+        self._redoSteps.clear()
+        self._redoBytes = 0
+
+        now = time.perf_counter()
+        typing = self._coalesceTyping and _isTyping(edit)
+        # the clean index stays at the end of a step
+        clean = self.isClean()
+        if self._stepOpen and self._undoSteps and not clean:
+            self._undoSteps[-1].append(edit)
+        elif typing and not clean and self._canCoalesce(edit, now):
+            self._coalesce(edit)
+        else:
+            self._undoSteps.append([edit])
+            self._stepOpen = True
+            QTimer.singleShot(0, self._closeStep)
+        self._undoBytes += _editSize(edit)
+        self._lastTyping = now if typing else 0.0
+        self._enforceLimits()
+        self._updateModified()
+        self._notify(canUndo, canRedo)
+
+    def _onModificationChanged(self, modified: bool):
+        # set from outside, e.g. by a load, a save or a restored session
+        if self._settingModified:
+            return
+        if not modified:
+            self._cleanIndex = self.index()
+        elif self.isClean():
+            self._cleanIndex = -1
+
+    def _updateModified(self):
+        if self._editor is None:
+            return
+        self._settingModified = True
+        try:
+            self._editor.document().setModified(not self.isClean())
+        finally:
+            self._settingModified = False
+
+    def _closeStep(self):
+        self._stepOpen = False
+
+    def _canCoalesce(self, edit: _Edit, now: float) -> bool:
+        if not self._undoSteps or now - self._lastTyping > UNDO_COALESCE_INTERVAL:
+            return False
+        step = self._undoSteps[-1]
+        if len(step) != 1:
+            return False
+        position, removed, added = step[0]
+        if added and edit[2]:
+            # typing on
+            return edit[0] == position + len(added)
+        if removed and edit[1]:
+            # backspace or delete
+            return edit[0] + len(edit[1]) == position or edit[0] == position
+        return False
+
+    def _coalesce(self, edit: _Edit):
+        position, removed, added = self._undoSteps[-1][0]
+        self._undoBytes -= _editSize((position, removed, added))
+        if added:
+            merged = (position, removed, added + edit[2])
+        elif edit[0] < position:
+            # backspace
+            merged = (edit[0], edit[1] + removed, "")
+        else:
+            merged = (position, removed + edit[1], "")
+        self._undoSteps[-1][0] = merged
+        # the size of the new edit is added by the caller
+        self._undoBytes += _editSize(merged) - _editSize(edit)
+
+    def _enforceLimits(self):
+        while self._undoSteps and (
+            (self._maximumSteps and len(self._undoSteps) > self._maximumSteps)
+            or (self._maximumBytes and self.memoryUsage() > self._maximumBytes)
+        ):
+            self._undoBytes -= _stepSize(self._undoSteps.popleft())
+            self._dropped += 1
+            self._stepOpen = self._stepOpen and len(self._undoSteps) > 0
+        while self._redoSteps and (
+            self._maximumBytes and self.memoryUsage() > self._maximumBytes
+        ):
+            # the redo step furthest from the current text
+            self._redoBytes -= _stepSize(self._redoSteps.popleft())
+        # the clean index may be in the dropped steps, or in the redo steps a new
+        # change has dropped
+        last = self.index() + len(self._redoSteps)
+        if not self._dropped <= self._cleanIndex <= last:
+            self._cleanIndex = -1
+
+    def _notify(self, canUndo: bool, canRedo: bool):
+        # noinspection PyUnresolvedReferences
+        self.memoryChanged.emit(self.memoryUsage())
+        if canUndo != self.canUndo():
+            # noinspection PyUnresolvedReferences
+            self.undoAvailable.emit(self.canUndo())
+        if canRedo != self.canRedo():
+            # noinspection PyUnresolvedReferences
+            self.redoAvailable.emit(self.canRedo())
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import warnings
+from typing import Callable, Dict, List, Tuple
+
+from .QTextSnapshot import QTextSnapshot
+
+# Checkers run in a worker process: they take the text of the document and return
+# diagnostics, they must be picklable (module level functions) and must not use Qt.
+
+# (start, end, severity, message), positions are character offsets in the text
+Diagnostic = Tuple[int, int, str, str]
+Checker = Callable[[str], List[Diagnostic]]
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+
+def line_position(text: str, line: int, column: int = 1) -> int:
+    # position of a 1-based line and column in text
+    position = 0
+    for _ in range(line - 1):
+        index = text.find("\n", position)
+        if index < 0:
+            return len(text)
+        position = index + 1
+    return min(len(text), position + max(0, column - 1))
+
+
+def _diagnostic_range(text: str, start: int, end: int) -> Tuple[int, int]:
+    if end <= start:
+        end = start + 1
+    if start >= len(text):
+        # errors at the end of the text mark the last character
+        start = max(0, len(text) - 1)
+    return start, min(end, len(text))
+
+
+def check_python(text: str) -> List[Diagnostic]:
+    diagnostics = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            compile(text, "<editor>", "exec", dont_inherit=True)
+        except SyntaxError as e:
+            start = line_position(text, e.lineno or 1, e.offset or 1)
+            end = start
+            end_lineno = getattr(e, "end_lineno", None)
+            end_offset = getattr(e, "end_offset", None)
+            if end_lineno and end_offset:
+                end = line_position(text, end_lineno, end_offset)
+            start, end = _diagnostic_range(text, start, end)
+            diagnostics.append((start, end, SEVERITY_ERROR, e.msg))
+        except ValueError as e:
+            # null bytes in the source
+            diagnostics.append((0, min(1, len(text)), SEVERITY_ERROR, str(e)))
+    for warning in caught:
+        if not issubclass(warning.category, SyntaxWarning):
+            continue
+        start = line_position(text, warning.lineno or 1)
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        start, end = _diagnostic_range(text, start, end)
+        diagnostics.append((start, end, SEVERITY_WARNING, str(warning.message)))
+    return diagnostics
+
+
+def check_json(text: str) -> List[Diagnostic]:
+    if not text.strip():
+        return []
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        start, end = _diagnostic_range(text, e.pos, e.pos)
+        return [(start, end, SEVERITY_ERROR, e.msg)]
+    return []
+
+
+_CHECKERS: Dict[str, Checker] = {
+    "python": check_python,
+    "json": check_json,
+}
+
+
+def run_checker(checker: Checker, snapshot: QTextSnapshot) -> List[Diagnostic]:
+    # the snapshot is joined in the worker instead of the GUI thread
+    return checker(snapshot.text())
+
+
+def register_checker(language: str, checker: Checker):
+    _CHECKERS[language.lower()] = checker
+
+
+def get_checker(language: str) -> Checker | None:
+    return _CHECKERS.get(language.lower(), None)
@@ -1,7 +1,14 @@
-from .QPythonCompleter import QPythonCompleter
-from .QCXXCompleter import QCXXCompleter
-from .QLuaCompleter import QLuaCompleter
-from .QGLSLCompleter import QGLSLCompleter
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .. import utils
+
+if TYPE_CHECKING:
+    from .QPythonCompleter import QPythonCompleter
+    from .QCXXCompleter import QCXXCompleter
+    from .QLuaCompleter import QLuaCompleter
+    from .QGLSLCompleter import QGLSLCompleter
 
 __all__ = [
     "QPythonCompleter",
@@ -9,3 +16,6 @@ __all__ = [
     "QLuaCompleter",
     "QGLSLCompleter",
 ]
+
+# the completer modules are imported on first use
+utils.install_lazy_attributes(__name__, {name: f".{name}" for name in __all__})
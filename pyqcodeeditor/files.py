@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import codecs
+import hashlib
+import locale
+import os
+import secrets
+from typing import Callable, Iterator, List, NamedTuple, Tuple
+
+from . import instrumentation
+from .QTextSnapshot import QTextSnapshot
+
+# File functions run in worker threads, they only use snapshots and never touch Qt.
+
+# Encoded bytes collected before each write (and progress report)
+SAVE_BLOCK_SIZE: int = 1 << 20
+# Bytes read and decoded at once when loading a file
+LOAD_BLOCK_SIZE: int = 1 << 20
+# Bytes at the start of a file looked at to guess its encoding
+SNIFF_SIZE: int = 1 << 16
+# Tried in order when the start of a file is not valid UTF-8, latin-1 never fails
+FALLBACK_ENCODINGS: List[str] = ["cp1252", "latin-1"]
+
+# longest first, the UTF-32 LE mark starts with the UTF-16 LE one
+_BOMS: List[Tuple[bytes, str]] = [
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+# (characters written, total characters)
+Progress = Callable[[int, int], None]
+# (content digest, file size, file modification time in ns) after a save
+SaveState = Tuple[str, int, int]
+
+
+def _content_hash():
+    return hashlib.blake2b(digest_size=20)
+
+
+def _bom(encoding: str) -> bytes:
+    name = codecs.lookup(encoding).name
+    for bom, bomEncoding in _BOMS:
+        if bomEncoding == name:
+            return bom
+    return b""
+
+
+def _encoded_blocks(
+    snapshot: QTextSnapshot, encoding: str, newline: str, bom: bool = False
+) -> Iterator[Tuple[bytes, int]]:
+    # (encoded block, number of characters encoded so far)
+    encoder = codecs.getincrementalencoder(encoding)("strict")
+    parts = [_bom(encoding)] if bom else []
+    size = 0
+    position = 0
+    for chunk in snapshot.chunks():
+        position += len(chunk)
+        if newline != "\n":
+            chunk = chunk.replace("\n", newline)
+        data = encoder.encode(chunk)
+        parts.append(data)
+        size += len(data)
+        if size >= SAVE_BLOCK_SIZE:
+            yield b"".join(parts), position
+            parts = []
+            size = 0
+    parts.append(encoder.encode("", final=True))
+    yield b"".join(parts), position
+
+
+def content_digest(
+    snapshot: QTextSnapshot, encoding: str, newline: str, bom: bool = False
+) -> str:
+    digest = _content_hash()
+    for data, _ in _encoded_blocks(snapshot, encoding, newline, bom):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _file_state(path: str) -> Tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _create_temp(path: str) -> Tuple[int, str]:
+    # (descriptor, path) of a new file next to path, with the permissions of a new
+    # file: the system applies the umask of the process to them, os.umask() could
+    # only read it by setting it, racing with the files other threads create
+    directory, name = os.path.split(path)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        temp = os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+        try:
+            return os.open(temp, flags, 0o666), temp
+        except FileExistsError:
+            continue
+
+
+def _fsync_directory(directory: str):
+    # makes the rename durable, not available on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@instrumentation.instrumented("files.save")
+def save_snapshot(
+    snapshot: QTextSnapshot,
+    path: str,
+    encoding: str = "utf-8",
+    newline: str = "\n",
+    previous: SaveState | None = None,
+    progress: Progress | None = None,
+    bom: bool = False,
+) -> Tuple[SaveState, bool]:
+    # Writes the snapshot to a temporary file next to path, syncs it and renames it
+    # over path, the file is either the old or the new content after a crash.
+    # Returns the state of the file and whether it has been written: nothing is
+    # written when the file is still as saved last time (previous) and the content
+    # digest is unchanged. A symbolic link is kept, its target is replaced.
+    path = os.path.realpath(path)
+    if previous is not None and _file_state(path) == previous[1:]:
+        digest = content_digest(snapshot, encoding, newline, bom)
+        if digest == previous[0]:
+            return previous, False
+
+    directory = os.path.dirname(path)
+    fd, temp = _create_temp(path)
+    total = len(snapshot)
+    hash_ = _content_hash()
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for data, position in _encoded_blocks(snapshot, encoding, newline, bom):
+                file.write(data)
+                hash_.update(data)
+                if progress is not None:
+                    progress(position, total)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            # the permissions of the file replaced
+            os.chmod(temp, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        # the state of the temporary file: path may be gone again after the rename,
+        # which keeps the size and modification time
+        stat = os.stat(temp)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+    return (hash_.hexdigest(), stat.st_size, stat.st_mtime_ns), True
+
+
+# noinspection PyPep8Naming
+class LoadedFile(NamedTuple):
+    # text with "\n" line endings
+    text: str
+    encoding: str
+    # the most frequent line ending of the file
+    newline: str
+    bom: bool
+    # bytes not valid in encoding have been replaced with U+FFFD
+    lossy: bool
+    # state of the file as saved by save_snapshot(), the file is not written again
+    # until its content changes
+    state: SaveState
+
+
+def _sniff_encoding(data: bytes, final: bool) -> str:
+    # data is the start of the file, a character may be cut at its end
+    if data:
+        # UTF-16 without BOM: one byte of most ASCII characters is zero, which is
+        # valid UTF-8 too
+        even = data[0::2].count(0)
+        odd = data[1::2].count(0)
+        if odd > len(data) // 4 and even < odd // 8:
+            return "utf-16-le"
+        if even > len(data) // 4 and odd < even // 8:
+            return "utf-16-be"
+    try:
+        codecs.getincrementaldecoder("utf-8")("strict").decode(data, final)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    candidates = [locale.getpreferredencoding(False)] + FALLBACK_ENCODINGS
+    for encoding in candidates:
+        try:
+            codecs.getincrementaldecoder(encoding)("strict").decode(data, final)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return "latin-1"
+
+
+@instrumentation.instrumented("files.load")
+def load_file(path: str, encoding: str | None = None) -> LoadedFile:
+    # Reads the file once: the BOM and the start of the file give the encoding
+    # (unless one is given), the blocks are then decoded by a streaming decoder and
+    # their line endings normalized in the same pass.
+    hash_ = _content_hash()
+    with open(path, "rb", buffering=0) as file:
+        stat = os.fstat(file.fileno())
+        data = file.read(max(LOAD_BLOCK_SIZE, SNIFF_SIZE))
+        hash_.update(data)
+        final = len(data) < max(LOAD_BLOCK_SIZE, SNIFF_SIZE)
+
+        bom = False
+        # a given encoding matches the BOM whatever its spelling (e.g. "UTF8")
+        name = codecs.lookup(encoding).name if encoding is not None else None
+        for mark, bomEncoding in _BOMS:
+            if data.startswith(mark) and name in (None, bomEncoding):
+                encoding = bomEncoding
+                data = data[len(mark) :]
+                bom = True
+                break
+        if encoding is None:
+            encoding = _sniff_encoding(
+                data[:SNIFF_SIZE], final and len(data) <= SNIFF_SIZE
+            )
+
+        decoder = codecs.getincrementaldecoder(encoding)("strict")
+        lossy = False
+        parts = []
+        newlines = {"\n": 0, "\r\n": 0, "\r": 0}
+        # a "\r" at the end of a block may be followed by "\n" in the next one
+        pending = ""
+        while True:
+            try:
+                text = decoder.decode(data, final)
+            except UnicodeDecodeError:
+                # the rest of the file is decoded with replacement characters
+                buffered = decoder.getstate()[0]
+                decoder = codecs.getincrementaldecoder(encoding)("replace")
+                text = decoder.decode(buffered + data, final)
+                lossy = True
+            text = pending + text
+            pending = ""
+            if text.endswith("\r") and not final:
+                pending = "\r"
+                text = text[:-1]
+            if "\r" in text:
+                crlf = text.count("\r\n")
+                newlines["\r\n"] += crlf
+                newlines["\r"] += text.count("\r") - crlf
+                newlines["\n"] += text.count("\n") - crlf
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            else:
+                newlines["\n"] += text.count("\n")
+            parts.append(text)
+            if final:
+                break
+            data = file.read(LOAD_BLOCK_SIZE)
+            hash_.update(data)
+            final = len(data) < LOAD_BLOCK_SIZE
+    newline = max(newlines, key=lambda key: newlines[key])
+    if not newlines[newline]:
+        newline = "\n"
+    state = (hash_.hexdigest(), stat.st_size, stat.st_mtime_ns)
+    return LoadedFile("".join(parts), encoding, newline, bom, lossy, state)
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from qtpy.QtCore import QRegularExpression
 
+from .. import regex_safety
+
 
 class QHighlightBlockRule(object):
     def __init__(
@@ -13,3 +15,6 @@ class QHighlightBlockRule(object):
         self.startPattern = start or QRegularExpression()
         self.endPattern = end or QRegularExpression()
         self.formatName = f or ""
+        # warns about the patterns that may backtrack catastrophically
+        regex_safety.check_pattern(self.startPattern.pattern())
+        regex_safety.check_pattern(self.endPattern.pattern())
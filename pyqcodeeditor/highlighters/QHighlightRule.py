@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+from typing import Dict
+
 from qtpy.QtCore import QRegularExpression
 
+from .. import regex_safety
+
 
 class QHighlightRule(object):
-    def __init__(self, p: QRegularExpression | None = None, f: str | None = None):
+    def __init__(
+        self,
+        p: QRegularExpression | None = None,
+        f: str | None = None,
+        groups: Dict[int, str] | None = None,
+    ):
         self.pattern: QRegularExpression = p or QRegularExpression()
         self.formatName: str = f or ""
+        # capture group of the pattern -> format name applied over formatName
+        self.groupFormats: Dict[int, str] = dict(groups or {})
+        # warns about the patterns that may backtrack catastrophically
+        regex_safety.check_pattern(self.pattern.pattern())
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-from typing import List
-
 from qtpy.QtCore import QRegularExpression
-from qtpy.QtGui import QTextDocument
+from qtpy.QtGui import QTextBlock, QTextDocument
 
 from .QHighlightRule import QHighlightRule
-from ..QStyleSyntaxHighlighter import QStyleSyntaxHighlighter
+from .QLexerHighlighter import QLexerHighlighter
+from ..QCodeFolding import QFoldingStrategy, QBraceFoldingStrategy
 
 _KEYWORDS = [
     "true",
@@ -16,45 +15,57 @@ _KEYWORDS = [
 
 
 # noinspection PyPep8Naming
-class QJSONHighlighter(QStyleSyntaxHighlighter):
+class QJSONFoldingStrategy(QBraceFoldingStrategy):
+    # Brace folding whose regions come from a QJSONIndex (set by the index when
+    # attached to the editor) instead of walking the lines
+    def __init__(self):
+        super().__init__("{[", "}]")
+        self._index = None
+
+    def setStructuralIndex(self, index):
+        self._index = index
+
+    def structuralIndex(self):
+        return self._index
+
+    def regionEnd(self, block: QTextBlock) -> int:
+        index = self._index
+        if (
+            index is None
+            or index.isPending()
+            or index.editor() is None
+            or index.editor().document() is not block.document()
+        ):
+            return super().regionEnd(block)
+        return index.foldRegionEnd(block.blockNumber())
+
+
+# noinspection PyPep8Naming
+class QJSONHighlighter(QLexerHighlighter):
     def __init__(self, document: QTextDocument | None = None):
         super().__init__(document)
-        self.m_highlightRules: List[QHighlightRule] = []
         self.m_keyRegex: QRegularExpression = QRegularExpression(
             r'(("[ ^\r\n:]+?")\s*:)'
         )
 
-        for kw in _KEYWORDS:
-            self.m_highlightRules.append(
-                QHighlightRule(QRegularExpression(rf"(\b{kw}\b)"), "Keyword")
-            )
+        # Keys, before the strings they start with
+        self.m_highlightRules.append(QHighlightRule(self.m_keyRegex, "Keyword"))
+
+        # Strings
+        self.m_highlightRules.append(
+            QHighlightRule(QRegularExpression(r'("[^\n"]*")'), "String")
+        )
 
         # Numbers
         self.m_highlightRules.append(
             (QHighlightRule(QRegularExpression(R"(\b(0b|0x){0,1}[\d.']+\b)"), "Number"))
         )
 
-        # Strings
         self.m_highlightRules.append(
-            QHighlightRule(QRegularExpression(r'("[^\n"]*")'), "String")
+            QHighlightRule(
+                QRegularExpression(rf"(\b(?:{'|'.join(_KEYWORDS)})\b)"), "Keyword"
+            )
         )
 
-    def highlightBlock(self, text: str):
-        for rule in self.m_highlightRules:
-            matchIterator = rule.pattern.globalMatch(text)
-            while matchIterator.hasNext():
-                match = matchIterator.next()
-                self.setFormat(
-                    match.capturedStart(),
-                    match.capturedLength(),
-                    self.syntaxStyle().getFormat(rule.formatName),
-                )
-
-        matchIterator = self.m_keyRegex.globalMatch(text)
-        while matchIterator.hasNext():
-            match = matchIterator.next()
-            self.setFormat(
-                match.capturedStart(1),
-                match.capturedLength(1),
-                self.syntaxStyle().getFormat("Keyword"),
-            )
+    def createFoldingStrategy(self) -> QFoldingStrategy | None:
+        return QJSONFoldingStrategy()
@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import statistics
+import time
+import warnings
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from qtpy.QtCore import QRegularExpression
+
+from .QHighlightBlockRule import QHighlightBlockRule
+from .QHighlightRule import QHighlightRule
+from ..regex_backend import (
+    BACKEND_AUTO,
+    BACKEND_PYTHON,
+    BACKEND_QT,
+    RegexBackend,
+    compile_pattern,
+)
+
+# options of a rule pattern kept inside its alternative of the scanner
+_INLINE_OPTIONS = (
+    (QRegularExpression.PatternOption.CaseInsensitiveOption, "i"),
+    (QRegularExpression.PatternOption.DotMatchesEverythingOption, "s"),
+    (QRegularExpression.PatternOption.MultilineOption, "m"),
+    (QRegularExpression.PatternOption.ExtendedPatternSyntaxOption, "x"),
+    (QRegularExpression.PatternOption.InvertedGreedinessOption, "U"),
+)
+
+# (start, length, format name)
+Token = Tuple[int, int, str]
+
+# ASCII lines scanned with both backends before BACKEND_AUTO keeps the faster one
+CALIBRATION_LINES = 32
+
+# (scanner, end pattern of each block rule or None, (index, pattern) of each rule
+# matched on its own)
+_Backends = Tuple[
+    RegexBackend, List[Optional[RegexBackend]], List[Tuple[int, RegexBackend]]
+]
+
+
+def rule_pattern(rule: QHighlightRule | QHighlightBlockRule) -> QRegularExpression:
+    # the pattern a rule starts its token with
+    if isinstance(rule, QHighlightBlockRule):
+        return rule.startPattern
+    return rule.pattern
+
+
+# noinspection PyPep8Naming
+class QLexer(object):
+    # Scans a line once from left to right with its rules combined into one pattern
+    # of alternatives. Where several rules match at the leftmost position the first
+    # one in the list wins and the scan goes on after its match, so each character
+    # belongs to one token at most. A QHighlightBlockRule opens a region that lasts
+    # up to its end pattern, on the next lines if needed: the state of a line is 0
+    # or 1 + the index of the rule of the region open at its end.
+    #
+    # separate maps the index of a rule to a pattern matched on its own in place of
+    # the rule's (e.g. a copy limited with (*LIMIT_MATCH), which only applies to a
+    # whole pattern), or to None to leave the rule out. Its matches compete with the
+    # ones of the scanner as an alternative of it would.
+    def __init__(
+        self,
+        rules: Sequence[QHighlightRule | QHighlightBlockRule],
+        backend: str = BACKEND_AUTO,
+        separate: Dict[int, QRegularExpression | None] | None = None,
+    ):
+        self._rules: List[QHighlightRule | QHighlightBlockRule] = list(rules)
+        self._separate: Dict[int, QRegularExpression | None] = dict(separate or {})
+        # capture group of the scanner -> index of its rule
+        self._groupRules: List[int] = [-1]
+        # index of a rule -> capture group of its alternative, -1 outside of it
+        self._ruleGroups: List[int] = []
+        parts = []
+        options = QRegularExpression.PatternOption.NoPatternOption
+        for index, rule in enumerate(self._rules):
+            if index in self._separate:
+                self._ruleGroups.append(-1)
+                continue
+            pattern = rule_pattern(rule)
+            patternOptions = pattern.patternOptions()
+            flags = "".join(
+                flag for option, flag in _INLINE_OPTIONS if patternOptions & option
+            )
+            unicode = QRegularExpression.PatternOption.UseUnicodePropertiesOption
+            if patternOptions & unicode:
+                options |= unicode
+            # numbered back references would be shifted by the groups of the rules
+            # before, the patterns may only use named ones
+            parts.append(f"((?{flags}:{pattern.pattern()}))")
+            self._ruleGroups.append(len(self._groupRules))
+            self._groupRules.extend([index] * (1 + pattern.captureCount()))
+        self._scanner = QRegularExpression("|".join(parts) or "(?!)", options)
+        if not self._scanner.isValid():
+            warnings.warn(
+                f"The highlighting rules cannot be combined: "
+                f"{self._scanner.errorString()}"
+            )
+        else:
+            self._scanner.optimize()
+        # backend name -> (scanner, end pattern of each block rule or None, index
+        # and pattern of the rules matched on their own)
+        self._backends: Dict[str, _Backends] = {}
+        kinds = [BACKEND_QT, BACKEND_PYTHON] if backend == BACKEND_AUTO else [backend]
+        for kind in kinds:
+            # a pattern re cannot read falls back on Qt
+            scanner = compile_pattern(self._scanner, kind)
+            ends = [
+                (
+                    compile_pattern(rule.endPattern, kind)
+                    if isinstance(rule, QHighlightBlockRule)
+                    else None
+                )
+                for rule in self._rules
+            ]
+            others = [
+                (index, compile_pattern(pattern, kind))
+                for index, pattern in sorted(self._separate.items())
+                if pattern is not None and pattern.isValid()
+            ]
+            self._backends.setdefault(scanner.name, (scanner, ends, others))
+        self._backend = next(iter(self._backends))
+        # seconds spent by each backend on each calibration line
+        self._calibration: Dict[str, List[float]] = {
+            name: [] for name in self._backends
+        }
+        self._calibrationLines = CALIBRATION_LINES if len(self._backends) > 1 else 0
+        # duration of the slowest search of the scanner in the last tokens()
+        self._slowestSearch: float = 0.0
+        # index of a rule matched on its own -> duration of its searches in the last
+        # tokens()
+        self._separateTimes: Dict[int, float] = {}
+
+    def rules(self) -> List[QHighlightRule | QHighlightBlockRule]:
+        return list(self._rules)
+
+    def separate(self) -> Dict[int, QRegularExpression | None]:
+        return dict(self._separate)
+
+    def scannedRules(self) -> List[int]:
+        # indexes of the rules in the scanner
+        return [index for index, group in enumerate(self._ruleGroups) if group >= 0]
+
+    def definition(self) -> Tuple[Tuple[tuple, ...], Tuple[tuple, ...]]:
+        # the rules and the separate patterns as picklable (and hashable) data,
+        # fromDefinition() builds the same lexer from it, e.g. in another process
+        definition = []
+        for rule in self._rules:
+            if isinstance(rule, QHighlightBlockRule):
+                definition.append(
+                    (
+                        rule.startPattern.pattern(),
+                        rule.startPattern.patternOptions(),
+                        rule.endPattern.pattern(),
+                        rule.endPattern.patternOptions(),
+                        rule.formatName,
+                    )
+                )
+            else:
+                definition.append(
+                    (
+                        rule.pattern.pattern(),
+                        rule.pattern.patternOptions(),
+                        rule.formatName,
+                        tuple(sorted(rule.groupFormats.items())),
+                    )
+                )
+        separate = tuple(
+            (
+                (index, None, None)
+                if pattern is None
+                else (index, pattern.pattern(), pattern.patternOptions())
+            )
+            for index, pattern in sorted(self._separate.items())
+        )
+        return tuple(definition), separate
+
+    @classmethod
+    def fromDefinition(
+        cls,
+        definition: Tuple[Sequence[tuple], Sequence[tuple]],
+        backend: str = BACKEND_AUTO,
+    ) -> QLexer:
+        ruleItems, separateItems = definition
+        rules: List[QHighlightRule | QHighlightBlockRule] = []
+        for item in ruleItems:
+            if len(item) == 5:
+                start, startOptions, end, endOptions, formatName = item
+                rules.append(
+                    QHighlightBlockRule(
+                        QRegularExpression(start, startOptions),
+                        QRegularExpression(end, endOptions),
+                        formatName,
+                    )
+                )
+            else:
+                pattern, options, formatName, groups = item
+                rules.append(
+                    QHighlightRule(
+                        QRegularExpression(pattern, options), formatName, dict(groups)
+                    )
+                )
+        separate = {
+            index: None if pattern is None else QRegularExpression(pattern, options)
+            for index, pattern, options in separateItems
+        }
+        return cls(rules, backend, separate)
+
+    def scanner(self) -> QRegularExpression:
+        return self._scanner
+
+    def backend(self) -> str:
+        # name of the backend scanning the lines, BACKEND_QT until the calibration
+        # of BACKEND_AUTO is over
+        return self._backend
+
+    def slowestSearch(self) -> float:
+        # backtracking shows in a single search, the number of searches grows with
+        # the tokens of the line
+        return self._slowestSearch
+
+    def separateTimes(self) -> Dict[int, float]:
+        # duration of the searches of each rule matched on its own in the last
+        # tokens()
+        return dict(self._separateTimes)
+
+    def tokens(self, text: str, state: int = 0) -> Tuple[List[Token], int]:
+        # the tokens of text, in order and without overlaps, and the state at its
+        # end
+        if self._calibrationLines and text and text.isascii():
+            tokens, state, self._slowestSearch = self._calibrate(text, state)
+        else:
+            backends = self._backends[self._backend]
+            tokens, state, self._slowestSearch = self._scan(text, state, backends)
+        return tokens, state
+
+    def _calibrate(self, text: str, state: int) -> Tuple[List[Token], int, float]:
+        # scans text with each backend, the result of the current one is kept. The
+        # backend going first alternates, the median time of a line is compared.
+        results = {}
+        names = list(self._backends)
+        if self._calibrationLines % 2:
+            names.reverse()
+        for name in names:
+            start = time.perf_counter()
+            results[name] = self._scan(text, state, self._backends[name])
+            self._calibration[name].append(time.perf_counter() - start)
+        result = results[self._backend]
+        if any(other[:2] != result[:2] for other in results.values()):
+            # re does not read the patterns as PCRE does after all
+            self._backends = {self._backend: self._backends[self._backend]}
+            self._calibrationLines = 0
+            return result
+        self._calibrationLines -= 1
+        if not self._calibrationLines:
+            self._backend = min(
+                self._calibration,
+                key=lambda name: statistics.median(self._calibration[name]),
+            )
+            self._backends = {self._backend: self._backends[self._backend]}
+        return result
+
+    def _scan(
+        self, text: str, state: int, backends: _Backends
+    ) -> Tuple[List[Token], int, float]:
+        # (tokens, state, duration of the slowest search of the scanner)
+        backend, ends, others = backends
+        self._separateTimes = {}
+        tokens: List[Token] = []
+        position = 0
+        if 0 < state <= len(self._rules):
+            rule = self._rules[state - 1]
+            if isinstance(rule, QHighlightBlockRule):
+                position = ends[state - 1].searchEnd(text, 0)
+                if position < 0:
+                    tokens.append((0, len(text), rule.formatName))
+                    return tokens, state, 0.0
+                tokens.append((0, position, rule.formatName))
+        if not self._scanner.isValid():
+            return tokens, 0, 0.0
+        if others:
+            return self._scanWithOthers(text, position, tokens, backends)
+        groupRules = self._groupRules
+        rules = self._rules
+        slowest = 0.0
+        searchStart = time.perf_counter()
+        spans = iter(backend.spans(text, position))
+        while True:
+            span = next(spans, None)
+            searchEnd = time.perf_counter()
+            slowest = max(slowest, searchEnd - searchStart)
+            if span is None:
+                return tokens, 0, slowest
+            searchStart = searchEnd
+            start, end, group = span
+            index = groupRules[group]
+            rule = rules[index]
+            if isinstance(rule, QHighlightBlockRule):
+                regionEnd = ends[index].searchEnd(text, end)
+                if regionEnd < 0:
+                    tokens.append((start, len(text) - start, rule.formatName))
+                    return tokens, index + 1, slowest
+                tokens.append((start, regionEnd - start, rule.formatName))
+                # the matches after the start of the region may overlap its end
+                searchStart = time.perf_counter()
+                spans = iter(backend.spans(text, regionEnd))
+                continue
+            if end == start:
+                continue
+            if rule.groupFormats:
+                group = self._ruleGroups[index]
+                tokens.extend(self._groupTokens(rule, backend, group, start, end))
+            elif rule.formatName:
+                tokens.append((start, end - start, rule.formatName))
+            searchStart = time.perf_counter()
+
+    def _scanWithOthers(
+        self, text: str, position: int, tokens: List[Token], backends: _Backends
+    ) -> Tuple[List[Token], int, float]:
+        # _scan() with rules matched on their own: the token is the leftmost of the
+        # next match of the scanner and of each of these rules, the first rule on a
+        # tie, and a search is started again after the token where its next match
+        # overlaps it
+        backend, ends, others = backends
+        rules = self._rules
+        times = self._separateTimes
+        slowest = 0.0
+        # [rule index or -1 for the scanner, backend, spans, next span or None]
+        searches = [[-1, backend, None, None]]
+        searches.extend([index, other, None, None] for index, other in others)
+
+        def advance(search: list, restart: bool):
+            nonlocal slowest
+            searchStart = time.perf_counter()
+            if restart:
+                search[2] = iter(search[1].spans(text, position))
+            search[3] = next(search[2], None)
+            spent = time.perf_counter() - searchStart
+            if search[0] < 0:
+                slowest = max(slowest, spent)
+            else:
+                times[search[0]] = times.get(search[0], 0.0) + spent
+
+        for search in searches:
+            advance(search, True)
+        while True:
+            best = None
+            bestIndex = -1
+            for search in searches:
+                span = search[3]
+                if span is None:
+                    continue
+                if span[0] < position:
+                    advance(search, True)
+                    span = search[3]
+                    if span is None:
+                        continue
+                index = self._groupRules[span[2]] if search[0] < 0 else search[0]
+                if best is None or (span[0], index) < (best[3][0], bestIndex):
+                    best, bestIndex = search, index
+            if best is None:
+                return tokens, 0, slowest
+            start, end, group = best[3]
+            rule = rules[bestIndex]
+            if isinstance(rule, QHighlightBlockRule):
+                regionEnd = ends[bestIndex].searchEnd(text, end)
+                if regionEnd < 0:
+                    tokens.append((start, len(text) - start, rule.formatName))
+                    return tokens, bestIndex + 1, slowest
+                tokens.append((start, regionEnd - start, rule.formatName))
+                position = regionEnd
+                continue
+            if end > start:
+                if rule.groupFormats:
+                    if best[0] < 0:
+                        group = self._ruleGroups[bestIndex]
+                    else:
+                        group = 0
+                    tokens.extend(self._groupTokens(rule, best[1], group, start, end))
+                elif rule.formatName:
+                    tokens.append((start, end - start, rule.formatName))
+                position = end
+            # the search of the token goes on after it
+            advance(best, False)
+
+    @staticmethod
+    def _groupTokens(
+        rule: QHighlightRule, backend: RegexBackend, group: int, start: int, end: int
+    ) -> List[Token]:
+        # the match of rule cut into the tokens of its groups and of the rest, a
+        # group formatted over the ones before it
+        pieces = [(start, end, rule.formatName)]
+        for ruleGroup, formatName in rule.groupFormats.items():
+            groupStart, groupEnd = backend.groupSpan(group + ruleGroup)
+            if groupStart < 0 or groupEnd <= groupStart:
+                continue
+            cut = []
+            for pieceStart, pieceEnd, pieceName in pieces:
+                if pieceEnd <= groupStart or pieceStart >= groupEnd:
+                    cut.append((pieceStart, pieceEnd, pieceName))
+                    continue
+                if pieceStart < groupStart:
+                    cut.append((pieceStart, groupStart, pieceName))
+                if pieceEnd > groupEnd:
+                    cut.append((groupEnd, pieceEnd, pieceName))
+            cut.append((groupStart, groupEnd, formatName))
+            pieces = sorted(cut)
+        return [
+            (pieceStart, pieceEnd - pieceStart, name)
+            for pieceStart, pieceEnd, name in pieces
+            if name
+        ]
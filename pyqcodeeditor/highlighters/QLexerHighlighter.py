@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import os
+import time
+import warnings
+from concurrent.futures import BrokenExecutor, Executor, Future
+from functools import partial
+from typing import Dict, List
+
+from qtpy.QtCore import QRegularExpression, QTimer, Signal
+from qtpy.QtGui import QTextCursor, QTextDocument
+
+from .QHighlightBlockRule import QHighlightBlockRule
+from .QHighlightRule import QHighlightRule
+from .QLexer import QLexer, rule_pattern
+from .. import parallel_highlighting, regex_safety
+from ..QStyleSyntaxHighlighter import (
+    LONG_LINE_LENGTH,
+    RULE_MATCH_LIMIT,
+    RULE_TIME_BUDGET,
+    QStyleSyntaxHighlighter,
+)
+from ..regex_backend import BACKEND_AUTO
+
+
+# noinspection PyPep8Naming
+class QLexerHighlighter(QStyleSyntaxHighlighter):
+    # Highlights each block in one pass of a QLexer built from m_highlightRules
+
+    # (generation, index of the chunk, result of tokenize_chunk() or the exception
+    # of its worker)
+    _tokenized = Signal(int, int, object)
+
+    def __init__(self, document: QTextDocument | None = None):
+        # the document is set once the attributes of setDocument() exist
+        super().__init__(None)
+        # in priority order: where several rules match at the same position the
+        # first one wins
+        self.m_highlightRules: List[QHighlightRule | QHighlightBlockRule] = []
+        self._lexer: QLexer | None = None
+        self._regexBackend = BACKEND_AUTO
+        self._parallelHighlighting: bool = False
+        self._parallelExecutor: Executor | None = None
+        # lines tokenized ahead by rehighlightInParallel()
+        self._tokenTable: parallel_highlighting.TokenTable | None = None
+        # [cursor at its first block, first line, end line, result or None, future]
+        # of each chunk of the table, merged in order
+        self._chunks: List[list] = []
+        self._mergedChunks: int = 0
+        # cursor at the last block of the table
+        self._chunksLast: QTextCursor | None = None
+        # bumped by every rehighlightInParallel() and cancel, the results of the
+        # older ones are dropped
+        self._generation: int = 0
+        # whether the chunks are tokenized by the pool of parallel_highlighting
+        self._sharedExecutor: bool = False
+        # restarted by every chunk tokenized
+        self._tokenizingTimer = QTimer(self)
+        self._tokenizingTimer.setSingleShot(True)
+        self._tokenizingTimer.setInterval(
+            int(parallel_highlighting.PARALLEL_CHUNK_TIMEOUT * 1000)
+        )
+        # noinspection PyUnresolvedReferences
+        self._tokenizingTimer.timeout.connect(self._onTokenizingTimeout)
+        # noinspection PyUnresolvedReferences
+        self._tokenized.connect(self._onTokenized)
+        if document is not None:
+            self.setDocument(document)
+
+    def setDocument(self, doc: QTextDocument | None):
+        # the table and its cursors belong to the previous document
+        self._cancelTokenizing(requeue=False)
+        super().setDocument(doc)
+
+    def lexer(self) -> QLexer:
+        # built on first use, invalidateLexer() after changing the rules. A rule
+        # regex_safety finds catastrophic or found slow on a line is matched on its
+        # own with its limited copy, out of the combined pattern, a disabled one is
+        # left out.
+        if self._lexer is None:
+            separate: Dict[int, QRegularExpression | None] = {}
+            for index, rule in enumerate(self.m_highlightRules):
+                pattern = rule_pattern(rule)
+                if regex_safety.is_catastrophic(pattern.pattern()):
+                    self.limitPattern(pattern)
+                matching = self.guardedPattern(pattern)
+                if matching is not pattern:
+                    separate[index] = matching
+            self._lexer = QLexer(self.m_highlightRules, self._regexBackend, separate)
+        return self._lexer
+
+    def regexBackend(self) -> str:
+        return self._regexBackend
+
+    def setRegexBackend(self, backend: str):
+        # one of the BACKEND_* names of regex_backend, BACKEND_AUTO by default
+        if backend != self._regexBackend:
+            self._regexBackend = backend
+            self.invalidateLexer()
+
+    def invalidateLexer(self):
+        self._lexer = None
+        # the table has been tokenized with the previous lexer
+        if self._tokenTable is not None:
+            self._cancelTokenizing()
+
+    def resetPatternGuards(self):
+        super().resetPatternGuards()
+        self.invalidateLexer()
+
+    def parallelHighlighting(self) -> bool:
+        return self._parallelHighlighting
+
+    def setParallelHighlighting(self, enabled: bool, executor: Executor | None = None):
+        # Whether rehighlightLater() goes through rehighlightInParallel() for the
+        # ranges of PARALLEL_MIN_LINES blocks or more, with executor or the pool of
+        # parallel_highlighting. Off by default: the processes of the pool import the
+        # main module of the application, which must be guarded by
+        # if __name__ == "__main__" (see parallel_highlighting).
+        self._parallelHighlighting = enabled
+        self._parallelExecutor = executor
+
+    def rehighlightLater(self, start: int, end: int):
+        # a large range (e.g. a loaded document or a large paste) is tokenized in
+        # parallel first
+        doc = self.document()
+        if doc is not None and self._parallelHighlighting:
+            lastPosition = doc.characterCount() - 1
+            first = doc.findBlock(max(0, min(start, lastPosition))).blockNumber()
+            last = doc.findBlock(max(0, min(end, lastPosition))).blockNumber()
+            if last - first + 1 >= parallel_highlighting.PARALLEL_MIN_LINES:
+                if self.rehighlightInParallel(first, last, self._parallelExecutor):
+                    return
+        super().rehighlightLater(start, end)
+
+    def rehighlightInParallel(
+        self, first: int = 0, last: int = -1, executor: Executor | None = None
+    ) -> bool:
+        # Highlights blocks first to last (the last block by default) with their
+        # lines tokenized by executor or by the pool of parallel_highlighting, e.g.
+        # for the first highlighting of a large document. The chunks of lines are
+        # highlighted by the deferred steps as they are tokenized, in order, the
+        # blocks of the following ones are skipped meanwhile. Returns False,
+        # without highlighting anything, for fewer than PARALLEL_MIN_LINES blocks, a
+        # single core or a pool that cannot be used.
+        doc = self.document()
+        if doc is None:
+            return False
+        if last < 0:
+            last = doc.blockCount() - 1
+        processes = os.cpu_count() or 1
+        if last - first + 1 < parallel_highlighting.PARALLEL_MIN_LINES or (
+            executor is None and processes < 2
+        ):
+            return False
+        self._cancelTokenizing()
+        lines = doc.toRawText().split("\u2029")[first : last + 1]
+        previous = doc.findBlockByNumber(first).previous()
+        state = max(0, previous.userState()) if previous.isValid() else 0
+        shared = executor is None
+        try:
+            chunks = parallel_highlighting.submit_chunks(
+                self.lexer(),
+                lines,
+                LONG_LINE_LENGTH,
+                self._regexBackend,
+                parallel_highlighting.executor() if shared else executor,
+                processes,
+            )
+        except (RuntimeError, OSError, NotImplementedError, ValueError) as e:
+            # e.g. a pool broken by a crashed worker or no processes
+            warnings.warn(f"Can't tokenize the document in parallel: {e}")
+            if shared:
+                parallel_highlighting.reset_executor()
+            return False
+        self._tokenTable = parallel_highlighting.TokenTable(lines, first, state)
+        self._sharedExecutor = shared
+        self._tokenizingTimer.start()
+        self._chunksLast = QTextCursor(doc)
+        self._chunksLast.setPosition(doc.findBlockByNumber(last).position())
+        for index, (chunkFirst, chunkEnd, future) in enumerate(chunks):
+            cursor = QTextCursor(doc)
+            cursor.setPosition(doc.findBlockByNumber(first + chunkFirst).position())
+            self._chunks.append([cursor, chunkFirst, chunkEnd, None, future])
+            future.add_done_callback(
+                partial(self._chunkDone, self._generation, index, shared)
+            )
+        return True
+
+    def _chunkDone(self, generation: int, index: int, shared: bool, future: Future):
+        # in a thread of the executor
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenExecutor) and shared:
+            parallel_highlighting.reset_executor()
+        try:
+            # noinspection PyUnresolvedReferences
+            self._tokenized.emit(generation, index, error if error else future.result())
+        except RuntimeError:
+            # the highlighter has been deleted meanwhile
+            pass
+
+    def _onTokenized(self, generation: int, index: int, result):
+        if generation != self._generation:
+            return
+        self._tokenizingTimer.start()
+        self._chunks[index][3] = result
+        chunks = self._chunks
+        while (
+            self._mergedChunks < len(chunks)
+            and chunks[self._mergedChunks][3] is not None
+        ):
+            cursor, first, end, result, _ = chunks[self._mergedChunks]
+            if isinstance(result, BaseException):
+                warnings.warn(f"Can't tokenize the document in parallel: {result}")
+                self._cancelTokenizing()
+                return
+            parallel_highlighting.merge_chunk(
+                self._tokenTable, self.lexer(), first, end, result, LONG_LINE_LENGTH
+            )
+            self._mergedChunks += 1
+            if self._mergedChunks < len(chunks):
+                endPosition = chunks[self._mergedChunks][0].position() - 1
+            else:
+                endPosition = self._chunksLast.position()
+            super().rehighlightLater(cursor.position(), endPosition)
+        if self._mergedChunks == len(chunks):
+            self._tokenizingTimer.stop()
+            # the table is dropped once the deferred steps are over
+            self._chunks = []
+            self._mergedChunks = 0
+            self._chunksLast = None
+
+    def _cancelTokenizing(self, requeue: bool = True):
+        # drops the table, the blocks of the chunks not merged yet are highlighted
+        # by the deferred steps unless requeue is False
+        self._generation += 1
+        self._tokenizingTimer.stop()
+        chunks = self._chunks[self._mergedChunks :]
+        for chunk in chunks:
+            chunk[4].cancel()
+        if requeue and chunks:
+            end = self._chunksLast.position()
+            super().rehighlightLater(chunks[0][0].position(), end)
+        self._chunks = []
+        self._mergedChunks = 0
+        self._chunksLast = None
+        self._tokenTable = None
+
+    def _onTokenizingTimeout(self):
+        # e.g. workers starting another instance of an application whose main module
+        # is not guarded
+        warnings.warn(
+            "No lines tokenized in parallel for "
+            f"{parallel_highlighting.PARALLEL_CHUNK_TIMEOUT} s, the remaining lines "
+            "are highlighted in this process"
+        )
+        if self._sharedExecutor:
+            parallel_highlighting.reset_executor()
+        self._cancelTokenizing()
+
+    def hasPendingHighlight(self) -> bool:
+        return super().hasPendingHighlight() or len(self._chunks) > 0
+
+    def _highlightPending(self):
+        super()._highlightPending()
+        if self._tokenTable is not None and not self.hasPendingHighlight():
+            # all the lines of the table have been highlighted
+            self._tokenTable = None
+
+    def highlightText(self, text: str):
+        if self._tokenTable is not None:
+            number = self.currentBlock().blockNumber()
+            if self._chunks and (
+                self._chunks[self._mergedChunks][0].blockNumber()
+                <= number
+                <= self._chunksLast.blockNumber()
+            ):
+                # its chunk is still being tokenized: the block keeps its state,
+                # which stops a cascade, until the chunk is merged
+                return
+            result = self._tokenTable.lineTokens(
+                number, text, max(0, self.previousBlockState())
+            )
+            if result is not None:
+                self.addSpans(result[0])
+                self.setCurrentBlockState(result[1])
+                return
+        lexer = self.lexer()
+        tokens, state = lexer.tokens(text, self.previousBlockState())
+        if lexer.slowestSearch() > RULE_TIME_BUDGET:
+            # the rule slowing the combined pattern down is downgraded, the lexer
+            # matches it on its own from the next line on
+            index = self._slowRule(lexer, text)
+            if index >= 0:
+                self.overBudget(rule_pattern(lexer.rules()[index]))
+                self.invalidateLexer()
+        for index, spent in lexer.separateTimes().items():
+            # a pause of the process (GC, scheduling) may fall within one search,
+            # only a limited copy slow twice in a row disables its rule
+            limited = lexer.separate()[index]
+            if spent > RULE_TIME_BUDGET and self._slowScan(limited, text):
+                self.overBudget(rule_pattern(lexer.rules()[index]))
+                self.invalidateLexer()
+        self.addSpans(tokens)
+        self.setCurrentBlockState(state)
+
+    @staticmethod
+    def _slowRule(lexer: QLexer, text: str) -> int:
+        # index of the rule of the combined pattern slowest on text, -1 if none is
+        # slow on its own (e.g. the process was paused). Each rule is matched with
+        # a limited copy, without the start optimizations (e.g. a required
+        # character) PCRE cannot use for one alternative of the combined pattern.
+        slowest = -1
+        slowestKey = (False, RULE_TIME_BUDGET)
+        for index in lexer.scannedRules():
+            pattern = rule_pattern(lexer.rules()[index])
+            probe = QRegularExpression(
+                f"(*NO_START_OPT)(*LIMIT_MATCH={RULE_MATCH_LIMIT}){pattern.pattern()}",
+                pattern.patternOptions(),
+            )
+            start = time.perf_counter()
+            iterator = probe.globalMatch(text)
+            # a match over the limit is not valid
+            limited = not iterator.isValid()
+            while not limited and iterator.hasNext():
+                limited = not iterator.next().isValid()
+            key = (limited, time.perf_counter() - start)
+            if key > slowestKey:
+                slowest, slowestKey = index, key
+        return slowest
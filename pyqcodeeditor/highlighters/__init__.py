@@ -1,8 +1,17 @@
-from .QPythonHighlighter import QPythonHighlighter
-from .QJSONHighlighter import QJSONHighlighter
-from .QCXXHighlighter import QCXXHighlighter
-from .QLuaHighlighter import QLuaHighlighter
-from .QGLSLHighlighter import QGLSLHighlighter
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .. import utils
+
+if TYPE_CHECKING:
+    from .QPythonHighlighter import QPythonHighlighter
+    from .QJSONHighlighter import QJSONHighlighter
+    from .QCXXHighlighter import QCXXHighlighter
+    from .QLuaHighlighter import QLuaHighlighter
+    from .QGLSLHighlighter import QGLSLHighlighter
+    from .QLexer import QLexer
+    from .QLexerHighlighter import QLexerHighlighter
 
 __all__ = [
     "QPythonHighlighter",
@@ -10,4 +19,9 @@ __all__ = [
     "QCXXHighlighter",
     "QLuaHighlighter",
     "QGLSLHighlighter",
+    "QLexer",
+    "QLexerHighlighter",
 ]
+
+# the highlighter modules are imported on first use
+utils.install_lazy_attributes(__name__, {name: f".{name}" for name in __all__})
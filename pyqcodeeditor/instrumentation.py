@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+# Timing of named spans of the editor (highlighting, painting, file I/O...) sent to
+# sinks. Functions marked with @instrumented() are left untouched while disabled:
+# enable() replaces them with timing wrappers on their class or module and
+# disable() puts the original functions back, so there is no cost at all when off.
+
+# "1" enables instrumentation with a histogram (see default_histogram()), any other
+# value is the path of a JSON lines file the spans are written to
+INSTRUMENTATION_ENV: str = "PYQCODEEDITOR_INSTRUMENTATION"
+# Spans of a JSON lines sink buffered before writing
+JSON_LINES_BUFFER: int = 256
+
+
+# noinspection PyPep8Naming
+class Span(NamedTuple):
+    name: str
+    # time.perf_counter_ns() when the span started
+    start: int
+    duration: int
+    thread: int
+
+
+Sink = Callable[[Span], None]
+
+# name -> [(class or module, attribute, original function)]
+_hooks: Dict[str, List[Tuple[object, str, Callable]]] = {}
+# replaced as a whole, spans are emitted from worker threads too
+_sinks: Tuple[Sink, ...] = ()
+_enabled: bool = False
+_lock = threading.Lock()
+_defaultHistogram: HistogramSink | None = None
+
+
+def _emit(name: str, start: int, duration: int):
+    span = Span(name, start, duration, threading.get_ident())
+    for sink in _sinks:
+        sink(span)
+
+
+def _wrap(name: str, function: Callable) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _emit(name, start, time.perf_counter_ns() - start)
+
+    return wrapper
+
+
+class _HookPoint(object):
+    # Stands for a method until its class is created, then registers it and puts
+    # the function (or its wrapper) on the class
+    def __init__(self, name: str, function: Callable):
+        self.name = name
+        self.function = function
+
+    def __set_name__(self, owner, attribute: str):
+        _register(self.name, owner, attribute, self.function)
+
+
+def _register(name: str, owner, attribute: str, function: Callable):
+    with _lock:
+        _hooks.setdefault(name, []).append((owner, attribute, function))
+        setattr(owner, attribute, _wrap(name, function) if _enabled else function)
+
+
+def instrumented(name: str) -> Callable[[Callable], Callable]:
+    # marks a method or a module level function as the span name
+    def decorator(function: Callable):
+        if "." in function.__qualname__:
+            return _HookPoint(name, function)
+        _register(name, sys.modules[function.__module__], function.__name__, function)
+        return getattr(sys.modules[function.__module__], function.__name__)
+
+    return decorator
+
+
+def enable(*sinks: Sink):
+    # sinks are added to the current ones
+    global _enabled, _sinks
+    with _lock:
+        _sinks = _sinks + tuple(sink for sink in sinks if sink not in _sinks)
+        if _enabled:
+            return
+        _enabled = True
+        for name, hooks in _hooks.items():
+            for owner, attribute, function in hooks:
+                setattr(owner, attribute, _wrap(name, function))
+
+
+def disable():
+    # the sinks are kept until remove_sink()
+    global _enabled
+    with _lock:
+        if not _enabled:
+            return
+        _enabled = False
+        for hooks in _hooks.values():
+            for owner, attribute, function in hooks:
+                setattr(owner, attribute, function)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def add_sink(sink: Sink):
+    global _sinks
+    with _lock:
+        if sink not in _sinks:
+            _sinks = _sinks + (sink,)
+
+
+def remove_sink(sink: Sink):
+    global _sinks
+    with _lock:
+        _sinks = tuple(other for other in _sinks if other is not sink)
+
+
+def sinks() -> List[Sink]:
+    return list(_sinks)
+
+
+def span_names() -> List[str]:
+    return sorted(_hooks.keys())
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    # for code that is not a function of its own, costs a check when disabled
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _emit(name, start, time.perf_counter_ns() - start)
+
+
+# noinspection PyPep8Naming
+class SpanStats(NamedTuple):
+    count: int
+    # durations in ns
+    total: int
+    minimum: int
+    maximum: int
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class HistogramSink(object):
+    # Count, total, min and max of the durations of each span name, and a histogram
+    # of power of two buckets (in ns) for percentiles
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[int]] = {}
+        self._buckets: Dict[str, List[int]] = {}
+
+    def __call__(self, span_: Span):
+        duration = span_.duration
+        bucket = duration.bit_length()
+        with self._lock:
+            stats = self._stats.get(span_.name, None)
+            if stats is None:
+                self._stats[span_.name] = [1, duration, duration, duration]
+                self._buckets[span_.name] = [0] * 64
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = min(stats[2], duration)
+                stats[3] = max(stats[3], duration)
+            self._buckets[span_.name][min(bucket, 63)] += 1
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._stats.keys())
+
+    def stats(self, name: str) -> SpanStats:
+        with self._lock:
+            stats = self._stats.get(name, None)
+        return SpanStats(*stats) if stats is not None else SpanStats(0, 0, 0, 0)
+
+    def percentile(self, name: str, percent: float) -> int:
+        # upper bound (in ns) of the bucket holding the percentile
+        with self._lock:
+            buckets = list(self._buckets.get(name, ()))
+            maximum = self._stats[name][3] if name in self._stats else 0
+        count = sum(buckets)
+        if not count:
+            return 0
+        rank = max(1, math.ceil(count * percent / 100))
+        for bucket, bucketCount in enumerate(buckets):
+            rank -= bucketCount
+            if rank <= 0:
+                return min((1 << bucket) - 1, maximum)
+        return maximum
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._buckets.clear()
+
+    def report(self) -> str:
+        lines = []
+        for name in self.names():
+            stats = self.stats(name)
+            lines.append(
+                f"{name}: {stats.count} spans, mean {stats.mean() / 1e6:.3f} ms, "
+                f"p95 {self.percentile(name, 95) / 1e6:.3f} ms, "
+                f"max {stats.maximum / 1e6:.3f} ms"
+            )
+        return "\n".join(lines)
+
+
+class JsonLinesSink(object):
+    # One JSON object per span appended to a file, written by blocks
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._path = os.path.abspath(path)
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._buffer: List[str] = []
+
+    def __call__(self, span_: Span):
+        line = json.dumps(span_._asdict())
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= JSON_LINES_BUFFER:
+                self._write()
+
+    def path(self) -> str:
+        return self._path
+
+    def flush(self):
+        with self._lock:
+            self._write()
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._write()
+            self._file.close()
+
+    def _write(self):
+        if self._buffer and not self._file.closed:
+            self._file.write("\n".join(self._buffer) + "\n")
+        self._buffer.clear()
+
+
+def default_histogram() -> HistogramSink:
+    # the histogram used when enabled by the environment variable
+    global _defaultHistogram
+    if _defaultHistogram is None:
+        _defaultHistogram = HistogramSink()
+    return _defaultHistogram
+
+
+def _enable_from_environment():
+    value = os.environ.get(INSTRUMENTATION_ENV, "").strip()
+    if value in ("", "0"):
+        return
+    if value == "1":
+        enable(default_histogram())
+        return
+    sink = JsonLinesSink(value)
+    atexit.register(sink.close)
+    enable(sink)
+
+
+_enable_from_environment()
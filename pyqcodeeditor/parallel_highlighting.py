@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import warnings
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Executor, Future
+from itertools import accumulate
+from typing import Dict, List, Sequence, Tuple
+
+from .highlighters.QHighlightBlockRule import QHighlightBlockRule
+from .highlighters.QHighlightRule import QHighlightRule
+from .highlighters.QLexer import QLexer, Token
+from .regex_backend import BACKEND_AUTO
+
+# Tokenizing of the lines of a large document by a pool of processes, for its first
+# highlighting. The lines are cut into chunks at lines a pre-scan of the region
+# delimiters (e.g. /* and */) finds outside of any region, and a worker tokenizes
+# each chunk from state 0. The pre-scan does not know about strings or comments. If
+# a chunk does not actually start in state 0, its first lines are tokenized again in
+# this process until their states agree with the worker's. multiprocessing is only
+# imported with the first pool.
+#
+# The pool starts its processes with the spawn method, which imports the main module
+# of the application in each of them: the application must start (create its
+# QApplication, ...) under if __name__ == "__main__", and call
+# multiprocessing.freeze_support() first when frozen into an executable. Otherwise
+# each worker starts another instance of the application instead of tokenizing. For
+# this reason parallel highlighting is off unless enabled with
+# QLexerHighlighter.setParallelHighlighting().
+
+# documents with fewer lines are tokenized in this process
+PARALLEL_MIN_LINES = 50000
+CHUNK_MIN_LINES = 5000
+# chunks per process: the processes done first take the remaining ones
+CHUNKS_PER_PROCESS = 4
+# seconds without any chunk tokenized before a highlighter gives up on the pool and
+# highlights the remaining lines in its process
+PARALLEL_CHUNK_TIMEOUT = 30.0
+
+# lexers of a worker, by (definition, backend) in the dict of each thread: a lexer
+# calibrates its backend on its first lines, it can't be shared by the threads of a
+# thread pool
+_lexers = threading.local()
+# the pool shared by the highlighters, started on first use
+_pool: Executor | None = None
+
+
+def executor() -> Executor:
+    # the pool of os.cpu_count() processes of the highlighters
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # no fork of a process running Qt threads
+        _pool = ProcessPoolExecutor(
+            os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_worker,
+        )
+        # a pool left to the garbage collector at exit outlives the modules it uses
+        atexit.register(reset_executor)
+    return _pool
+
+
+def reset_executor():
+    # drops the pool, e.g. broken by a crashed worker
+    global _pool
+    if _pool is not None:
+        atexit.unregister(reset_executor)
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+# noinspection PyPep8Naming
+class TokenTable(object):
+    # The tokens and the state of each line, merged from the chunks in order. The
+    # tokens of a chunk are kept as arrays of integers, as sent by its worker. The
+    # lines are the blocks of a document from block number first on, after a block
+    # ending in state. The line numbers of the methods count from the first line,
+    # except for lineTokens() which takes a block number.
+    def __init__(self, lines: Sequence[str], first: int = 0, state: int = 0):
+        self.lines = lines
+        self.first = first
+        self.startState = state
+        self._firsts: List[int] = []
+        self._ends: List[int] = []
+        # (format names, end states, token offsets, start/length/name of the tokens)
+        self._chunks: List[Tuple[List[str], array, List[int], array]] = []
+        # line number -> (tokens, end state) of the lines tokenized again
+        self._fixed: Dict[int, Tuple[List[Token], int]] = {}
+
+    def addChunk(
+        self, first: int, names: List[str], states: array, counts: array, tokens: array
+    ):
+        # the chunk starting at line first, after the previous chunks
+        self._firsts.append(first)
+        self._ends.append(first + len(states))
+        offsets = list(accumulate(counts, initial=0))
+        self._chunks.append((names, states, offsets, tokens))
+
+    def state(self, number: int) -> int:
+        # end state of line number, the start state before the first line
+        if number < 0:
+            return self.startState
+        fixed = self._fixed.get(number, None)
+        if fixed is not None:
+            return fixed[1]
+        index = bisect_right(self._firsts, number) - 1
+        return self._chunks[index][1][number - self._firsts[index]]
+
+    def setLine(self, number: int, tokens: List[Token], state: int):
+        self._fixed[number] = (tokens, state)
+
+    def lineTokens(
+        self, number: int, text: str, state: int
+    ) -> Tuple[List[Token], int] | None:
+        # (tokens, end state) of block number, None unless its line has been merged,
+        # its text is text and it starts in state
+        number -= self.first
+        if not self._firsts or not 0 <= number < len(self.lines):
+            return None
+        index = bisect_right(self._firsts, number) - 1
+        if index < 0 or number >= self._ends[index] or self.lines[number] != text:
+            return None
+        if self.state(number - 1) != state:
+            return None
+        fixed = self._fixed.get(number, None)
+        if fixed is not None:
+            return fixed
+        names, states, offsets, tokens = self._chunks[index]
+        line = number - self._firsts[index]
+        start = 3 * offsets[line]
+        end = 3 * offsets[line + 1]
+        lineTokens = zip(
+            tokens[start:end:3],
+            tokens[start + 1 : end : 3],
+            map(names.__getitem__, tokens[start + 2 : end : 3]),
+        )
+        return list(lineTokens), states[line]
+
+
+def _initialize_worker():
+    # the patterns were already checked, with warnings, in the parent process
+    warnings.simplefilter("ignore")
+
+
+def tokenize_chunk(
+    definition: tuple, backend: str, lines: Sequence[str], long_line_length: int
+) -> Tuple[List[str], array, array, array]:
+    # (format names, end state of each line, tokens of each line, start/length/name
+    # index of each token) of lines from state 0. As in QStyleSyntaxHighlighter, a
+    # line longer than long_line_length passes the state on.
+    lexers: Dict[Tuple[tuple, str], QLexer] | None = getattr(_lexers, "lexers", None)
+    if lexers is None:
+        lexers = _lexers.lexers = {}
+    lexer = lexers.get((definition, backend), None)
+    if lexer is None:
+        lexer = lexers[(definition, backend)] = QLexer.fromDefinition(
+            definition, backend
+        )
+    names: Dict[str, int] = {}
+    states = array("i")
+    counts = array("i")
+    flat = array("i")
+    state = 0
+    for line in lines:
+        tokens, lineState = lexer.tokens(line, state)
+        if len(line) <= long_line_length:
+            state = lineState
+        for start, length, name in tokens:
+            flat.extend((start, length, names.setdefault(name, len(names))))
+        counts.append(len(tokens))
+        states.append(state)
+    return list(names), states, counts, flat
+
+
+def prescan_regions(
+    rules: Sequence[QHighlightRule | QHighlightBlockRule], text: str
+) -> List[Tuple[int, int]]:
+    # [start, end) of the regions of the block rules in text, ignoring everything
+    # else, the last one ends after text if it is not closed. Qt counts UTF-16
+    # units, the offsets drift after the characters outside of the BMP.
+    events = []
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, QHighlightBlockRule):
+            continue
+        for pattern, opening in ((rule.startPattern, True), (rule.endPattern, False)):
+            iterator = pattern.globalMatch(text)
+            while iterator.hasNext():
+                match = iterator.next()
+                events.append(
+                    (match.capturedStart(), match.capturedEnd(), opening, index)
+                )
+    events.sort()
+    regions = []
+    openRule = -1
+    regionStart = 0
+    # a delimiter does not overlap the one before it, e.g. the start of """
+    skip = 0
+    for start, end, opening, index in events:
+        if start < skip:
+            continue
+        if openRule < 0 and opening:
+            openRule, regionStart, skip = index, start, end
+        elif openRule == index and not opening:
+            regions.append((regionStart, end))
+            openRule, skip = -1, end
+    if openRule >= 0:
+        regions.append((regionStart, len(text) + 1))
+    return regions
+
+
+def chunk_boundaries(
+    rules: Sequence[QHighlightRule | QHighlightBlockRule],
+    lines: Sequence[str],
+    chunk_lines: int,
+) -> List[int]:
+    # first line of each chunk then len(lines), a chunk starts about chunk_lines
+    # after the previous one, at a line outside of the regions of the pre-scan
+    offsets = list(accumulate((len(line) + 1 for line in lines), initial=0))
+    regions = prescan_regions(rules, "\n".join(lines))
+    regionStarts = [start for start, _ in regions]
+    boundaries = [0]
+    number = chunk_lines
+    while number < len(lines):
+        offset = offsets[number]
+        index = bisect_left(regionStarts, offset) - 1
+        if index >= 0 and regions[index][1] > offset:
+            # the line after the end of the region, unless the region is as long
+            # as a chunk: more likely a delimiter in a string (or one left open),
+            # it would keep all the lines after it in a chunk
+            regionEnd = bisect_right(offsets, regions[index][1])
+            if regionEnd - number < chunk_lines:
+                number = regionEnd
+                continue
+        boundaries.append(number)
+        number += chunk_lines
+    boundaries.append(len(lines))
+    return boundaries
+
+
+def submit_chunks(
+    lexer: QLexer,
+    lines: Sequence[str],
+    long_line_length: int,
+    backend: str,
+    executor: Executor,
+    processes: int,
+) -> List[Tuple[int, int, Future]]:
+    # (first line, end line, future of tokenize_chunk()) of each chunk of lines,
+    # sized for processes
+    chunkLines = max(CHUNK_MIN_LINES, len(lines) // (processes * CHUNKS_PER_PROCESS))
+    boundaries = chunk_boundaries(lexer.rules(), lines, chunkLines)
+    definition = lexer.definition()
+    chunks = []
+    try:
+        for first, end in zip(boundaries, boundaries[1:]):
+            future = executor.submit(
+                tokenize_chunk, definition, backend, lines[first:end], long_line_length
+            )
+            chunks.append((first, end, future))
+    except BaseException:
+        for _, _, future in chunks:
+            future.cancel()
+        raise
+    return chunks
+
+
+def merge_chunk(
+    table: TokenTable,
+    lexer: QLexer,
+    first: int,
+    end: int,
+    result: Tuple[List[str], array, array, array],
+    long_line_length: int,
+):
+    # adds the result of tokenize_chunk() for lines first to end to table, after
+    # the previous chunks
+    table.addChunk(first, *result)
+    _fixChunk(table, lexer, first, end, long_line_length)
+
+
+def tokenize_lines(
+    lexer: QLexer,
+    lines: Sequence[str],
+    long_line_length: int,
+    backend: str = BACKEND_AUTO,
+    processes: int | None = None,
+    executor: Executor | None = None,
+) -> TokenTable:
+    # the tokens of lines from state 0, by executor or by a pool of processes
+    # (os.cpu_count() by default) made for the call, waiting for all of them
+    processes = processes or os.cpu_count() or 1
+    table = TokenTable(lines)
+    if len(lines) < PARALLEL_MIN_LINES or (processes < 2 and executor is None):
+        definition = lexer.definition()
+        table.addChunk(0, *tokenize_chunk(definition, backend, lines, long_line_length))
+        return table
+    ownExecutor = executor is None
+    if ownExecutor:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_worker,
+        )
+    chunks = []
+    try:
+        chunks = submit_chunks(
+            lexer, lines, long_line_length, backend, executor, processes
+        )
+        for first, end, future in chunks:
+            merge_chunk(table, lexer, first, end, future.result(), long_line_length)
+    finally:
+        for _, _, future in chunks:
+            future.cancel()
+        if ownExecutor:
+            executor.shutdown()
+    return table
+
+
+def _fixChunk(
+    table: TokenTable, lexer: QLexer, first: int, end: int, long_line_length: int
+):
+    # tokenizes the lines of the chunk from the actual end state of the previous
+    # one, until a line ends in the state the worker found
+    state = table.state(first - 1)
+    if state == 0:
+        return
+    lines = table.lines
+    for number in range(first, end):
+        workerState = table.state(number)
+        tokens, lineState = lexer.tokens(lines[number], state)
+        if len(lines[number]) <= long_line_length:
+            state = lineState
+        table.setLine(number, tokens, state)
+        if state == workerState:
+            return
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import re
+import warnings
+from typing import Iterator, Tuple
+
+from qtpy.QtCore import QRegularExpression
+
+# Backends matching a QRegularExpression and yielding only the integer spans of its
+# matches, (start, end, last captured group), instead of a match object per hit:
+# through Qt, or through Python's re for the patterns it can read the same way. The
+# QLexer picks the faster of the two for its scanner.
+
+BACKEND_QT = "qt"
+BACKEND_PYTHON = "python"
+# the faster of the two, measured on the first lines
+BACKEND_AUTO = "auto"
+
+# (start, end, last captured group)
+Span = Tuple[int, int, int]
+
+_FLAGS = (
+    (QRegularExpression.PatternOption.CaseInsensitiveOption, re.IGNORECASE),
+    (QRegularExpression.PatternOption.DotMatchesEverythingOption, re.DOTALL),
+    (QRegularExpression.PatternOption.MultilineOption, re.MULTILINE),
+    (QRegularExpression.PatternOption.ExtendedPatternSyntaxOption, re.VERBOSE),
+)
+# options re has no equivalent for
+_UNSUPPORTED_OPTIONS = (
+    QRegularExpression.PatternOption.InvertedGreedinessOption,
+    QRegularExpression.PatternOption.DontCaptureOption,
+)
+# syntax both read, with another meaning: \Z, \v and \N are end of subject, vertical
+# whitespace and non newline for PCRE, {,n} is a literal for PCRE before 10.43
+_DIVERGENT_REGEX = re.compile(r"\\[ZvN]|\{,|\\.")
+
+
+# noinspection PyPep8Naming
+class RegexBackend(object):
+    name = ""
+
+    def __init__(self, pattern: QRegularExpression):
+        self.pattern = pattern
+
+    def spans(self, text: str, position: int = 0) -> Iterator[Span]:
+        # the matches of the pattern in text from position on
+        raise NotImplementedError
+
+    def groupSpan(self, group: int) -> Tuple[int, int]:
+        # (start, end) of group in the last match spans() yielded, (-1, -1) if it
+        # did not take part in it
+        raise NotImplementedError
+
+    def searchEnd(self, text: str, position: int = 0) -> int:
+        # end of the first match from position on, -1 if there is none
+        for _, end, _ in self.spans(text, position):
+            return end
+        return -1
+
+
+# noinspection PyPep8Naming
+class QtRegexBackend(RegexBackend):
+    name = BACKEND_QT
+
+    def __init__(self, pattern: QRegularExpression):
+        super().__init__(pattern)
+        self._match = None
+
+    def spans(self, text: str, position: int = 0) -> Iterator[Span]:
+        iterator = self.pattern.globalMatch(text, position)
+        while iterator.hasNext():
+            match = self._match = iterator.next()
+            yield match.capturedStart(), match.capturedEnd(), match.lastCapturedIndex()
+
+    def groupSpan(self, group: int) -> Tuple[int, int]:
+        return self._match.capturedStart(group), self._match.capturedEnd(group)
+
+    def searchEnd(self, text: str, position: int = 0) -> int:
+        match = self.pattern.match(text, position)
+        return match.capturedEnd() if match.hasMatch() else -1
+
+
+# noinspection PyPep8Naming
+class PythonRegexBackend(RegexBackend):
+    # Matches ASCII lines with re: the classes (\w, \d, \s), the case folding and
+    # the offsets (UTF-16 units for Qt) of PCRE and re differ on the other ones,
+    # they are matched through Qt.
+    name = BACKEND_PYTHON
+
+    def __init__(self, pattern: QRegularExpression, regex: re.Pattern):
+        super().__init__(pattern)
+        self.regex = regex
+        self._match = None
+        self._fallback = QtRegexBackend(pattern)
+
+    def spans(self, text: str, position: int = 0) -> Iterator[Span]:
+        if not text.isascii():
+            self._match = None
+            return self._fallback.spans(text, position)
+        return self._spans(text, position)
+
+    def _spans(self, text: str, position: int) -> Iterator[Span]:
+        for match in self.regex.finditer(text, position):
+            self._match = match
+            yield match.start(), match.end(), match.lastindex or 0
+
+    def groupSpan(self, group: int) -> Tuple[int, int]:
+        if self._match is None:
+            return self._fallback.groupSpan(group)
+        return self._match.span(group)
+
+    def searchEnd(self, text: str, position: int = 0) -> int:
+        if not text.isascii():
+            return self._fallback.searchEnd(text, position)
+        match = self.regex.search(text, position)
+        return match.end() if match is not None else -1
+
+
+def python_regex(pattern: QRegularExpression) -> re.Pattern | None:
+    # pattern compiled with re, None where re would not read it as PCRE does
+    if not pattern.isValid():
+        return None
+    options = pattern.patternOptions()
+    if any(options & option for option in _UNSUPPORTED_OPTIONS):
+        return None
+    text = pattern.pattern()
+    for token in _DIVERGENT_REGEX.findall(text):
+        if token == "{," or token[1] in "ZvN":
+            return None
+    flags = 0
+    for option, flag in _FLAGS:
+        if options & option:
+            flags |= flag
+    try:
+        with warnings.catch_warnings():
+            # e.g. a possible nested set for a POSIX class [[:alpha:]]
+            warnings.simplefilter("error")
+            return re.compile(text, flags)
+    except (re.error, FutureWarning, DeprecationWarning, OverflowError):
+        return None
+
+
+def compile_pattern(
+    pattern: QRegularExpression, backend: str = BACKEND_QT
+) -> RegexBackend:
+    # a backend matching pattern, through Qt if backend is not BACKEND_PYTHON or if
+    # re cannot read pattern
+    if backend == BACKEND_PYTHON:
+        regex = python_regex(pattern)
+        if regex is not None:
+            return PythonRegexBackend(pattern, regex)
+    return QtRegexBackend(pattern)
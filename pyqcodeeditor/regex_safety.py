@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import re
+import warnings
+from functools import lru_cache
+from typing import FrozenSet, Iterator, List, NamedTuple, Tuple
+
+try:
+    # Python 3.11+
+    from re import _constants as _sre_constants, _parser as _sre_parse
+except ImportError:
+    import sre_constants as _sre_constants
+    import sre_parse as _sre_parse
+
+# Static analysis of the highlighting patterns for the shapes that make a
+# backtracking engine (PCRE2 for QRegularExpression) take exponential or polynomial
+# time on some lines. The pattern is parsed with Python's regular expression parser:
+# PCRE only syntax it does not know gives no verdict rather than an error.
+
+KIND_NESTED_QUANTIFIER = "nested_quantifier"
+KIND_OVERLAPPING_ALTERNATION = "overlapping_alternation"
+KIND_ADJACENT_QUANTIFIERS = "adjacent_quantifiers"
+
+
+# noinspection PyPep8Naming
+class RegexIssue(NamedTuple):
+    kind: str
+    # exponential in the length of the line, polynomial otherwise
+    catastrophic: bool
+    message: str
+
+
+_MAXREPEAT = _sre_constants.MAXREPEAT
+_REPEATS = (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT)
+# no backtracking into them, Python 3.11+ only
+_POSSESSIVE_REPEAT = getattr(_sre_constants, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(_sre_constants, "ATOMIC_GROUP", None)
+
+# PCRE start of pattern options, e.g. (*LIMIT_MATCH=1000)
+_VERBS_REGEX = re.compile(r"^(?:\(\*[A-Z_]+(?:=\d+)?\))+")
+# (?i) anywhere, Python only accepts global flags at the start
+_INLINE_FLAGS_REGEX = re.compile(r"(?<!\\)\(\?([a-zA-Z]+)\)")
+
+# The character sets are computed over these characters and the literals of the
+# pattern
+_SAMPLE_CHARACTERS = "".join(chr(c) for c in range(32, 127)) + "\t\n\r éßЖ中٣"
+_CATEGORY_REGEXES = {
+    _sre_constants.CATEGORY_DIGIT: re.compile(r"\d"),
+    _sre_constants.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+    _sre_constants.CATEGORY_SPACE: re.compile(r"\s"),
+    _sre_constants.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+    _sre_constants.CATEGORY_WORD: re.compile(r"\w"),
+    _sre_constants.CATEGORY_NOT_WORD: re.compile(r"\W"),
+}
+
+
+class _Analysis(object):
+    def __init__(self, universe: FrozenSet[str], ignoreCase: bool):
+        self.universe = universe
+        self.ignoreCase = ignoreCase
+        self.issues: List[RegexIssue] = []
+
+    # Character sets and emptiness of items (op, argument) and sequences of items
+
+    def literal(self, code: int) -> FrozenSet[str]:
+        c = chr(code)
+        if self.ignoreCase:
+            return frozenset((c, c.lower(), c.upper()))
+        return frozenset((c,))
+
+    def inSet(self, items) -> FrozenSet[str]:
+        negate = False
+        chars = set()
+        for op, av in items:
+            if op is _sre_constants.NEGATE:
+                negate = True
+            elif op is _sre_constants.LITERAL:
+                chars |= self.literal(av)
+            elif op is _sre_constants.RANGE:
+                low, high = av
+                chars |= {c for c in self.universe if low <= ord(c) <= high}
+                if self.ignoreCase:
+                    chars |= {c.swapcase() for c in chars}
+            elif op is _sre_constants.CATEGORY:
+                regex = _CATEGORY_REGEXES.get(av, None)
+                chars |= (
+                    {c for c in self.universe if regex.match(c)}
+                    if regex is not None
+                    else self.universe
+                )
+        if negate:
+            return self.universe - chars
+        return frozenset(chars)
+
+    def itemChars(self, op, av) -> FrozenSet[str]:
+        # every character the item may consume
+        if op is _sre_constants.LITERAL:
+            return self.literal(av)
+        if op is _sre_constants.NOT_LITERAL:
+            return self.universe - self.literal(av)
+        if op is _sre_constants.ANY:
+            return self.universe - {"\n"}
+        if op is _sre_constants.IN:
+            return self.inSet(av)
+        if op is _sre_constants.BRANCH:
+            return frozenset().union(*(self.chars(p) for p in av[1]))
+        if op is _sre_constants.SUBPATTERN:
+            return self.chars(av[-1])
+        if op is _ATOMIC_GROUP:
+            return self.chars(av)
+        if op in _REPEATS or op is _POSSESSIVE_REPEAT:
+            return self.chars(av[2])
+        if op is _sre_constants.GROUPREF_EXISTS:
+            return self.chars(av[1]) | (self.chars(av[2]) if av[2] else frozenset())
+        if op is _sre_constants.GROUPREF:
+            return self.universe
+        # anchors and assertions
+        return frozenset()
+
+    def chars(self, items) -> FrozenSet[str]:
+        return frozenset().union(*(self.itemChars(op, av) for op, av in items))
+
+    def itemNullable(self, op, av) -> bool:
+        if op in (
+            _sre_constants.LITERAL,
+            _sre_constants.NOT_LITERAL,
+            _sre_constants.ANY,
+            _sre_constants.IN,
+        ):
+            return False
+        if op is _sre_constants.BRANCH:
+            return any(self.nullable(p) for p in av[1])
+        if op is _sre_constants.SUBPATTERN:
+            return self.nullable(av[-1])
+        if op is _ATOMIC_GROUP:
+            return self.nullable(av)
+        if op in _REPEATS or op is _POSSESSIVE_REPEAT:
+            return av[0] == 0 or self.nullable(av[2])
+        return True
+
+    def nullable(self, items) -> bool:
+        return all(self.itemNullable(op, av) for op, av in items)
+
+    def itemFirst(self, op, av) -> FrozenSet[str]:
+        # characters a match of the item may start with
+        if op is _sre_constants.BRANCH:
+            return frozenset().union(*(self.first(p) for p in av[1]))
+        if op is _sre_constants.SUBPATTERN:
+            return self.first(av[-1])
+        if op is _ATOMIC_GROUP:
+            return self.first(av)
+        if op in _REPEATS or op is _POSSESSIVE_REPEAT:
+            return self.first(av[2])
+        return self.itemChars(op, av)
+
+    def first(self, items) -> FrozenSet[str]:
+        chars = frozenset()
+        for op, av in items:
+            chars |= self.itemFirst(op, av)
+            if not self.itemNullable(op, av):
+                break
+        return chars
+
+    # Checks
+
+    def innerRepeats(self, items, restNullable: bool) -> Iterator[Tuple[object, bool]]:
+        # the backtracking repeats of items and whether what follows them up to the
+        # end of the enclosing repeat may match nothing
+        for index, (op, av) in enumerate(items):
+            rest = restNullable and self.nullable(items[index + 1 :])
+            if op in _REPEATS:
+                if av[1] == _MAXREPEAT:
+                    yield av, rest
+                yield from self.innerRepeats(av[2], rest)
+            elif op is _sre_constants.SUBPATTERN:
+                yield from self.innerRepeats(av[-1], rest)
+            elif op is _sre_constants.BRANCH:
+                for p in av[1]:
+                    yield from self.innerRepeats(p, rest)
+
+    def checkRepeat(self, body):
+        nested = False
+        bodyFirst = self.first(body)
+        for inner, restNullable in self.innerRepeats(body, True):
+            nested = True
+            if restNullable and self.chars(inner[2]) & bodyFirst:
+                self.issues.append(
+                    RegexIssue(
+                        KIND_NESTED_QUANTIFIER,
+                        True,
+                        "a repeated group ends with a repetition that can also "
+                        "start the next iteration, e.g. (a+)+",
+                    )
+                )
+                return
+        for alternatives in self.alternatives(body):
+            # the characters of a single class alternative, the first ones of the
+            # others: (a|aa)+ splits a run of a in exponentially many ways
+            classes = [self.singleClass(p) for p in alternatives]
+            classes = [
+                self.first(p) if chars is None else chars
+                for p, chars in zip(alternatives, classes)
+            ]
+            for index, chars in enumerate(classes):
+                if any(chars & other for other in classes[index + 1 :]):
+                    self.issues.append(
+                        RegexIssue(
+                            KIND_OVERLAPPING_ALTERNATION,
+                            True,
+                            "the alternatives of a repeated group can match the same "
+                            "characters, e.g. (\\w|\\d)+ or (a|aa)+",
+                        )
+                    )
+                    return
+        if nested:
+            self.issues.append(
+                RegexIssue(
+                    KIND_NESTED_QUANTIFIER,
+                    False,
+                    "a repetition inside a repeated group, the line is scanned again "
+                    "from many positions when the rest of the pattern fails",
+                )
+            )
+
+    def alternatives(self, items) -> Iterator[list]:
+        # the alternations of items, looking into the groups
+        for op, av in items:
+            if op is _sre_constants.BRANCH:
+                yield av[1]
+            elif op is _sre_constants.SUBPATTERN:
+                yield from self.alternatives(av[-1])
+
+    def singleClass(self, items) -> FrozenSet[str] | None:
+        # the characters of an alternative made of a single character class, repeated
+        # or not, None for the other alternatives
+        items = [
+            (op, av)
+            for op, av in items
+            if op
+            not in (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT)
+        ]
+        if len(items) != 1:
+            return None
+        op, av = items[0]
+        if op in _REPEATS:
+            return self.singleClass(av[2])
+        if op in (
+            _sre_constants.LITERAL,
+            _sre_constants.NOT_LITERAL,
+            _sre_constants.ANY,
+            _sre_constants.IN,
+        ):
+            return self.itemChars(op, av)
+        return None
+
+    def checkSequence(self, items):
+        previous = None
+        for op, av in items:
+            if op in _REPEATS and av[1] == _MAXREPEAT:
+                if previous is not None and self.chars(previous) & self.first(av[2]):
+                    self.issues.append(
+                        RegexIssue(
+                            KIND_ADJACENT_QUANTIFIERS,
+                            False,
+                            "two consecutive repetitions can match the same "
+                            "characters, e.g. \\s*\\s*",
+                        )
+                    )
+                previous = av[2]
+            elif not self.itemNullable(op, av):
+                previous = None
+
+    def walk(self, items):
+        self.checkSequence(items)
+        for op, av in items:
+            if op in _REPEATS:
+                if av[1] == _MAXREPEAT or av[1] > 1:
+                    self.checkRepeat(av[2])
+                self.walk(av[2])
+            elif op is _POSSESSIVE_REPEAT:
+                self.walk(av[2])
+            elif op is _sre_constants.SUBPATTERN:
+                self.walk(av[-1])
+            elif op is _ATOMIC_GROUP:
+                self.walk(av)
+            elif op is _sre_constants.BRANCH:
+                for p in av[1]:
+                    self.walk(p)
+            elif op in (_sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+                self.walk(av[1])
+
+
+def _separateAlternatives(pattern: str) -> str:
+    # Python's parser turns a|b into [ab] and ab|ac into a(?:b|c), which PCRE does
+    # not: a distinct lookahead at the start of every alternative but the first
+    # keeps them apart
+    parts = []
+    escaped = False
+    # the characters of the class being read, None outside a class
+    classChars: str | None = None
+    count = 0
+    for c in pattern:
+        parts.append(c)
+        if escaped:
+            escaped = False
+            if classChars is not None:
+                classChars += c
+        elif c == "\\":
+            escaped = True
+        elif classChars is not None:
+            # ] first in the class is a character of it
+            if c == "]" and classChars not in ("", "^"):
+                classChars = None
+            else:
+                classChars += c
+        elif c == "[":
+            classChars = ""
+        elif c == "|":
+            parts.append(f"(?!{chr(0xE000 + count % 0x1000)})")
+            count += 1
+    return "".join(parts)
+
+
+@lru_cache(maxsize=1024)
+def _analyze(pattern: str) -> Tuple[RegexIssue, ...]:
+    # nothing repeats more than once without one of these, e.g. keywords
+    if not any(c in pattern for c in "*+{"):
+        return ()
+    pattern = _VERBS_REGEX.sub("", pattern)
+    ignoreCase = False
+    for match in _INLINE_FLAGS_REGEX.finditer(pattern):
+        ignoreCase = ignoreCase or "i" in match.group(1)
+    pattern = _separateAlternatives(_INLINE_FLAGS_REGEX.sub("", pattern))
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except (re.error, OverflowError, RecursionError):
+        return ()
+    universe = set(_SAMPLE_CHARACTERS)
+    universe.update(c for c in pattern if c.isprintable())
+    analysis = _Analysis(frozenset(universe), ignoreCase)
+    analysis.walk(list(parsed))
+    # one issue of each kind, the catastrophic one first
+    issues = {}
+    for issue in sorted(analysis.issues, key=lambda i: not i.catastrophic):
+        issues.setdefault(issue.kind, issue)
+    return tuple(issues.values())
+
+
+def analyze_pattern(pattern: str) -> List[RegexIssue]:
+    return list(_analyze(pattern))
+
+
+def is_catastrophic(pattern: str) -> bool:
+    return any(issue.catastrophic for issue in _analyze(pattern))
+
+
+def check_pattern(pattern: str) -> bool:
+    # warns about the catastrophic shapes of pattern, returns False if there is one
+    catastrophic = [issue for issue in _analyze(pattern) if issue.catastrophic]
+    for issue in catastrophic:
+        warnings.warn(
+            f"Highlighting pattern {pattern!r} may backtrack: {issue.message}"
+        )
+    return not catastrophic
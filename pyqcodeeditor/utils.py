@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import importlib
 import os.path
+import sys
+import types
 import warnings
-from contextlib import AbstractContextManager
+from contextlib import AbstractContextManager, contextmanager
+from functools import lru_cache
 from importlib import resources
 from pathlib import Path
-from typing import TextIO
+from typing import Any, Dict, Iterator, List, TextIO
 
 from qtpy.QtCore import QRegularExpression
 from qtpy.QtGui import QKeyEvent
@@ -30,9 +34,27 @@ def get_resource_directory(
         return str(path)
 
 
-def get_resource_file(path: str) -> str | None:
+@lru_cache(maxsize=None)
+def _resource_directory() -> str | None:
+    # resolved once, on the first resource access rather than at import time. None
+    # when the package is not on disk (e.g. zipped), its files are then reached
+    # within an importlib.resources context on each access.
+    directory = os.path.join(BASE_PATH, __RES_PATH)
+    return directory if os.path.isdir(directory) else None
+
+
+@contextmanager
+def _resource_path(path: str) -> Iterator[str]:
+    directory = _resource_directory()
+    if directory is not None:
+        yield os.path.join(directory, path)
+        return
     with get_resource_directory(False) as res_dir:
-        file = os.path.join(res_dir, path)
+        yield os.path.join(res_dir, path)
+
+
+def get_resource_file(path: str) -> str | None:
+    with _resource_path(path) as file:
         if not os.path.isfile(file):
             return None
         return os.path.normpath(file)
@@ -41,16 +63,14 @@ def get_resource_file(path: str) -> str | None:
 def open_resource_text_file(
     path: str, encoding: str = "utf-8", errors: str = "strict"
 ) -> TextIO | None:
-    with get_resource_directory(False) as res_dir:
-        file = os.path.join(res_dir, path)
+    with _resource_path(path) as file:
         if not os.path.isfile(file):
             return None
         return open(file, "r", encoding=encoding, errors=errors)
 
 
 def open_resource_binary_file(path: str):
-    with get_resource_directory(False) as res_dir:
-        file = os.path.join(res_dir, path)
+    with _resource_path(path) as file:
         if not os.path.isfile(file):
             return None
         return open(file, "rb")
@@ -59,8 +79,7 @@ def open_resource_binary_file(path: str):
 def read_resource_text_file(
     path: str, encoding: str = "utf-8", errors: str = "strict"
 ) -> str | None:
-    with get_resource_directory(False) as res_dir:
-        file = os.path.join(res_dir, path)
+    with _resource_path(path) as file:
         if not os.path.isfile(file):
             return None
         with open(file, "r", encoding=encoding, errors=errors) as f:
@@ -68,8 +87,7 @@ def read_resource_text_file(
 
 
 def read_resource_binary_file(path: str) -> bytes | None:
-    with get_resource_directory(False) as res_dir:
-        file = os.path.join(res_dir, path)
+    with _resource_path(path) as file:
         if not os.path.isfile(file):
             return None
         with open(file, "rb") as f:
@@ -108,7 +126,9 @@ def is_shortcut(event: QKeyEvent, modifies, keys) -> bool:
     return has_modifier(event, *modifies) and key_pressed(event, *keys)
 
 
+@lru_cache(maxsize=None)
 def load_builtin_language(filename: str) -> QLanguage | None:
+    # parsed once and shared by the highlighters and completers, which only read it
     lang_file = get_language_file(filename)
     if not lang_file or not os.path.isfile(lang_file):
         warnings.warn(f"Language file not found: {lang_file}")
@@ -118,3 +138,44 @@ def load_builtin_language(filename: str) -> QLanguage | None:
         return lang
     warnings.warn(f"Language file not loaded: {lang_file}")
     return None
+
+
+def normalize_newlines(text: str) -> str:
+    # str.replace() runs in C, so chained calls are much faster than a
+    # per-character translate() on large texts
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class _LazyModule(types.ModuleType):
+    def __setattr__(self, name: str, value: Any):
+        # importing a submodule binds it to its package, it must not hide the lazy
+        # attribute of the same name (e.g. the QJSONHighlighter class)
+        if isinstance(value, types.ModuleType) and name in self.__dict__.get(
+            "__lazy_attributes__", {}
+        ):
+            return
+        super().__setattr__(name, value)
+
+
+def install_lazy_attributes(module_name: str, attributes: Dict[str, str]):
+    # PEP 562: the attributes (name -> relative module defining it) of a package are
+    # imported on first access, a program only pays for the classes it uses
+    module = sys.modules[module_name]
+
+    def __getattr__(name: str) -> Any:
+        submodule = attributes.get(name, None)
+        if submodule is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(submodule, module_name), name)
+        module.__dict__[name] = value
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(module.__dict__) | set(attributes))
+
+    module.__dict__["__lazy_attributes__"] = attributes
+    module.__dict__["__getattr__"] = __getattr__
+    module.__dict__["__dir__"] = __dir__
+    module.__class__ = _LazyModule
@@ -0,0 +1,66 @@
+import os
+import unittest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qtpy.QtCore import QCoreApplication  # noqa: E402
+from qtpy.QtGui import QTextCursor  # noqa: E402
+from qtpy.QtWidgets import QApplication  # noqa: E402
+
+from pyqcodeeditor.QCodeEditor import QCodeEditor  # noqa: E402
+from pyqcodeeditor.QJSONIndex import QJSONIndex  # noqa: E402
+
+app = QApplication.instance() or QApplication([])
+
+
+def _jsonText(items: int) -> str:
+    # 7 lines per item, nested objects and arrays
+    lines = ["{", '  "items": [']
+    for i in range(items):
+        lines += [
+            "    {",
+            f'      "id": {i},',
+            '      "tags": [',
+            '        "a", "b"',
+            "      ]",
+            "    }" + ("," if i < items - 1 else ""),
+        ]
+    lines += ["  ]", "}"]
+    return "\n".join(lines)
+
+
+def _waitForIndex(index: QJSONIndex):
+    while index.isPending() or index._future is not None:
+        if index._future is not None:
+            index._future.result()
+        QCoreApplication.processEvents()
+
+
+class QJSONIndexTest(unittest.TestCase):
+    def _assertSameAsFresh(self, editor: QCodeEditor, index: QJSONIndex):
+        fresh = QJSONIndex(QCodeEditor())
+        fresh.editor().setPlainText(editor.toPlainText())
+        _waitForIndex(fresh)
+        self.assertEqual(index.lineCount(), fresh.lineCount())
+        for line in range(fresh.lineCount()):
+            self.assertEqual(index.lineDepth(line), fresh.lineDepth(line), line)
+            self.assertEqual(index.foldRegionEnd(line), fresh.foldRegionEnd(line), line)
+
+    def test_small_edit_while_scanning(self):
+        # a small edit is spliced right away while the worker is scanning the lines
+        # in their numbers before the edit
+        editor = QCodeEditor()
+        editor.setPlainText(_jsonText(3500))
+        index = QJSONIndex(editor)
+        index._timer.stop()
+        index._scanDirtyLines()
+        index._future.result()
+        cursor = QTextCursor(editor.document())
+        cursor.setPosition(editor.document().findBlockByNumber(10).position())
+        cursor.insertText("\n")
+        _waitForIndex(index)
+        self._assertSameAsFresh(editor, index)
+
+
+if __name__ == "__main__":
+    unittest.main()